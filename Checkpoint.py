@@ -0,0 +1,161 @@
+"""Binary population checkpoints.
+
+A checkpoint holds everything `EvolutionaryAlgorithm.run` needs to continue exactly where
+it stopped: the ranked population as preorder production-rule ids (see `LinearTree`), each
+individual's fitness and fidelity, the `random` module state, the generation number, the
+evaluation count, the state of an evaluator that has one (`checkpoint_state()`, e.g.
+the elite and fold bests of a `WalkForwardEvaluator`) and that of a `SurrogateModel`. Genotypes are only meaningful for the grammar they were built with,
+so the file records `Grammar.fingerprint()` and refuses to load against any other.
+
+Layout (little-endian):
+
+    b"GGGPCKPT" | u32 header size | JSON header, space-padded to 8 bytes
+    | int32[n] rule counts | float64[n] fitness | float64[n] fidelity | int32[sum] rule ids
+
+A NaN fidelity marks an individual that had not been evaluated. Trees record their
+encoding (`DerivationTree.rule_code`) when they are generated and offspring inherit it by
+splicing, so writing a checkpoint is mostly a single buffer join. Reading one computes
+the subtree sizes of all individuals in one vectorized pass and returns lazy trees
+(`DerivationTree.from_code`): phenotypes are rendered from the rule ids, and nodes are
+only built for the individuals that are bred from.
+"""
+import json
+import os
+import random
+import struct
+import sys
+from array import array
+import numpy as np
+from EvolutionaryAlgorithm import Individual
+from Grammar import DerivationTree, _arities
+
+MAGIC = b"GGGPCKPT"
+FORMAT_VERSION = 1
+
+
+def save_checkpoint(path, ea):
+    """Writes the state of `ea` (taken between `rank` and `breed`) to `path` atomically."""
+    population = ea.population
+    codes = [ind.genotype.rule_code()[0] for ind in population]
+    header = {
+        "format": FORMAT_VERSION,
+        "grammar": ea.grammar.fingerprint(),
+        "generation": ea.generation,
+        "population": len(population),
+        "evaluations": ea.evaluations,
+        "rng": _rng_to_json(random.getstate()),
+    }
+    evaluator_state = getattr(ea.evaluator, "checkpoint_state", None)
+    if evaluator_state is not None:
+        header["evaluator"] = evaluator_state()
+    if ea.surrogate is not None:
+        header["surrogate"] = ea.surrogate.checkpoint_state()
+    head = json.dumps(header).encode()
+    head += b" " * (-(len(MAGIC) + 4 + len(head)) % 8)
+
+    lengths = np.fromiter((len(c) for c in codes), dtype="<i4", count=len(codes))
+    fitness = np.array([np.nan if ind.fitness is None else ind.fitness for ind in population], dtype="<f8")
+    fidelity = np.array([np.nan if ind.fitness is None else (1.0 if ind.fidelity is None else ind.fidelity) for ind in population], dtype="<f8")
+    rules = b"".join(c.tobytes() for c in codes)
+    if sys.byteorder != "little":
+        rules = np.frombuffer(rules, dtype="=i4").astype("<i4").tobytes()
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(head)))
+        f.write(head)
+        f.write(lengths.tobytes())
+        f.write(fitness.tobytes())
+        f.write(fidelity.tobytes())
+        f.write(rules)
+    os.replace(tmp, path)
+
+
+def read_checkpoint(path, grammar):
+    """(header, [Individual]) from a checkpoint written for `grammar`."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a population checkpoint")
+    (size,) = struct.unpack_from("<I", data, len(MAGIC))
+    offset = len(MAGIC) + 4
+    header = json.loads(data[offset:offset + size])
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint format {header.get('format')!r}")
+    if header["grammar"] != grammar.fingerprint():
+        raise ValueError("Checkpoint was written for a different grammar")
+
+    n = header["population"]
+    offset += size
+    lengths = np.frombuffer(data, dtype="<i4", count=n, offset=offset)
+    offset += 4 * n
+    fitness = np.frombuffer(data, dtype="<f8", count=n, offset=offset)
+    offset += 8 * n
+    fidelity = np.frombuffer(data, dtype="<f8", count=n, offset=offset)
+    offset += 8 * n
+    rules = np.frombuffer(data, dtype="<i4", count=int(lengths.sum()), offset=offset)
+    starts = np.cumsum(lengths, dtype=np.int64) - lengths
+    sizes = _subtree_sizes(grammar, rules)
+    if (lengths < 1).any() or not np.array_equal(sizes[starts], lengths):
+        raise ValueError(f"{path} holds a malformed rule sequence")
+
+    all_rules, all_sizes = array("i"), array("i")
+    all_rules.frombytes(rules.astype("=i4").tobytes())
+    all_sizes.frombytes(sizes.astype("=i4").tobytes())
+    individuals = []
+    for start, length, fit, fid in zip(starts.tolist(), lengths.tolist(), fitness.tolist(), fidelity.tolist()):
+        end = start + length
+        ind = Individual(DerivationTree.from_code(grammar, all_rules[start:end], all_sizes[start:end]))
+        if fid == fid:  # not NaN
+            ind.fitness, ind.fidelity = fit, fid
+        individuals.append(ind)
+    return header, individuals
+
+
+def _subtree_sizes(grammar, rules):
+    """Subtree sizes of concatenated preorder rule sequences, without a Python loop.
+
+    Each entry adds (number of children - 1) to a running count of open slots, which is
+    c[i - 1] just before entry i; its subtree ends at the first j >= i where the count
+    drops to c[i - 1] - 1 (it falls by at most one per entry, so it cannot skip that value).
+    The search runs over (count, position) keys sorted once, so every tree of the
+    checkpoint is handled in the same pass. Entries of a malformed sequence get size 0.
+    """
+    n = len(rules)
+    if not n:
+        return np.zeros(0, dtype=np.int32)
+    arity = np.asarray(_arities(grammar), dtype=np.int64)
+    rules = rules.astype(np.int64)
+    delta = np.where(rules >= 0, arity[np.maximum(rules, 0)], 0) - 1
+    count = np.cumsum(delta)
+    position = np.arange(n, dtype=np.int64)
+    keys = count * n + position
+    order = np.argsort(keys, kind="stable")
+    found = np.searchsorted(keys[order], (count - delta - 1) * n + position)
+    end = order[np.minimum(found, n - 1)]
+    valid = (found < n) & (count[end] == count - delta - 1)
+    return np.where(valid, end - position + 1, 0).astype(np.int32)
+
+
+def load_checkpoint(path, ea):
+    """Restores population, generation, evaluation count, RNG, evaluator and surrogate state of `ea` from `path`."""
+    header, ea.population = read_checkpoint(path, ea.grammar)
+    ea.generation = header["generation"]
+    ea.evaluations = header["evaluations"]
+    if "evaluator" in header:
+        ea.evaluator.restore_state(header["evaluator"])
+    if "surrogate" in header and ea.surrogate is not None:
+        ea.surrogate.restore_state(header["surrogate"])
+    random.setstate(_rng_from_json(header["rng"]))
+    return header
+
+
+def _rng_to_json(state):
+    version, internal, gauss_next = state
+    return [version, list(internal), gauss_next]
+
+
+def _rng_from_json(state):
+    version, internal, gauss_next = state
+    return version, tuple(internal), gauss_next
@@ -0,0 +1,123 @@
+"""Lightweight entry point for fitness-evaluation worker processes.
+
+Pool workers and spawned islands import the module of every function they are sent, so
+their startup cost is whatever those modules import. This module only needs the standard
+library:
+
+- `ObjectiveRef("trading:trading_objective")` is a picklable stand-in for an objective.
+  It travels as its "module:function" name and is resolved on its first call, so a worker
+  imports that one module and nothing else from the parent's import graph.
+- `warm_up(*specs)` is a pool initializer that resolves objectives before the first task
+  (calling their module's `warm_up()` if it has one), so import time is not charged
+  against a per-phenotype timeout.
+- `python EvaluationWorker.py module:function` scores phenotypes read from stdin, one per
+  line, and prints one score per line, for schedulers outside Python.
+
+`IMPORT_BUDGETS` holds the cold-import time allowed for the modules a worker loads, with
+the heavy packages each must not pull in; `python EvaluationWorker.py --budget` measures
+them and the test suite fails when one is exceeded.
+"""
+import importlib as _importlib
+import sys as _sys
+
+# module -> (seconds, packages it must not import). About three times the cold import
+# time measured on a single-core container, so only real regressions trip it.
+IMPORT_BUDGETS = {
+    "EvaluationWorker": (0.05, ("numpy", "lark", "pandas", "backtesting")),
+    "Grammar": (0.1, ("lark", "graphviz", "numpy")),
+    "Evaluators": (0.1, ("numpy", "pandas")),
+    "trading": (0.5, ("lark", "graphviz", "pandas", "backtesting", "bokeh")),
+}
+
+
+def resolve(spec):
+    """The function named by "module:qualname"."""
+    module_name, _, qualname = spec.partition(":")
+    if not module_name or not qualname:
+        raise ValueError(f"Objective spec must look like 'module:function', got {spec!r}")
+    target = _importlib.import_module(module_name)
+    for part in qualname.split("."):
+        target = getattr(target, part)
+    return target
+
+
+class ObjectiveRef:
+    """Picklable reference to a module-level objective, imported on first use.
+
+    It reports the target's `__module__` and `__qualname__`, so `FitnessCache.fingerprint`
+    gives it the same namespace as the function itself.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.__module__, _, self.__qualname__ = spec.partition(":")
+        self._func = None
+
+    def __call__(self, *args, **kwargs):
+        if self._func is None:
+            self._func = resolve(self.spec)
+        return self._func(*args, **kwargs)
+
+    def __reduce__(self):
+        return ObjectiveRef, (self.spec,)
+
+    def __repr__(self):
+        return f"ObjectiveRef({self.spec!r})"
+
+
+def warm_up(*specs):
+    """Pool initializer: import the objectives named by `specs` and run their modules' warm-up."""
+    for spec in specs:
+        resolve(spec)
+        hook = getattr(_sys.modules[spec.partition(":")[0]], "warm_up", None)
+        if callable(hook):
+            hook()
+
+
+def measure_import(module):
+    """(seconds, imported top-level packages) of importing `module` in a fresh interpreter."""
+    import subprocess as _subprocess
+    out = _subprocess.run([_sys.executable, "-X", "importtime", "-c",
+                           f"import sys, {module}; print(*sorted({{m.partition('.')[0] for m in sys.modules}}))"],
+                          capture_output=True, text=True, check=True)
+    # The last importtime line is the requested module: "import time: self | cumulative | name".
+    total = [line for line in out.stderr.splitlines() if line.startswith("import time:")][-1]
+    return int(total.split("|")[1]) / 1e6, set(out.stdout.split())
+
+
+def check_budgets(budgets=None):
+    """[(module, seconds, budget, forbidden packages loaded)] for every module in `budgets`."""
+    rows = []
+    for module, (budget, forbidden) in (budgets or IMPORT_BUDGETS).items():
+        seconds, loaded = measure_import(module)
+        rows.append((module, seconds, budget, sorted(loaded.intersection(forbidden))))
+    return rows
+
+
+def main(argv=None):
+    import argparse
+    from Evaluators import FAILURE_PENALTY, _evaluate_chunk
+    parser = argparse.ArgumentParser(description="Score phenotypes from stdin, one per line.")
+    parser.add_argument("objective", nargs="?", help="module:function, e.g. trading:trading_objective")
+    parser.add_argument("--budget", action="store_true", help="measure import times against IMPORT_BUDGETS")
+    args = parser.parse_args(argv)
+    if args.budget:
+        failed = False
+        for module, seconds, budget, heavy in check_budgets():
+            ok = seconds <= budget and not heavy
+            failed |= not ok
+            print(f"{module:<18} {seconds * 1000:7.1f} ms / {budget * 1000:.0f} ms"
+                  f"{'' if not heavy else '  loads ' + ', '.join(heavy)}{'' if ok else '  OVER'}")
+        return 1 if failed else 0
+    if not args.objective:
+        parser.error("an objective is required")
+    warm_up(args.objective)
+    objective = resolve(args.objective)
+    for line in _sys.stdin:
+        [score] = _evaluate_chunk(objective, [line.rstrip("\n")], FAILURE_PENALTY)
+        print(repr(score), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    _sys.exit(main())
@@ -0,0 +1,360 @@
+import os as _os
+import time as _time
+from concurrent import futures as _futures
+from functools import partial as _partial
+from math import ceil as _ceil
+
+# Score given to individuals whose evaluation raised, crashed its worker or timed out.
+# Matches the failure score returned by trading_objective.
+FAILURE_PENALTY = 2000.0
+# Fidelity `evaluate_fidelity` reports for a crash or timeout: the penalty then says nothing
+# about the phenotype itself and must not be cached. An objective that raises is scored
+# like one returning the penalty, at full fidelity.
+FAILED = 0.0
+
+
+def _evaluate_chunk(objective, phenotypes, penalty):
+    """Runs in the worker: scores a chunk of phenotype strings in order."""
+    scores = []
+    for phenotype in phenotypes:
+        try:
+            scores.append(float(objective(phenotype)))
+        except Exception:
+            scores.append(penalty)
+    return scores
+
+
+def _score_timed(objective, phenotype, penalty):
+    """Runs in the worker: (score, seconds spent) for one phenotype; used by SteadyState."""
+    start = _time.perf_counter()
+    [score] = _evaluate_chunk(objective, [phenotype], penalty)
+    return score, _time.perf_counter() - start
+
+
+class SerialEvaluator:
+    """Evaluates phenotypes one after another in the calling thread."""
+
+    def __init__(self, penalty=FAILURE_PENALTY):
+        self.penalty = penalty
+
+    def evaluate(self, objective, phenotypes):
+        return _evaluate_chunk(objective, list(phenotypes), self.penalty)
+
+    def evaluate_fidelity(self, objective, phenotypes):
+        """[(score, fidelity)] in input order; fidelity is 1.0, or FAILED for a crash or timeout."""
+        return [(score, 1.0) for score in self.evaluate(objective, phenotypes)]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _PoolEvaluator(SerialEvaluator):
+    """Shared chunking, ordering and failure handling for the executor-backed evaluators.
+
+    Results are returned in input order. A chunk that times out or loses its worker is
+    retried one phenotype at a time, in isolation, so only the offending phenotypes receive the penalty
+    and the outcome does not depend on the worker count or chunk size. `evaluate_fidelity`
+    reports those penalties with fidelity FAILED.
+    """
+
+    def __init__(self, workers=None, chunksize=1, timeout=None, penalty=FAILURE_PENALTY):
+        super().__init__(penalty)
+        self.workers = workers or _os.cpu_count() or 1
+        self.chunksize = max(1, int(chunksize))
+        self.timeout = timeout
+        self._executor = None
+
+    def _make_executor(self):
+        raise NotImplementedError
+
+    def _discard_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = self._make_executor()
+        return self._executor
+
+    def evaluate(self, objective, phenotypes):
+        return [score for score, _ in self.evaluate_fidelity(objective, phenotypes)]
+
+    def evaluate_fidelity(self, objective, phenotypes):
+        phenotypes = list(phenotypes)
+        size = self.chunksize
+        chunks = [phenotypes[i:i + size] for i in range(0, len(phenotypes), size)]
+        results = []
+        for chunk, scores in zip(chunks, self._run_chunks(objective, chunks)):
+            if scores is None:
+                # Retry in isolation, one phenotype in flight at a time, single-phenotype chunks
+                # included: a crash or timeout elsewhere in the pool fails unrelated futures too.
+                retried = [self._run_chunks(objective, [[p]])[0] for p in chunk]
+                results.extend((r[0], 1.0) if r is not None else (self.penalty, FAILED) for r in retried)
+            else:
+                results.extend((score, 1.0) for score in scores)
+        return results
+
+    def _run_chunks(self, objective, chunks):
+        """Submits every chunk and returns a list of score lists, None for failed chunks."""
+        executor = self.executor
+        pending = []
+        for chunk in chunks:
+            try:
+                pending.append(executor.submit(_evaluate_chunk, objective, chunk, self.penalty))
+            except Exception:  # BrokenExecutor: a worker died while the batch was being submitted
+                pending.append(None)
+        results = []
+        for chunk, future in zip(chunks, pending):
+            timeout = None if self.timeout is None else self.timeout * len(chunk)
+            try:
+                if future is None:
+                    raise _futures.BrokenExecutor
+                results.append(future.result(timeout=timeout))
+            except Exception:
+                # Timeout, or BrokenExecutor when a worker died. Either way the executor is
+                # replaced; its remaining futures fail too and are retried by evaluate().
+                results.append(None)
+                if executor is self._executor:
+                    self._discard_executor()
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+class ThreadPoolEvaluator(_PoolEvaluator):
+    """Evaluates chunks on a thread pool; useful when the objective releases the GIL.
+
+    Timed-out threads cannot be interrupted; they are abandoned with their executor.
+    """
+
+    def _make_executor(self):
+        return _futures.ThreadPoolExecutor(max_workers=self.workers)
+
+
+class ProcessPoolEvaluator(_PoolEvaluator):
+    """Evaluates chunks on a process pool.
+
+    Only the phenotype strings and a reference to the (module-level) objective are sent to
+    the workers. Each worker imports the objective's module, and with it backtesting and
+    its data, once and keeps it for every later task. `initializer` can warm up anything
+    else a worker needs before its first task.
+    """
+
+    def __init__(self, workers=None, chunksize=1, timeout=None, penalty=FAILURE_PENALTY,
+                 initializer=None, initargs=()):
+        super().__init__(workers, chunksize, timeout, penalty)
+        self.initializer = initializer
+        self.initargs = initargs
+
+    def _make_executor(self):
+        return _futures.ProcessPoolExecutor(
+            max_workers=self.workers, initializer=self.initializer, initargs=self.initargs
+        )
+
+    def _discard_executor(self):
+        executor = self._executor
+        if executor is not None:
+            # A hung worker would otherwise keep running after the executor is dropped.
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        super()._discard_executor()
+
+
+class SuccessiveHalvingEvaluator(SerialEvaluator):
+    """Races phenotypes over growing prefixes of `data` (successive halving).
+
+    Every phenotype is first scored on the leading `schedule[0]` fraction of the bars; the
+    best `keep` fraction of each rung is promoted to the next, longer prefix, and only the
+    survivors of the last rung see the full history. `schedule` must increase and end at
+    1.0. Rungs are scored by `evaluator` with `objective` bound to the prefix through its
+    `data` keyword argument (see `trading_objective`). A phenotype whose evaluation crashes
+    or times out drops out with fidelity FAILED.
+    """
+
+    def __init__(self, data, schedule=(0.25, 1.0), keep=0.25, evaluator=None, penalty=FAILURE_PENALTY):
+        super().__init__(penalty)
+        schedule = tuple(float(f) for f in schedule)
+        if not schedule or schedule[0] <= 0 or schedule[-1] != 1.0 or list(schedule) != sorted(set(schedule)):
+            raise ValueError("schedule must be increasing fractions of the data ending at 1.0")
+        if not 0 < keep <= 1:
+            raise ValueError("keep must be in (0, 1]")
+        self.data = data
+        self.schedule = schedule
+        self.keep = keep
+        self.evaluator = evaluator or SerialEvaluator(penalty)
+        self.prefixes = [data.iloc[:max(1, round(len(data) * f))] for f in schedule[:-1]] + [data]
+        self.bars = 0  # bars simulated so far, summed over phenotypes and rungs
+
+    def evaluate_fidelity(self, objective, phenotypes):
+        """[(score, fidelity)] in input order; fidelity is the fraction of `data` the score came from."""
+        phenotypes = list(phenotypes)
+        results = [None] * len(phenotypes)
+        alive = list(range(len(phenotypes)))
+        for rung, (fidelity, prefix) in enumerate(zip(self.schedule, self.prefixes)):
+            rung_results = self.evaluator.evaluate_fidelity(_partial(objective, data=prefix),
+                                                            [phenotypes[i] for i in alive])
+            self.bars += len(prefix) * len(alive)
+            promote = max(1, _ceil(len(alive) * self.keep))
+            scored = []
+            for i, (score, ok) in zip(alive, rung_results):
+                results[i] = (score, fidelity if ok else FAILED)
+                if ok:
+                    scored.append(i)
+            if rung + 1 < len(self.schedule):
+                alive = sorted(sorted(scored, key=lambda i: results[i][0])[:promote])
+        return results
+
+    def evaluate(self, objective, phenotypes):
+        return [score for score, _ in self.evaluate_fidelity(objective, phenotypes)]
+
+    def checkpoint_state(self):
+        """JSON-able state a checkpoint keeps for this evaluator (see `restore_state`)."""
+        return {"bars": self.bars}
+
+    def restore_state(self, state):
+        self.bars = state["bars"]
+
+    def close(self):
+        self.evaluator.close()
+
+
+def walk_forward_folds(n_bars, folds=4, anchored=False):
+    """[(start, end)] bar ranges of `folds` consecutive, equally long test windows; with
+    `anchored`, every window starts at bar 0 and ends where the plain one would."""
+    if folds < 1 or n_bars < folds:
+        raise ValueError(f"Cannot split {n_bars} bars into {folds} folds")
+    edges = [round(n_bars * k / folds) for k in range(folds + 1)]
+    return [(0 if anchored else edges[k], edges[k + 1]) for k in range(folds)]
+
+
+class WalkForwardEvaluator(SerialEvaluator):
+    """Scores phenotypes on several out-of-sample folds of `data` and aggregates the fold scores.
+
+    The fold slices are cut once (see `walk_forward_folds`), and each fold is scored by
+    `evaluator` for the whole batch with `objective` bound to it through its `data` keyword
+    argument, so per-fold indicator arrays (`precompute`, or the cache entries of
+    `VectorizedEvaluator` / `trading_objective`) are built once and shared by every
+    individual. `aggregate` is "mean" or "worst" (the largest, i.e. least favourable, score).
+
+    Folds are evaluated lazily, in order. With `prune` (by default only for "worst"), after
+    each fold a phenotype whose best possible aggregate can no longer beat the elite (the
+    best aggregate this evaluator has returned) is dropped: with "worst" that is exact;
+    with "mean" it is a heuristic that assumes the remaining folds score no better than
+    the best any phenotype has scored on them so far, so `prune=True` must be asked for. A dropped
+    phenotype gets that bound as its score and the fraction of folds it saw as its fidelity,
+    so `rank()` orders it after every fully evaluated individual and the fitness cache does
+    not keep it. A phenotype whose evaluation crashes or times out on a fold is dropped with
+    the penalty and fidelity FAILED. Note that the elite is tracked on objective scores,
+    before the complexity penalty is added. The elite, per-fold bests and counters are
+    saved with checkpoints (`checkpoint_state`), so a resumed run prunes as the
+    uninterrupted one would.
+    """
+
+    AGGREGATES = ("mean", "worst")
+
+    def __init__(self, data, folds=4, anchored=False, aggregate="mean", prune=None, evaluator=None,
+                 penalty=FAILURE_PENALTY):
+        super().__init__(penalty)
+        if aggregate not in self.AGGREGATES:
+            raise ValueError(f"Unknown aggregate {aggregate!r}; expected one of {self.AGGREGATES}")
+        self.data = data
+        self.bounds = walk_forward_folds(len(data), folds, anchored)
+        self.folds = [data.iloc[start:end] for start, end in self.bounds]
+        self.aggregate = aggregate
+        self.prune = aggregate == "worst" if prune is None else prune
+        self.evaluator = evaluator or SerialEvaluator(penalty)
+        self.elite = None  # best full aggregate returned so far
+        self._fold_best = [None] * len(self.folds)  # best score seen on each fold
+        self.fold_evaluations = 0
+        self.folds_skipped = 0
+
+    def precompute(self, indicators, name, func, column, param_grid, dataset):
+        """Fills `indicators` with `func` over every fold, keyed by `IndicatorCache.slice_id(dataset, start, end)`."""
+        from IndicatorCache import slice_id
+        for (start, end), fold in zip(self.bounds, self.folds):
+            indicators.precompute(name, func, fold, column, param_grid, dataset=slice_id(dataset, start, end))
+
+    def _combine(self, scores):
+        return max(scores) if self.aggregate == "worst" else sum(scores) / len(scores)
+
+    def _bound(self, scores):
+        """Best aggregate still reachable after `scores` (the folds seen so far); None if unknown."""
+        if self.aggregate == "worst":
+            return max(scores)
+        rest = self._fold_best[len(scores):]
+        if any(best is None for best in rest):
+            return None
+        return (sum(scores) + sum(rest)) / len(self.folds)
+
+    def evaluate_fidelity(self, objective, phenotypes):
+        """[(score, fidelity)] in input order; fidelity is the fraction of folds behind the score."""
+        phenotypes = list(phenotypes)
+        n_folds = len(self.folds)
+        fold_scores = [[] for _ in phenotypes]
+        results = [None] * len(phenotypes)
+        alive = list(range(len(phenotypes)))
+        for k, fold in enumerate(self.folds):
+            if not alive:
+                break
+            fold_results = self.evaluator.evaluate_fidelity(_partial(objective, data=fold),
+                                                            [phenotypes[i] for i in alive])
+            self.fold_evaluations += len(alive)
+            scored = []
+            for i, (score, ok) in zip(alive, fold_results):
+                if ok:
+                    fold_scores[i].append(score)
+                    scored.append(i)
+                else:
+                    results[i] = (self.penalty, FAILED)
+            alive = scored
+            if not alive:
+                break
+            best = min(fold_scores[i][-1] for i in alive)
+            if self._fold_best[k] is None or best < self._fold_best[k]:
+                self._fold_best[k] = best
+            if k + 1 < n_folds and self.prune and self.elite is not None:
+                survivors = []
+                for i in alive:
+                    bound = self._bound(fold_scores[i])
+                    if bound is not None and bound >= self.elite:
+                        results[i] = (bound, (k + 1) / n_folds)
+                        self.folds_skipped += n_folds - k - 1
+                    else:
+                        survivors.append(i)
+                alive = survivors
+        for i in alive:
+            score = self._combine(fold_scores[i])
+            results[i] = (score, 1.0)
+            if self.elite is None or score < self.elite:
+                self.elite = score
+        return results
+
+    def evaluate(self, objective, phenotypes):
+        return [score for score, _ in self.evaluate_fidelity(objective, phenotypes)]
+
+    def checkpoint_state(self):
+        """JSON-able state a checkpoint keeps for this evaluator (see `restore_state`)."""
+        return {"elite": self.elite, "fold_best": list(self._fold_best),
+                "fold_evaluations": self.fold_evaluations, "folds_skipped": self.folds_skipped}
+
+    def restore_state(self, state):
+        if len(state["fold_best"]) != len(self.folds):
+            raise ValueError("Checkpoint was written for a different number of folds")
+        self.elite = state["elite"]
+        self._fold_best = list(state["fold_best"])
+        self.fold_evaluations = state["fold_evaluations"]
+        self.folds_skipped = state["folds_skipped"]
+
+    def close(self):
+        self.evaluator.close()
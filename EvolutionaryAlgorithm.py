@@ -1,100 +1,345 @@
 import random
-import copy
+import time
+from contextlib import contextmanager
+from Grammar import DerivationTree, GENERATION_METHODS
+from Evaluators import SerialEvaluator
+from Reporters import PrintReporter, PENALTY_SCORES, new_record
 
 class Individual:
     def __init__(self, genotype):
         self.genotype = genotype
         self.phenotype = genotype.string()
         self.fitness = None
+        self.fidelity = None  # fraction of the evaluation data behind `fitness` (1.0 = full)
         self.complexity = len(self.phenotype)
 
+INIT_METHODS = GENERATION_METHODS + ("ramped",)
+
 class EvolutionaryAlgorithm:
-    def __init__(self, grammar, objective_function, population_size=20, complexity_coefficient=0.1):
+    def __init__(self, grammar, objective_function, population_size=20, complexity_coefficient=0.1,
+                 fitness_cache=None, evaluator=None, verbose=True, reporters=None,
+                 max_tree_size=100, max_tree_depth=None, init_method="ptc2", surrogate=None):
+        if init_method not in INIT_METHODS:
+            raise ValueError(f"Unknown init_method {init_method!r}; expected one of {INIT_METHODS}")
+        if init_method == "ramped" and max_tree_depth is None:
+            raise ValueError("Ramped half-and-half initialization needs max_tree_depth")
         self.grammar = grammar
         self.obj_func = objective_function
         self.pop_size = population_size
         self.penalty_coeff = complexity_coefficient
+        self.fitness_cache = fitness_cache
+        self.evaluator = evaluator or SerialEvaluator()
+        self.verbose = verbose
+        # Bounds (expanded nodes / levels) for generated trees and regrown subtrees.
+        self.max_tree_size = max_tree_size
+        self.max_tree_depth = max_tree_depth
+        self.init_method = init_method
+        self.surrogate = surrogate  # optional SurrogateModel screening offspring in breed()
+        # Generation hooks; by default just the printed summary (none when verbose=False).
+        self.reporters = list(reporters) if reporters is not None else ([PrintReporter()] if verbose else [])
+        self.evaluations = 0  # objective calls made through the evaluator
         self.population = []
+        self.generation = -1  # last ranked generation
+        self._record = None  # stats of the generation being built, while reporters are attached
+        self._phase_name = None
+        self._detailed = False  # time rendering for the open record
+        self._previous = []  # last ranked population, for counting newly allocated nodes
+
+    def _raw_score(self, phenotype):
+        """Objective score of a phenotype, served from the fitness cache when one is attached."""
+        cache = self.fitness_cache
+        if cache is None:
+            return self.obj_func(phenotype)
+        score = cache.get(phenotype)
+        if score is None:
+            score = self.obj_func(phenotype)
+            cache.put(phenotype, score)
+        return score
 
     def _evaluate(self, individual):
         
-        raw_score = self.obj_func(individual.phenotype)
+        raw_score = self._raw_score(individual.phenotype)
         penalty = individual.complexity * self.penalty_coeff
         individual.fitness = raw_score + penalty
+        individual.fidelity = 1.0
+
+    def _evaluate_population(self, individuals):
+        """Scores a batch of individuals through the evaluator, one objective call per distinct phenotype.
+
+        Evaluators with an `evaluate_fidelity` method (e.g. SuccessiveHalvingEvaluator) may
+        score some phenotypes on part of the data only; those scores are recorded on the
+        individual's `fidelity` and kept out of the fitness cache. So are the penalties of
+        evaluations that crashed or timed out (fidelity `Evaluators.FAILED`).
+        """
+        cache = self.fitness_cache
+        scores = {}
+        todo = []
+        for ind in individuals:
+            phenotype = ind.phenotype
+            if phenotype in scores:
+                continue
+            score = cache.get(phenotype) if cache is not None else None
+            scores[phenotype] = (score, 1.0)
+            if score is None:
+                todo.append(phenotype)
+
+        if todo:
+            self.evaluations += len(todo)
+            start = time.perf_counter()
+            evaluate_fidelity = getattr(self.evaluator, "evaluate_fidelity", None)
+            if evaluate_fidelity is not None:
+                results = evaluate_fidelity(self.obj_func, todo)
+            else:
+                results = [(score, 1.0) for score in self.evaluator.evaluate(self.obj_func, todo)]
+            if self.reporters:
+                self._record_evaluation(todo, [score for score, _ in results], time.perf_counter() - start)
+            for phenotype, (score, fidelity) in zip(todo, results):
+                scores[phenotype] = (score, fidelity)
+                if cache is not None and fidelity == 1.0:
+                    cache.put(phenotype, score)
+
+        for ind in individuals:
+            score, ind.fidelity = scores[ind.phenotype]
+            ind.fitness = score + ind.complexity * self.penalty_coeff
+
+    def _record_evaluation(self, phenotypes, scores, seconds):
+        record = self._record
+        if record is not None:
+            record["evaluations"] += len(phenotypes)
+            self._move_time("evaluate", seconds)
+            penalties = record["penalties"]
+            for score in scores:
+                if score in PENALTY_SCORES:
+                    penalties[f"{score:g}"] += 1
+        for reporter in self.reporters:
+            reporter.on_evaluate(self, phenotypes, scores, seconds)
+
+    def _individual(self, genotype):
+        """Individual(genotype), timing the phenotype rendering when a detailed reporter is attached."""
+        if not self._detailed:
+            return Individual(genotype)
+        start = time.perf_counter()
+        individual = Individual(genotype)
+        self._move_time("render", time.perf_counter() - start)
+        return individual
+
+    def _move_time(self, name, seconds):
+        """Books `seconds` of the running phase under `name` instead, so phase times do not overlap."""
+        times = self._record["seconds"]
+        times[name] += seconds
+        if self._phase_name is not None:
+            times[self._phase_name] -= seconds
+
+    @contextmanager
+    def _phase(self, name, generation):
+        """Times a phase into the record of `generation`, opening it (and notifying reporters) if needed."""
+        if not self.reporters:
+            yield
+            return
+        if self._record is None:
+            self._record = new_record(generation)
+            self._detailed = any(r.detailed for r in self.reporters)
+            for reporter in self.reporters:
+                reporter.on_generation_start(self, generation)
+        self._phase_name = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record["seconds"][name] += time.perf_counter() - start
+            self._phase_name = None
+
+    def _end_generation(self):
+        record, self._record = self._record, None
+        if record is None:
+            return
+        self._detailed = False
+        best = self.population[0]
+        record["best_fitness"], record["best_phenotype"] = best.fitness, best.phenotype
+        record["population"] = len(self.population)
+        if any(r.detailed for r in self.reporters):
+            record["nodes_allocated"] = _count_new_nodes(self.population, self._previous)
+            self._previous = list(self.population)
+        for reporter in self.reporters:
+            reporter.on_generation_end(self, record)
 
     def _get_all_nodes(self, node):
-        """Recursive DFS to find all mutation/crossover points."""
-        nodes = [node]
-        for child in node.children:
-            nodes.extend(self._get_all_nodes(child))
-        return nodes
+        """DFS (preorder) over all mutation/crossover points."""
+        return [n for _, n in self._get_all_paths(node)]
+
+    def _get_all_paths(self, node):
+        """Preorder list of (path, node) pairs; a path is the tuple of child indices from `node`."""
+        result = []
+        stack = [((), node)]
+        while stack:
+            path, curr = stack.pop()
+            result.append((path, curr))
+            for i in range(len(curr.children) - 1, -1, -1):
+                stack.append((path + (i,), curr.children[i]))
+        return result
 
     def crossover(self, parent1, parent2):
-        """Swaps compatible subtrees between two individuals."""
-        # Clone to avoid modifying original parents
-        tree1 = copy.deepcopy(parent1.genotype)
-        tree2 = copy.deepcopy(parent2.genotype)
-
-        # Get all non-terminal nodes (points where we can swap)
-        nodes1 = [n for n in self._get_all_nodes(tree1.root_node) if n.children]
-        nodes2 = [n for n in self._get_all_nodes(tree2.root_node) if n.children]
-
-        random.shuffle(nodes1)
-        for n1 in nodes1:
-            # Find a node in parent 2 that has the EXACT same grammar symbol
-            compatible_targets = [n2 for n2 in nodes2 if n2.symbol == n1.symbol]
-            if compatible_targets:
-                n2 = random.choice(compatible_targets)
-                
-                
-                n1.children, n2.children = n2.children, n1.children
-                return Individual(tree1)
-
-    
+        """Swaps compatible subtrees between two individuals.
+
+        Crossover points come from each genotype's symbol index: the first point is uniform
+        over the nodes of parent1 whose symbol also occurs in parent2, the second uniform
+        over parent2's nodes with that symbol. The offspring is built by path copying, so it
+        shares every untouched subtree with its parents, which are never modified.
+        """
+        tree1, tree2 = parent1.genotype, parent2.genotype
+        index1, index2 = tree1.node_index(), tree2.node_index()
+        shared = [sym for sym in index1 if sym in index2]
+        if shared:
+            sym = random.choices(shared, weights=[len(index1[s]) for s in shared])[0]
+            path1 = random.choice(index1[sym])
+            n2 = tree2.node_at(random.choice(index2[sym]))
+            return self._individual(tree1.replace_subtree(path1, n2.children))
+
         return self.mutate(parent1)
 
     def mutate(self, individual):
-        """Re-generates a random branch of the derivation tree."""
-        mutated_tree = copy.deepcopy(individual.genotype)
-        nodes = [n for n in self._get_all_nodes(mutated_tree.root_node) if n.children]
-        if nodes:
-            target = random.choice(nodes)
-            # Generate a new subtree starting from the same symbol
-            new_subtree = self.grammar.generate_derivation_tree(root_symbol=target.symbol).root_node
-            target.children = new_subtree.children
-        return Individual(mutated_tree)
-
-    def run(self, gens=10):
-        """Main Evolutionary Loop."""
-        # Initial Population
-        self.population = [Individual(self.grammar.generate_derivation_tree()) for _ in range(self.pop_size)]
-        
-        for g in range(gens):
-            # 1. Evaluate
-            for ind in self.population: 
-                if ind.fitness is None: # Only evaluate if new
-                    self._evaluate(ind)
-            
-            # 2. Sort by fitness (lower is better)
-            self.population.sort(key=lambda x: x.fitness)
-            print(f"Gen {g} | Best Score: {self.population[0].fitness:.2f} | Phenotype: {self.population[0].phenotype[:50]}...")
-
-            # 3. Create Next Generation
-            next_gen = [copy.deepcopy(self.population[0])] # Elitism (keep the champion)
-            
+        """Re-generates a random branch of the derivation tree.
+
+        The new branch is a complete derivation that keeps the offspring within
+        `max_tree_size` and `max_tree_depth`; when the parent already exceeds them (e.g.
+        after crossover), the branch is only grown as large as the smallest one allowed.
+        """
+        tree = individual.genotype
+        index = tree.node_index()
+        if not index:
+            return self._individual(DerivationTree(tree.grammar, root_node=tree.root_node))
+        sym = random.choices(list(index), weights=[len(paths) for paths in index.values()])[0]
+        path = random.choice(index[sym])
+        # Generate a new subtree starting from the same symbol
+        max_size, max_depth = self._subtree_bounds(tree, path, sym)
+        new_subtree = self.grammar.generate_bounded(max_size, max_depth, root_symbol=sym).root_node
+        return self._individual(tree.replace_subtree(path, new_subtree.children))
+
+    def _subtree_bounds(self, tree, path, sym):
+        """(max_size, max_depth) left for a new subtree of symbol `sym` at `path` of `tree`."""
+        analysis = self.grammar.analysis()
+        nt = self.grammar.rule_table().nt_index[sym]
+        max_depth = self.max_tree_depth
+        if max_depth is not None:
+            max_depth = max(max_depth - len(path), analysis.min_depth[sym])
+        max_size = self.max_tree_size
+        if max_size is not None:
+            max_size = max(max_size - tree.size() + tree.size(path), analysis.min_size_within(max_depth)[nt])
+        return max_size, max_depth
+
+    def new_trees(self, n):
+        """`n` complete derivation trees generated with `init_method` within the tree bounds."""
+        grammar = self.grammar
+        if self.init_method == "ramped":
+            return grammar.generate_ramped(n, self.max_tree_depth, max_size=self.max_tree_size)
+        return [grammar.generate_bounded(self.max_tree_size, self.max_tree_depth, self.init_method)
+                for _ in range(n)]
+
+    def initialize(self):
+        """Fills the population with freshly generated individuals."""
+        with self._phase("generate", 0):
+            self.population = [self._individual(tree) for tree in self.new_trees(self.pop_size)]
+
+    def rank(self, g):
+        """Evaluates the new individuals, sorts the population (lower is better) and reports generation g."""
+        with self._phase("rank", g):
+            new = [ind for ind in self.population if ind.fitness is None]
+            self._evaluate_population(new)
+            if self.surrogate is not None:
+                self.surrogate.observe(new)
+                if self._record is not None:
+                    self._record["surrogate"] = self.surrogate.generation_stats()
+            # Only fitnesses of equal fidelity are comparable: fully evaluated individuals rank first.
+            self.population.sort(key=lambda x: (-x.fidelity, x.fitness))
+            if self.fitness_cache is not None:
+                self.fitness_cache.flush()
+                hits, misses = self.fitness_cache.generation_stats()
+                if self._record is not None:
+                    self._record["cache_hits"], self._record["cache_misses"] = hits, misses
+        if self._record is not None:
+            self._record["generation"] = g
+        self.generation = g
+        self._end_generation()
+
+    def breed(self):
+        """Replaces the ranked population with the next generation."""
+        with self._phase("breed", self.generation + 1):
+            self._breed()
+
+    def _breed(self):
+        next_gen = [self.population[0]] # Elitism (keep the champion; genotypes are immutable)
+        needed = self.pop_size - 1
+
+        if self.surrogate is not None and self.surrogate.ready:
+            # Oversample, then let the surrogate pick the offspring worth a real evaluation.
+            candidates = [self._offspring() for _ in range(self.surrogate.candidates(needed))]
+            next_gen += self.surrogate.select(candidates, needed, self.fitness_cache)
+        else:
             while len(next_gen) < self.pop_size:
-                # 70% chance of crossover, 30% mutation
-                if random.random() < 0.7:
-                    # Pick 2 parents from the top 10 individuals
-                    p1, p2 = random.sample(self.population[:10], 2)
-                    offspring = self.crossover(p1, p2)
-                else:
-                    # Pick 1 parent from the top 10 individuals
-                    p = random.choice(self.population[:10])
-                    offspring = self.mutate(p)
-                
-                next_gen.append(offspring)
-            
-            self.population = next_gen
-
-        return self.population[0]
\ No newline at end of file
+                next_gen.append(self._offspring())
+
+        self.population = next_gen
+
+    def _offspring(self):
+        # 70% chance of crossover, 30% mutation
+        if random.random() < 0.7:
+            # Pick 2 parents from the top 10 individuals
+            p1, p2 = random.sample(self.population[:10], 2)
+            return self.crossover(p1, p2)
+        # Pick 1 parent from the top 10 individuals
+        p = random.choice(self.population[:10])
+        return self.mutate(p)
+
+    def run_steady_state(self, concurrency=None, tournament_size=3, **stop_conditions):
+        """Asynchronous steady-state alternative to `run()` (see SteadyState.py); returns the best individual."""
+        from SteadyState import SteadyState
+        return SteadyState(self, concurrency, tournament_size).run(**stop_conditions)
+
+    def save_checkpoint(self, path):
+        """Writes the ranked population, RNG state and generation to `path` (see Checkpoint.py)."""
+        from Checkpoint import save_checkpoint
+        save_checkpoint(path, self)
+
+    def load_checkpoint(self, path):
+        from Checkpoint import load_checkpoint
+        return load_checkpoint(path, self)
+
+    def run(self, gens=10, checkpoint=None, checkpoint_every=1, resume_from=None):
+        """Main Evolutionary Loop.
+
+        With `checkpoint`, the state after ranking every `checkpoint_every`-th generation is
+        written to that path. `resume_from` continues a run from such a file exactly as the
+        uninterrupted run would have, up to `gens` generations in total.
+        """
+        if resume_from is not None:
+            self.load_checkpoint(resume_from)
+            first = self.generation + 1
+            self.breed()
+        else:
+            self.initialize()
+            first = 0
+        for g in range(first, gens):
+            self.rank(g)
+            if checkpoint is not None and (g + 1) % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint)
+            self.breed()
+        return self.population[0]
+
+def _count_new_nodes(population, previous):
+    """Distinct derivation-tree nodes in `population` that `previous` did not already hold."""
+    old = set()
+    stack = [ind.genotype.root_node for ind in previous]
+    while stack:
+        node = stack.pop()
+        if id(node) not in old:
+            old.add(id(node))
+            stack.extend(node.children)
+    new = set()
+    stack = [ind.genotype.root_node for ind in population]
+    while stack:
+        node = stack.pop()
+        key = id(node)
+        if key not in old and key not in new:
+            new.add(key)
+            stack.extend(node.children)
+    return len(new)
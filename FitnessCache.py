@@ -0,0 +1,108 @@
+import hashlib as _hashlib
+import sqlite3 as _sqlite3
+from collections import OrderedDict
+
+
+def fingerprint(*parts):
+    """Short stable hash of the objective/dataset identity used to namespace cache entries."""
+    h = _hashlib.sha1()
+    for part in parts:
+        if callable(part):
+            part = f"{getattr(part, '__module__', '')}.{getattr(part, '__qualname__', repr(part))}"
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class FitnessCache:
+    """Phenotype -> raw objective score memo with a bounded in-memory LRU and an optional SQLite store.
+
+    Only the raw objective score is stored; the complexity penalty is added by the
+    EvolutionaryAlgorithm so the cache stays valid across different coefficients.
+    """
+
+    def __init__(self, fingerprint="", maxsize=100_000, path=None):
+        self.fingerprint = fingerprint
+        self.maxsize = maxsize
+        self.path = path
+        self._lru = OrderedDict()
+        self._pending = []
+        self._db = None
+        self.hits = self.misses = 0
+        self.total_hits = self.total_misses = 0
+        if path is not None:
+            self._db = _sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS fitness ("
+                "fingerprint TEXT NOT NULL, phenotype TEXT NOT NULL, score REAL NOT NULL, "
+                "PRIMARY KEY (fingerprint, phenotype))"
+            )
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._lru)
+
+    def __contains__(self, phenotype):
+        return self._peek(phenotype) is not None
+
+    def _remember(self, phenotype, score):
+        lru = self._lru
+        lru[phenotype] = score
+        lru.move_to_end(phenotype)
+        if len(lru) > self.maxsize:
+            lru.popitem(last=False)
+
+    def _peek(self, phenotype):
+        score = self._lru.get(phenotype)
+        if score is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT score FROM fitness WHERE fingerprint = ? AND phenotype = ?",
+                (self.fingerprint, phenotype),
+            ).fetchone()
+            if row is not None:
+                score = row[0]
+                self._remember(phenotype, score)
+        return score
+
+    def get(self, phenotype):
+        """Returns the cached score or None, counting the lookup as a hit or miss."""
+        score = self._lru.get(phenotype)
+        if score is not None:
+            self._lru.move_to_end(phenotype)
+        else:
+            score = self._peek(phenotype)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return score
+
+    def put(self, phenotype, score):
+        """Stores a score; NaN is not cached (SQLite would turn it into NULL), so it is re-evaluated."""
+        score = float(score)
+        if score != score:
+            return
+        self._remember(phenotype, score)
+        if self._db is not None:
+            self._pending.append((self.fingerprint, phenotype, score))
+
+    def flush(self):
+        """Writes pending entries to the on-disk store in one transaction."""
+        if self._db is not None and self._pending:
+            self._db.executemany("INSERT OR REPLACE INTO fitness VALUES (?, ?, ?)", self._pending)
+            self._db.commit()
+            self._pending = []
+
+    def generation_stats(self):
+        """Returns (hits, misses) since the previous call and resets the per-generation counters."""
+        stats = (self.hits, self.misses)
+        self.total_hits += self.hits
+        self.total_misses += self.misses
+        self.hits = self.misses = 0
+        return stats
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
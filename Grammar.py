@@ -1,50 +1,192 @@
+import gc as _gc
+import os as _os
 import re as _re
-import copy as _copy
+import hashlib as _hashlib
 import random as _random
-import lark as _lark
-from graphviz import Digraph
-from itertools import product as _cartesian_product
+from array import array as _array
+from bisect import bisect_left as _bisect_left
+from itertools import accumulate as _accumulate, product as _cartesian_product
 
 
 class Symbol:
-    __slots__ = ("text",)
-    def __init__(self, text): self.text = text
+    __slots__ = ("text", "_hash")
+    def __init__(self, text):
+        self.text = text
+        self._hash = hash((type(self), text))
     def __repr__(self): return self.text
     def __eq__(self, other): return type(self) == type(other) and self.text == other.text
-    def __hash__(self): return hash((type(self), self.text))
+    def __hash__(self): return self._hash
+    def __getstate__(self): return self.text
+    def __setstate__(self, text): self.__init__(text)
 
 class NonterminalSymbol(Symbol): pass
 class TerminalSymbol(Symbol): pass
 
 class Node:
-    __slots__ = ("symbol", "children")
-    def __init__(self, symbol):
+    """A derivation tree node. Once a tree is built its nodes are treated as immutable,
+    which lets trees produced by the genetic operators share untouched subtrees and lets
+    each node cache the text its subtree renders to (`_text`)."""
+    __slots__ = ("symbol", "children", "_text")
+    def __init__(self, symbol, children=()):
         self.symbol = symbol
-        self.children = []
+        self.children = children
+        self._text = None
 
 
 class DerivationTree:
-    __slots__ = ("grammar", "root_node")
-    def __init__(self, grammar, root_symbol=None):
+    __slots__ = ("grammar", "_root", "_index", "_code")
+    def __init__(self, grammar, root_symbol=None, root_node=None):
         self.grammar = grammar
-        self.root_node = Node(root_symbol or grammar.start_symbol)
+        self._root = root_node or Node(root_symbol or grammar.start_symbol)
+        self._index = None
+        self._code = None
+
+    @classmethod
+    def from_code(cls, grammar, rules, sizes):
+        """Tree of a preorder (rules, sizes) encoding (see `rule_code`), as int32 arrays.
+
+        The nodes are only built when something needs them; `string()` renders straight
+        from the encoding, so loading a checkpoint does not allocate them for individuals
+        that are never bred from.
+        """
+        tree = cls.__new__(cls)
+        tree.grammar, tree._root, tree._index, tree._code = grammar, None, None, (rules, sizes)
+        return tree
+
+    @property
+    def root_node(self):
+        if self._root is None:
+            self._root = _decode_subtree(self.grammar.rule_table(), self._code[0])
+        return self._root
 
     def _expand(self, node, rhs_symbols):
         new_nodes = [Node(sym) for sym in rhs_symbols]
-        node.children = new_nodes
+        node.children = tuple(new_nodes)
         return new_nodes
 
+    def node_at(self, path):
+        node = self.root_node
+        for i in path:
+            node = node.children[i]
+        return node
+
+    def node_index(self):
+        """{NonterminalSymbol: [path, ...]} of every expanded node, built on first use and cached.
+
+        Symbols appear in rule-table order and each list is in preorder (the lexicographic
+        order of the paths), so equal trees have equal indexes however they were built; the
+        genetic operators rely on that for reproducibility. Trees derived with
+        `replace_subtree` inherit an updated copy instead of rebuilding it.
+        """
+        if self._index is None:
+            index = {}
+            _index_subtree(index, self.root_node, ())
+            self._index = _in_rule_order(self.grammar, index)
+        return self._index
+
+    def rule_code(self):
+        """(rules, sizes) as int32 arrays: the preorder rule-id encoding used by LinearTree.
+
+        Recorded by `generate_bounded`, otherwise built on first use, and cached; trees
+        derived with `replace_subtree` then get theirs by splicing instead of walking the
+        whole tree.
+        """
+        if self._code is None:
+            self._code = _encode_subtree(self.grammar.rule_table(), self.root_node)
+        return self._code
+
+    def replace_subtree(self, path, children):
+        """Returns a new tree in which the node at `path` (child indices from the root) has `children`.
+
+        Path copying: only the nodes from the root to that point are allocated anew; every
+        other subtree is shared with this tree, which is left unchanged.
+        """
+        spine = [self.root_node]
+        for i in path:
+            spine.append(spine[-1].children[i])
+        new_node = Node(spine[-1].symbol, tuple(children))
+        replaced = new_node
+        for parent, i in zip(reversed(spine[:-1]), reversed(path)):
+            siblings = list(parent.children)
+            siblings[i] = new_node
+            new_node = Node(parent.symbol, tuple(siblings))
+        tree = DerivationTree(self.grammar, root_node=new_node)
+
+        if self._index is not None:
+            # Only the symbols of the old and new subtrees change; every other list is shared.
+            # The paths under `path` form one contiguous run of each sorted list.
+            removed, added = {}, {}
+            _index_subtree(removed, spine[-1], path)
+            _index_subtree(added, replaced, path)
+            after = path[:-1] + (path[-1] + 1,) if path else None
+            index = dict(self._index)
+            new_symbols = False
+            for sym in removed.keys() | added.keys():
+                paths = index.get(sym)
+                if paths is None:
+                    index[sym] = added[sym]
+                    new_symbols = True
+                    continue
+                lo = _bisect_left(paths, path)
+                hi = _bisect_left(paths, after, lo) if after is not None else len(paths)
+                paths = paths[:lo] + added.get(sym, []) + paths[hi:]
+                if paths: index[sym] = paths
+                else: del index[sym]
+            tree._index = _in_rule_order(self.grammar, index) if new_symbols else index
+
+        if self._code is not None:
+            rules, sizes = self._code
+            entry, ancestors, node = 0, [], self.root_node
+            for i in path:
+                ancestors.append(entry)
+                entry += 1
+                for sibling in node.children[:i]:
+                    if isinstance(sibling.symbol, NonterminalSymbol):
+                        entry += sizes[entry]
+                node = node.children[i]
+            end = entry + sizes[entry]
+            new_rules, new_sizes = _encode_subtree(self.grammar.rule_table(), replaced)
+            sizes = sizes[:entry] + new_sizes + sizes[end:]
+            delta = len(new_rules) - (end - entry)
+            for a in ancestors:
+                sizes[a] += delta
+            tree._code = (rules[:entry] + new_rules + rules[end:], sizes)
+        return tree
+
     def string(self):
-        
-        nodes = []
-        stack = [self.root_node]
+        """Concatenated leaf texts, joined from the cached fragments of unchanged subtrees.
+
+        Only nodes without a cached fragment (e.g. the spine allocated by replace_subtree)
+        are rendered, so the cost follows what changed rather than the tree size.
+        """
+        root = self._root
+        if root is None:
+            from LinearTree import _render  # LinearTree imports this module
+            return _render(self.grammar, self._code[0])
+        if not root.children: return root.symbol.text
+        if root._text is not None: return root._text
+        stack = [root]
         while stack:
-            node = stack.pop()
-            if node.children:
-                stack.extend(reversed(node.children))
-            else:
-                nodes.append(node)
-        return "".join(nd.symbol.text for nd in nodes)
+            node = stack[-1]
+            pending = [c for c in node.children if c.children and c._text is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            node._text = "".join(c._text if c.children else c.symbol.text for c in node.children)
+            stack.pop()
+        return root._text
+
+    def size(self, path=()):
+        """Number of expanded nodes in the subtree at `path` (the whole tree by default)."""
+        index = self.node_index()
+        if not path:
+            return sum(map(len, index.values()))
+        after = path[:-1] + (path[-1] + 1,)
+        return sum(_bisect_left(paths, after) - _bisect_left(paths, path) for paths in index.values())
+
+    def depth(self):
+        """Number of expanded nodes on the longest root-to-leaf path (0 for an unexpanded root)."""
+        return max((len(path) + 1 for paths in self.node_index().values() for path in paths), default=0)
 
     def to_parenthesis(self):
         def _recurse(node):
@@ -69,6 +211,15 @@ class Grammar:
         self._cache = {}
         if bnf_text: self.from_bnf_text(bnf_text)
 
+    def __getstate__(self):
+        # The cache may hold unpicklable parsers; it is rebuilt on demand.
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot != "_cache"}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self._cache = {}
+
     def from_bnf_text(self, bnf_text):
         lines = [l.strip() for l in bnf_text.strip().split('\n') if l.strip()]
         for line in lines:
@@ -94,142 +245,689 @@ class Grammar:
                     symbols.append(sym)
                 self.production_rules[lhs].append(symbols)
 
-    def generate_derivation_tree(self, max_expansions=100, reduction_factor=0.9, root_symbol=None):
-        """Generates a tree using weights that reduce over time to force termination."""
-        initial_weights = {lhs: [1.0 for _ in rhs_list] for lhs, rhs_list in self.production_rules.items()}
+    def generate_derivation_tree(self, max_expansions=100, reduction_factor=0.9, root_symbol=None, rng=None):
+        """Generates a tree using weights that reduce over time to force termination.
+
+        Every node sees the weights of its parent with the parent's chosen rule scaled by
+        `reduction_factor`. Only the nonterminals whose weights were reduced on the path are
+        stored per node (copy-on-write), with cumulative weights precomputed for the choice.
+        """
+        uniform = (rng or _random).uniform
+        initial = self._lookup_or_calc("generation", "weights", _calc_initial_weights, self)
+        rules_of = self.production_rules
         dt = DerivationTree(self, root_symbol)
-        # Stack stores (node, current_weights)
-        stack = [(dt.root_node, initial_weights)]
+        # Depth-first, leftmost nonterminal first; each entry carries the weight overrides of its path.
+        stack = [(dt.root_node, {})]
         expansion_counter = 0
-        
+
         while stack and expansion_counter < max_expansions:
-            curr_node, weights = stack.pop(0) 
+            curr_node, overrides = stack.pop()
             lhs = curr_node.symbol
-            if not isinstance(lhs, NonterminalSymbol): continue
-            
-            rules = self.production_rules.get(lhs, [])
+            rules = rules_of.get(lhs)
             if not rules: continue
-            
-            # Weighted random choice
-            rule_weights = weights[lhs]
-            total_w = sum(rule_weights)
-            r = _random.uniform(0, total_w)
-            upto = 0
-            chosen_idx = 0
-            for i, w in enumerate(rule_weights):
-                if upto + w >= r:
-                    chosen_idx = i
-                    break
-                upto += w
-            
-            chosen_rule = rules[chosen_idx]
-            # Reduce weight of the chosen rule for future recursive calls to prevent infinite loops
-            new_weights = _copy.deepcopy(weights)
-            new_weights[lhs][chosen_idx] *= reduction_factor
-            
-            new_nodes = dt._expand(curr_node, chosen_rule)
-            new_items = [(n, new_weights) for n in new_nodes if isinstance(n.symbol, NonterminalSymbol)]
-            stack = new_items + stack 
+
+            # Weighted random choice: first rule whose cumulative weight reaches r
+            weights, cumulative, total_w = overrides.get(lhs) or initial[lhs]
+            chosen_idx = _bisect_left(cumulative, uniform(0, total_w))
+            if chosen_idx == len(cumulative): chosen_idx = 0
+
+            children = tuple(Node(sym) for sym in rules[chosen_idx])
+            curr_node.children = children
+            new_items = [n for n in children if isinstance(n.symbol, NonterminalSymbol)]
+            if new_items:
+                # Reduce weight of the chosen rule for the subtree to prevent infinite loops
+                reduced = list(weights)
+                reduced[chosen_idx] *= reduction_factor
+                child_overrides = dict(overrides)
+                child_overrides[lhs] = _weight_entry(reduced)
+                stack.extend((n, child_overrides) for n in reversed(new_items))
             expansion_counter += 1
         return dt
 
+    def generate_many(self, n, seed=None, max_expansions=100, reduction_factor=0.9, root_symbol=None):
+        """Generates `n` derivation trees from a private RNG, reproducible for a given seed."""
+        rng = _random.Random(seed)
+        generate = self.generate_derivation_tree
+        # Trees are acyclic, so the cyclic GC has nothing to find among the new nodes; pausing it
+        # avoids repeated full scans of a fast-growing heap.
+        gc_enabled = _gc.isenabled()
+        _gc.disable()
+        try:
+            return [generate(max_expansions, reduction_factor, root_symbol, rng) for _ in range(n)]
+        finally:
+            if gc_enabled: _gc.enable()
+
+    def analysis(self):
+        """Minimal derivation sizes and depths, productivity, reachability and recursion (cached)."""
+        return self._lookup_or_calc("analysis", None, GrammarAnalysis, self)
+
+    def generate_bounded(self, max_size=None, max_depth=None, method="grow", root_symbol=None, rng=None):
+        """Generates a complete tree with at most `max_size` expanded nodes and `max_depth` levels.
+
+        A rule is only chosen if the smallest completion of everything still open fits the
+        remaining budget (see `GrammarAnalysis.min_size_within`), so generation never
+        stops with unexpanded nonterminals. `method` picks among the rules that fit:
+        "grow" uniformly, "full" preferring recursive rules so every branch runs to the
+        bound, and "ptc2" draws a target size uniformly from [smallest, max_size] and
+        expands random frontier nodes with growing rules until it is reached (Luke's PTC2).
+        Raises ValueError if no complete derivation fits the bounds.
+        """
+        return _generate_bounded(self, max_size, max_depth, method, root_symbol, rng or _random)
+
+    def generate_ramped(self, n, max_depth=6, min_depth=None, max_size=None, seed=None, rng=None):
+        """Ramped half-and-half: `n` trees spread evenly over the depth bounds min_depth..max_depth,
+        alternately grown with "grow" and "full". `min_depth` defaults to the smallest depth
+        the start symbol can reach. Uses a private RNG when `seed` is given."""
+        rng = _random.Random(seed) if seed is not None else rng or _random
+        lowest = self.analysis().min_depth.get(self.start_symbol, float("inf"))
+        first = max(min_depth or lowest, lowest)
+        if first > max_depth:
+            raise ValueError(f"No derivation of <{self.start_symbol.text}> fits in depth {max_depth}")
+        depths = range(first, max_depth + 1)
+        return [_generate_bounded(self, max_size, depths[i % len(depths)],
+                                  "grow" if (i // len(depths)) % 2 == 0 else "full", None, rng)
+                for i in range(n)]
+
+    def count_derivations(self, root_symbol=None):
+        """Number of complete derivation trees of `root_symbol` (default: the start symbol), or
+        `inf` if the language is infinite. Memoized per nonterminal; for an ambiguous grammar
+        this counts trees, not distinct strings."""
+        counts = self._lookup_or_calc("counting", None, _calc_counts, self)[0]
+        return counts[self.rule_table().nt_index[root_symbol or self.start_symbol]]
+
+    def is_finite(self, root_symbol=None):
+        return self.count_derivations(root_symbol) != float("inf")
+
+    def unrank(self, index, root_symbol=None):
+        """The derivation tree numbered `index` in [0, count_derivations(root_symbol)).
+
+        Trees are numbered by the alternative chosen at the root (in BNF order), then by
+        their nonterminal children as mixed-radix digits, the first child most significant.
+        """
+        counts, rule_counts = self._lookup_or_calc("counting", None, _calc_counts, self)
+        table = self.rule_table()
+        nt_index, rules_of = table.nt_index, table.rules_of
+        dt = DerivationTree(self, root_symbol)
+        total = counts[nt_index[dt.root_node.symbol]]
+        if total == float("inf"):
+            raise ValueError(f"<{dt.root_node.symbol.text}> has infinitely many derivations")
+        if not 0 <= index < total:
+            raise IndexError(f"Derivation index {index} out of range for {total} derivations")
+        stack = [(dt.root_node, index)]
+        while stack:
+            node, i = stack.pop()
+            for rule in rules_of[node.symbol]:
+                if i < rule_counts[rule]: break
+                i -= rule_counts[rule]
+            children = tuple(Node(sym) for sym in table.rules[rule][1])
+            node.children = children
+            for child in reversed(children):  # least significant digit last
+                if isinstance(child.symbol, NonterminalSymbol):
+                    i, digit = divmod(i, counts[nt_index[child.symbol]])
+                    stack.append((child, digit))
+        return dt
+
+    def rank(self, tree):
+        """Index of a complete derivation tree in the numbering used by `unrank`."""
+        counts, rule_counts = self._lookup_or_calc("counting", None, _calc_counts, self)
+        table = self.rule_table()
+        nt_index, rule_index = table.nt_index, table.rule_index
+        if counts[nt_index[tree.root_node.symbol]] == float("inf"):
+            raise ValueError(f"<{tree.root_node.symbol.text}> has infinitely many derivations")
+        order, stack = [], [tree.root_node]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(c for c in node.children if isinstance(c.symbol, NonterminalSymbol))
+        ranks = {}
+        for node in reversed(order):  # children before their parent
+            if not node.children:
+                raise ValueError(f"Node <{node.symbol.text}> is not expanded")
+            rule = rule_index.get((node.symbol, tuple(c.symbol for c in node.children)))
+            if rule is None:
+                raise ValueError(f"Node {node.symbol} is not expanded by a rule of this grammar")
+            value = 0
+            for child in node.children:
+                if isinstance(child.symbol, NonterminalSymbol):
+                    value = value * counts[nt_index[child.symbol]] + ranks[id(child)]
+            for earlier in table.rules_of[node.symbol]:
+                if earlier == rule: break
+                value += rule_counts[earlier]
+            ranks[id(node)] = value
+        return ranks[id(tree.root_node)]
+
     def parse_string(self, string, parser="earley"):
+        """DerivationTree of `string`; raises ValueError if the grammar does not derive it.
+
+        `parser` is "earley", "lalr" or "auto" (LALR when the grammar has no LALR(1)
+        conflicts, otherwise Earley). LALR tokenizes with a contextual lexer, which can
+        reject valid strings whose terminals overlap (e.g. "a" | "ab" followed by "b");
+        "auto" retries those with Earley, "lalr" reports them as errors.
+        """
         return parse_string_internal(self, string, parser)
 
+    def parse_many(self, strings, parser="earley"):
+        """Yields (tree, None) or (None, ValueError) for each string of an iterable, in order.
+
+        Inputs are consumed lazily and a failing string does not stop the rest, so this can
+        seed a population straight from a large file of strategy sources.
+        """
+        return parse_many_internal(self, strings, parser)
+
+    def rule_table(self):
+        """Stable global numbering of nonterminals and production rules (cached)."""
+        return self._lookup_or_calc("rules", None, RuleTable, self)
+
+    def fingerprint(self):
+        """Hash of the numbered rule table; equal fingerprints decode rule ids identically."""
+        return self._lookup_or_calc("rules", "fingerprint", _calc_fingerprint, self)
+
     def _lookup_or_calc(self, category, key, func, *args):
         full_key = (category, key)
         if full_key not in self._cache:
             self._cache[full_key] = func(*args)
         return self._cache[full_key]
 
-# --- Visualization Helper ---
+def _index_subtree(index, node, path):
+    """Adds the path of every expanded node under `node` (located at `path`) to `index`."""
+    stack = [(path, node)] if node.children else []
+    while stack:
+        path, curr = stack.pop()
+        index.setdefault(curr.symbol, []).append(path)
+        for i in range(len(curr.children) - 1, -1, -1):
+            if curr.children[i].children:
+                stack.append((path + (i,), curr.children[i]))
+
+def _in_rule_order(grammar, index):
+    nt_index = grammar.rule_table().nt_index
+    return {sym: index[sym] for sym in sorted(index, key=nt_index.__getitem__)}
+
+def _encode_subtree(table, node):
+    """Preorder (rules, sizes) int32 arrays of the nonterminal nodes under `node`.
+
+    An expanded node holds its rule id, an unexpanded one `-1 - nonterminal id`; sizes[i]
+    counts the entries of the subtree starting at i.
+    """
+    rule_index, nt_index = table.rule_index, table.nt_index
+    rules, sizes = _array("i"), _array("i")
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is int:  # all entries of this subtree have been emitted
+            sizes[item] = len(rules) - item
+            continue
+        idx = len(rules)
+        children = item.children
+        if children:
+            rule = rule_index.get((item.symbol, tuple([child.symbol for child in children])))
+            if rule is None:
+                raise ValueError(f"Node {item.symbol} is not expanded by a rule of this grammar")
+            rules.append(rule)
+            sizes.append(1)
+            stack.append(idx)
+            stack.extend([child for child in reversed(children) if child.symbol.__class__ is NonterminalSymbol])
+        else:
+            rules.append(-1 - nt_index[item.symbol])
+            sizes.append(1)
+    return rules, sizes
+
+def _arities(grammar):
+    """Per rule: number of nonterminal children."""
+    def calc():
+        return [sum(isinstance(sym, NonterminalSymbol) for sym in rhs)
+                for _, rhs in grammar.rule_table().rules]
+    return grammar._lookup_or_calc("rules", "arities", calc)
 
-class _AutoCounter:
-    def __init__(self):
-        self.map = {}
-        self.cnt = 0
-    def __getitem__(self, key):
-        if key not in self.map:
-            self.map[key] = self.cnt
-            self.cnt += 1
-        return self.map[key]
+def _code_sizes(arity, rules):
+    """Subtree sizes of a preorder rule-id sequence; they follow from the rule arities."""
+    sizes = _array("i", rules)
+    stack = []  # [entry, children still to come]
+    for i, rule in enumerate(rules):
+        stack.append([i, arity[rule] if rule >= 0 else 0])
+        while stack and stack[-1][1] == 0:
+            j = stack.pop()[0]
+            sizes[j] = i - j + 1
+            if stack: stack[-1][1] -= 1
+    return sizes
+
+def _decode_subtree(table, rules):
+    """Root node of the tree encoded by the preorder rule ids `rules` (inverse of _encode_subtree)."""
+    first = rules[0]
+    root = Node(table.nonterminals[-1 - first] if first < 0 else table.rules[first][0])
+    pending = [root]
+    for rule in rules:
+        node = pending.pop()
+        if rule < 0:
+            continue
+        children = tuple([Node(sym) for sym in table.rules[rule][1]])
+        node.children = children
+        pending.extend([c for c in reversed(children) if c.symbol.__class__ is NonterminalSymbol])
+    return root
+
+def _weight_entry(weights):
+    """(weights, cumulative weights, total) for one nonterminal's alternatives."""
+    return tuple(weights), tuple(_accumulate(weights)), sum(weights)
+
+def _calc_initial_weights(grammar):
+    return {lhs: _weight_entry([1.0] * len(rhs_list)) for lhs, rhs_list in grammar.production_rules.items()}
+
+def _calc_fingerprint(grammar):
+    table = grammar.rule_table()
+    canonical = repr([(lhs.text, [(type(sym).__name__, sym.text) for sym in rhs]) for lhs, rhs in table.rules]
+                     + [nt.text for nt in table.nonterminals])
+    return _hashlib.sha1(canonical.encode()).hexdigest()
+
+class RuleTable:
+    """Integer ids for a grammar's nonterminals and production rules.
+
+    Ids follow the order of the BNF text (not set iteration order), so they are identical
+    in every process and run; compact genotype encodings rely on that.
+    """
+    __slots__ = ("nonterminals", "nt_index", "rules", "rule_lhs", "rule_index", "rules_of")
+
+    def __init__(self, grammar):
+        self.nonterminals = list(grammar.production_rules)
+        self.nonterminals += sorted(set(grammar.nonterminal_symbols) - set(self.nonterminals), key=lambda s: s.text)
+        self.nt_index = {nt: i for i, nt in enumerate(self.nonterminals)}
+        self.rules = []       # rule id -> (lhs, rhs)
+        self.rule_lhs = []    # rule id -> nonterminal id
+        self.rule_index = {}  # (lhs, rhs tuple) -> rule id
+        self.rules_of = {}    # lhs -> [rule ids] in alternative order
+        for lhs, rhs_list in grammar.production_rules.items():
+            ids = self.rules_of.setdefault(lhs, [])
+            for rhs in rhs_list:
+                rule_id = len(self.rules)
+                self.rules.append((lhs, rhs))
+                self.rule_lhs.append(self.nt_index[lhs])
+                self.rule_index.setdefault((lhs, tuple(rhs)), rule_id)
+                ids.append(rule_id)
+
+class GrammarAnalysis:
+    """Static facts about a grammar, computed once per grammar by `Grammar.analysis()`.
+
+    Sizes count expanded nodes (nonterminals), depths count expanded levels, so a rule
+    with only terminals on its right-hand side has size and depth 1. A nonterminal that
+    derives no finite program has size and depth `inf`; the rules that mention one are
+    unproductive and never used by the bounded generators. Reachability and recursion
+    follow productive rules only, i.e. the derivations that can actually complete.
+    """
+    __slots__ = ("min_size", "min_depth", "rule_min_size", "rule_min_depth", "productive",
+                 "unproductive_rules", "reachable", "recursive", "recursive_rules",
+                 "_children", "_lhs", "_nt_size", "_within", "_options")
+
+    def __init__(self, grammar):
+        table = grammar.rule_table()
+        nt_index, inf = table.nt_index, float("inf")
+        self._lhs = table.rule_lhs
+        self._children = [tuple(nt_index[sym] for sym in rhs if isinstance(sym, NonterminalSymbol))
+                          for _, rhs in table.rules]
+        size, depth = [inf] * len(table.nonterminals), [inf] * len(table.nonterminals)
+        changed = True
+        while changed:  # Bellman-Ford style relaxation; sizes only shrink, so this terminates
+            changed = False
+            for rule, lhs in enumerate(table.rule_lhs):
+                kids = self._children[rule]
+                s = 1 + sum(size[c] for c in kids)
+                d = 1 + max((depth[c] for c in kids), default=0)
+                if s < size[lhs]: size[lhs], changed = s, True
+                if d < depth[lhs]: depth[lhs], changed = d, True
+        self._nt_size = size
+        self.rule_min_size = [1 + sum(size[c] for c in kids) for kids in self._children]
+        self.rule_min_depth = [1 + max((depth[c] for c in kids), default=0) for kids in self._children]
+        self.min_size = {nt: size[i] for i, nt in enumerate(table.nonterminals)}
+        self.min_depth = {nt: depth[i] for i, nt in enumerate(table.nonterminals)}
+        self.productive = frozenset(nt for nt, s in self.min_size.items() if s < inf)
+        self.unproductive_rules = [r for r, s in enumerate(self.rule_min_size) if s == inf]
+
+        # Edges lhs -> child of productive rules, and the nonterminals reachable in one or more steps.
+        edges = [set() for _ in table.nonterminals]
+        for rule, lhs in enumerate(table.rule_lhs):
+            if self.rule_min_size[rule] < inf:
+                edges[lhs].update(self._children[rule])
+        reach = []
+        for start in range(len(edges)):
+            seen, stack = set(), list(edges[start])
+            while stack:
+                nt = stack.pop()
+                if nt not in seen:
+                    seen.add(nt)
+                    stack.extend(edges[nt])
+            reach.append(seen)
+        start = nt_index.get(grammar.start_symbol)
+        self.reachable = frozenset(table.nonterminals[i] for i in reach[start] | {start}) if start is not None else frozenset()
+        self.recursive = frozenset(nt for i, nt in enumerate(table.nonterminals) if i in reach[i])
+        self.recursive_rules = frozenset(
+            rule for rule, lhs in enumerate(table.rule_lhs)
+            if self.rule_min_size[rule] < inf and any(c == lhs or lhs in reach[c] for c in self._children[rule]))
+        self._within = [[inf] * len(size)]  # _within[d][nt id]: min size using at most d levels
+        self._options = {}
+
+    def min_size_within(self, depth):
+        """Per nonterminal id, the smallest size of a derivation at most `depth` levels deep."""
+        if depth is None:
+            return self._nt_size
+        within = self._within
+        while len(within) <= depth:
+            previous = within[-1]
+            current = list(previous)
+            for lhs, kids in zip(self._lhs, self._children):
+                s = 1 + sum(previous[c] for c in kids)
+                if s < current[lhs]: current[lhs] = s
+            if current == previous:  # deeper bounds no longer help
+                return current
+            within.append(current)
+        return within[depth]
+
+    def options(self, nt, depth, rules):
+        """[(rule id, extra size over the smallest completion)] of the `rules` of nonterminal id
+        `nt` that complete within `depth` levels (None: unbounded), cached per (nt, depth)."""
+        key = (nt, depth)
+        found = self._options.get(key)
+        if found is None:
+            below = self.min_size_within(None if depth is None else depth - 1)
+            base = self.min_size_within(depth)[nt]
+            found = []
+            for rule in rules:
+                cost = 1 + sum(below[c] for c in self._children[rule])
+                if cost != float("inf"):
+                    found.append((rule, cost - base))
+            self._options[key] = found
+        return found
+
+def _calc_counts(grammar):
+    """(derivations per nonterminal id, derivations per rule id); `inf` for infinite languages.
+
+    A nonterminal derives infinitely many trees if it is recursive or a productive rule of
+    it uses such a nonterminal; the others form an acyclic graph and are counted bottom-up.
+    """
+    table = grammar.rule_table()
+    analysis = grammar.analysis()
+    inf = float("inf")
+    children, productive = analysis._children, [s != inf for s in analysis.rule_min_size]
+    counts = [inf if nt in analysis.recursive else None for nt in table.nonterminals]
+    for i, nt in enumerate(table.nonterminals):
+        if nt not in analysis.productive:
+            counts[i] = 0
+    changed = True
+    while changed:
+        changed = False
+        for rule, lhs in enumerate(table.rule_lhs):
+            if counts[lhs] != inf and productive[rule] and any(counts[c] == inf for c in children[rule]):
+                counts[lhs], changed = inf, True
+    rule_counts = [None] * len(table.rules)
+    pending = [i for i, c in enumerate(counts) if c is None]
+    while pending:
+        left = []
+        for nt in pending:
+            ids = table.rules_of[table.nonterminals[nt]]
+            if any(productive[r] and counts[c] is None for r in ids for c in children[r]):
+                left.append(nt)
+                continue
+            total = 0
+            for r in ids:
+                n = 0
+                if productive[r]:
+                    n = 1
+                    for c in children[r]: n *= counts[c]
+                rule_counts[r] = n
+                total += n
+            counts[nt] = total
+        if len(left) == len(pending):
+            raise AssertionError("cycle among finite nonterminals")  # excluded by the recursion analysis
+        pending = left
+    for rule, lhs in enumerate(table.rule_lhs):
+        if rule_counts[rule] is None:
+            rule_counts[rule] = 0 if not productive[rule] else inf
+    return counts, rule_counts
+
+# --- Bounded generation ---
+
+GENERATION_METHODS = ("grow", "full", "ptc2")
+
+def _generate_bounded(grammar, max_size, max_depth, method, root_symbol, rng):
+    if method not in GENERATION_METHODS:
+        raise ValueError(f"Unknown generation method {method!r}; expected one of {GENERATION_METHODS}")
+    if max_size is None and (max_depth is None or method == "ptc2"):
+        raise ValueError(f"{method!r} generation needs a max_size" + ("" if method == "ptc2" else " or max_depth"))
+    analysis = grammar.analysis()
+    table = grammar.rule_table()
+    nt_index, rules_of, options = table.nt_index, table.rules_of, analysis.options
+    recursive_rules = analysis.recursive_rules
+    inf = float("inf")
+
+    dt = DerivationTree(grammar, root_symbol)
+    root = dt.root_node
+    need = analysis.min_size_within(max_depth)[nt_index[root.symbol]]
+    if need > (inf if max_size is None else max_size):
+        raise ValueError(f"No complete derivation of <{root.symbol.text}> fits in "
+                         f"{max_size} expansions and depth {max_depth}")
+    limit = inf if max_size is None else rng.randint(need, max_size) if method == "ptc2" else max_size
+    committed = need  # expanded nodes plus the smallest completion of every open one
+    # The rule code is recorded as rules are chosen, so `rule_code()` never walks the tree:
+    # "grow" and "full" expand depth first, leftmost child first, i.e. in preorder; the
+    # random frontier order of "ptc2" is put in preorder once the tree is complete.
+    preorder = method != "ptc2"
+    rules, chosen = _array("i"), {}
+    open_nodes = [(root, max_depth)]
+    while open_nodes:
+        if method == "ptc2":  # expand a random frontier node
+            i = rng.randrange(len(open_nodes))
+            open_nodes[i], open_nodes[-1] = open_nodes[-1], open_nodes[i]
+        node, depth = open_nodes.pop()
+        lhs = node.symbol
+        slack = limit - committed
+        fits = [f for f in options(nt_index[lhs], depth, rules_of[lhs]) if f[1] <= slack]
+        if method != "grow":
+            # "full" keeps recursing while it fits; "ptc2" keeps growing until the target size.
+            growing = [f for f in fits if (f[0] in recursive_rules if method == "full" else f[1] > 0)]
+            if growing: fits = growing
+        rule, delta = fits[rng.randrange(len(fits))]
+        committed += delta
+        if preorder: rules.append(rule)
+        else: chosen[id(node)] = rule
+        children = tuple(Node(sym) for sym in table.rules[rule][1])
+        node.children = children
+        child_depth = None if depth is None else depth - 1
+        open_nodes.extend((c, child_depth) for c in reversed(children) if isinstance(c.symbol, NonterminalSymbol))
+    if not preorder:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            rules.append(chosen[id(node)])
+            stack.extend([c for c in reversed(node.children) if c.symbol.__class__ is NonterminalSymbol])
+    dt._code = (rules, _code_sizes(_arities(grammar), rules))
+    return dt
+
+# --- Visualization Helper ---
 
 def create_graphviz_tree(tree, fontname="Arial", fontsize="12"):
+    from graphviz import Digraph  # only needed for plotting; keeps `import Grammar` light
     dot = Digraph(node_attr={'fontname': fontname, 'fontsize': fontsize})
-    cnt = _AutoCounter()
-    stack = [tree.root_node]
+    # Ids are handed out per visit, not per Node object: trees may share a subtree in several places.
+    cnt = 0
+    stack = [(tree.root_node, "0")]
     while stack:
-        curr = stack.pop(0)
-        curr_id = str(cnt[curr])
+        curr, curr_id = stack.pop(0)
         label = curr.symbol.text if curr.symbol.text else "ε"
         if isinstance(curr.symbol, NonterminalSymbol):
             dot.node(curr_id, label, shape="box", style="filled", fillcolor="#ffe3e3")
         else:
             dot.node(curr_id, label, shape="ellipse", style="filled", fillcolor="#e3ffe3")
         for child in curr.children:
-            child_id = str(cnt[child])
+            cnt += 1
+            child_id = str(cnt)
             dot.edge(curr_id, child_id)
-            stack.append(child)
+            stack.append((child, child_id))
     return dot
 
 # --- Parsing Logic ---
+# lark is imported by the functions that build parsers, so programs that never parse skip it.
 
-def parse_string_internal(grammar, string, parser_type):
-    # Cache the Lark parser and maps
-    lark_parser, nt_map_rev = grammar._lookup_or_calc(
-        "lark", parser_type, _calc_lark_components, grammar, parser_type
-    )
+# Directory for built LALR parsers, one file per grammar fingerprint (None disables). The files
+# are pickles, so the default is per user and the cache is only used while nobody else can write it.
+LARK_CACHE_DIR = _os.environ.get("GGGP_LARK_CACHE", _os.path.join(
+    _os.environ.get("XDG_CACHE_HOME") or _os.path.join(_os.path.expanduser("~"), ".cache"), "gggp-lark"))
+PARSERS = ("auto", "lalr", "earley")
 
+def parse_string_internal(grammar, string, parser_type):
+    components = _lark_components(grammar, parser_type)
     try:
-        lark_tree = lark_parser.parse(string)
-        return _lark_tree_to_dt(grammar, lark_tree, nt_map_rev)
+        return _parse_with(grammar, components, string, parser_type)
     except Exception as e:
         raise ValueError(f"Parsing failed: {e}")
 
-def _calc_lark_components(grammar, parser_type):
-    nt_map_fwd = {nt: f"nt{i}" for i, nt in enumerate(grammar.nonterminal_symbols)}
-    nt_map_rev = {f"nt{i}": nt for i, nt in enumerate(grammar.nonterminal_symbols)}
-    
-    lark_rules = []
-    lark_rules.append("%import common.WS")
-    lark_rules.append("%ignore WS")
-    for lhs, rhs_list in grammar.production_rules.items():
+def parse_many_internal(grammar, strings, parser_type):
+    components = _lark_components(grammar, parser_type)  # fail now on a bad parser, not on first use
+    return _parse_stream(grammar, components, strings, parser_type)
+
+def _parse_stream(grammar, components, strings, parser_type):
+    for string in strings:
+        try:
+            yield _parse_with(grammar, components, string, parser_type), None
+        except Exception as e:
+            yield None, ValueError(f"Parsing failed: {e}")
+
+def _parse_with(grammar, components, string, parser_type=None):
+    parser, builder = components
+    try:
+        result = parser.parse(string)
+    except Exception as e:
+        from lark.exceptions import UnexpectedInput
+        if parser_type != "auto" or parser.options.parser != "lalr" or not isinstance(e, UnexpectedInput):
+            raise
+        # The contextual lexer may split a valid string differently from the grammar; Earley decides.
+        parser, builder = _lark_components(grammar, "earley")
+        result = parser.parse(string)
+    root = result if isinstance(result, Node) else builder.build(result)
+    return DerivationTree(grammar, root_node=root)
+
+def _lark_components(grammar, parser_type):
+    """(Lark parser, node builder) for `parser_type`, cached on the grammar."""
+    if parser_type not in PARSERS:
+        raise ValueError(f"Unknown parser {parser_type!r}; expected one of {PARSERS}")
+    if parser_type == "auto":
+        return grammar._lookup_or_calc("lark", "auto", _calc_auto_components, grammar)
+    return grammar._lookup_or_calc("lark", parser_type, _calc_lark_components, grammar, parser_type)
+
+def _calc_auto_components(grammar):
+    from lark.exceptions import GrammarError
+    # The cache file is only written for grammars that passed the check below.
+    path = _lark_cache_path(grammar, "auto")
+    if path and _os.path.exists(path):
+        return _calc_lark_components(grammar, "lalr", path)
+    try:
+        components = _calc_lark_components(grammar, "lalr", None)
+        _check_lalr1(components[0])
+    except GrammarError:  # not LALR(1), e.g. ambiguous
+        return _lark_components(grammar, "earley")
+    except (ImportError, AttributeError, TypeError):  # the Lark internals the check uses have changed
+        return _lark_components(grammar, "earley")
+    return _calc_lark_components(grammar, "lalr", path) if path else components
+
+def _check_lalr1(parser):
+    """Raises GrammarError on shift/reduce conflicts, which Lark's LALR resolves silently.
+
+    (Lark's own `strict=True` does the same but also needs the optional interegular package.)
+    Uses Lark internals as of lark 1.3; "auto" falls back to Earley if they are missing.
+    """
+    from lark.common import ParserConf
+    from lark.parsers.lalr_analysis import LALR_Analyzer
+    conf = ParserConf(parser.rules, {}, list(parser.options.start))
+    LALR_Analyzer(conf, strict=True).compute_lalr()
+
+def _lark_grammar(grammar):
+    """Lark grammar text: nonterminal `nt<i>` and alternative alias `r<rule id>` from the rule table."""
+    table = grammar.rule_table()
+    # Whitespace between tokens is skipped, but at lower priority than the grammar's own
+    # literals so the lexer never splits off the indentation a terminal starts with.
+    lines = ["_WS.-1: /[ \\t\\f\\r\\n]+/", "%ignore _WS"]
+    for lhs, ids in table.rules_of.items():
         alts = []
-        for rhs in rhs_list:
+        for rule_id in ids:
             parts = []
-            for sym in rhs:
+            for sym in table.rules[rule_id][1]:
                 if isinstance(sym, NonterminalSymbol):
-                    parts.append(nt_map_fwd[sym])
+                    parts.append(f"nt{table.nt_index[sym]}")
                 else:
-                    escaped = sym.text.replace('"', '\\"')
+                    escaped = sym.text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
                     parts.append(f'"{escaped}"')
-            alts.append(" ".join(parts))
-        lark_rules.append(f"{nt_map_fwd[lhs]}: " + " | ".join(alts))
-    
-    lark_parser = _lark.Lark(
-        "\n".join(lark_rules), 
-        start=nt_map_fwd[grammar.start_symbol], 
-        parser=parser_type
-    )
-    return lark_parser, nt_map_rev
-
-def _lark_tree_to_dt(grammar, lark_tree, nt_map_rev):
-    dt = DerivationTree(grammar)
-    def build(lark_node, dt_node):
-        if isinstance(lark_node, _lark.Tree):
-            child_symbols = []
-            for child in lark_node.children:
-                if isinstance(child, _lark.Tree):
-                    child_symbols.append(nt_map_rev[child.data])
-                else:
-                    child_symbols.append(TerminalSymbol(str(child)))
-            
-            dt_children = dt._expand(dt_node, child_symbols)
-            for l_child, dt_child in zip(lark_node.children, dt_children):
-                build(l_child, dt_child)
-    
-    build(lark_tree, dt.root_node)
-    return dt
+            alts.append(" ".join(parts) + f" -> r{rule_id}")
+        lines.append(f"nt{table.nt_index[lhs]}: " + "\n    | ".join(alts))
+    return "\n".join(lines)
+
+def _lark_cache_path(grammar, tag):
+    """Cache file of `grammar` in LARK_CACHE_DIR, or None to parse without the cache: it is
+    disabled, cannot be created, or is not private to the current user (Lark unpickles it)."""
+    if not LARK_CACHE_DIR:
+        return None
+    path = _os.path.join(LARK_CACHE_DIR, f"{grammar.fingerprint()}-{tag}.lark")
+    try:
+        _os.makedirs(LARK_CACHE_DIR, mode=0o700, exist_ok=True)
+        if not _is_private(LARK_CACHE_DIR) or (_os.path.exists(path) and not _is_private(path)):
+            return None
+    except OSError:  # e.g. read-only: parse without the cache
+        return None
+    return path
+
+def _is_private(path):
+    """True if `path` belongs to the current user and nobody else may write to it."""
+    getuid = getattr(_os, "getuid", None)
+    if getuid is None:  # no POSIX owners or modes (Windows)
+        return True
+    info = _os.stat(path)
+    return info.st_uid == getuid() and not info.st_mode & 0o022
+
+def _calc_lark_components(grammar, parser_type, cache_path=False):
+    """(Lark parser, node builder). LALR tables are cached on disk under `cache_path`
+    (by default `<fingerprint>-lalr.lark` in LARK_CACHE_DIR; None disables)."""
+    builder = _NodeBuilder(grammar.rule_table())
+    options = {"start": f"nt{grammar.rule_table().nt_index[grammar.start_symbol]}", "parser": parser_type}
+    if parser_type == "lalr":
+        # LALR builds the nodes while it parses; Lark validates the cached tables against the grammar text.
+        options["transformer"] = builder
+        if cache_path is False:
+            cache_path = _lark_cache_path(grammar, "lalr")
+        if cache_path:
+            options["cache"] = cache_path
+    import lark  # imported on first parse, not with the module
+    return lark.Lark(_lark_grammar(grammar), **options), builder
+
+class _NodeBuilder:
+    """Turns Lark rule matches (`r<rule id>` with the nonterminal children) into `Node`s.
+
+    Terminal children come from the rule itself, since Lark drops anonymous tokens. Serves
+    as the LALR transformer (one `r<id>` callback per rule) and converts Earley trees with
+    `build`, bottom-up and without recursion.
+    """
+    def __init__(self, table):
+        self.callbacks = []
+        for rule_id, (lhs, rhs) in enumerate(table.rules):
+            callback = self._callback(lhs, rhs)
+            self.callbacks.append(callback)
+            setattr(self, f"r{rule_id}", callback)
+
+    @staticmethod
+    def _callback(lhs, rhs):
+        slots = [isinstance(sym, NonterminalSymbol) for sym in rhs]
+        def make(children):
+            it = iter(children)
+            return Node(lhs, tuple([next(it) if slot else Node(sym) for sym, slot in zip(rhs, slots)]))
+        return make
+
+    def build(self, tree):
+        callbacks = self.callbacks
+        stack, done = [(tree, False)], []
+        while stack:
+            item, expanded = stack.pop()
+            if expanded:
+                count = len(item.children)
+                children = done[len(done) - count:]
+                del done[len(done) - count:]
+                done.append(callbacks[int(item.data[1:])](children))
+            else:
+                stack.append((item, True))
+                stack.extend((child, False) for child in reversed(item.children))
+        return done[0]
 
 # --- Testing the implementation ---
 
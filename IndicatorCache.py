@@ -0,0 +1,156 @@
+import numpy as np
+from multiprocessing import shared_memory as _shared_memory
+from FitnessCache import fingerprint
+
+
+def dataset_id(df):
+    """Content hash of an OHLC DataFrame, stable across processes and runs."""
+    import pandas as pd
+    return fingerprint(pd.util.hash_pandas_object(df).values.tobytes())
+
+
+def slice_id(dataset, start, end):
+    """Dataset id for indicators computed on bars [start, end) of `dataset` alone (e.g. a walk-forward fold)."""
+    return f"{dataset}[{start}:{end}]"
+
+
+def slice_bounds(full, part):
+    """(start, end) if the rows of DataFrame `part` are full.iloc[start:end]; else None.
+
+    The index locates the candidate rows; the values must match too, so another ticker
+    (or a perturbed copy) on the same calendar is not mistaken for a slice of `full`.
+    """
+    if not len(part) or len(part) > len(full):
+        return None
+    try:
+        start = full.index.get_loc(part.index[0])
+    except KeyError:
+        return None
+    if not isinstance(start, int):  # duplicate timestamps
+        return None
+    end = start + len(part)
+    if end > len(full) or not full.index[start:end].equals(part.index):
+        return None
+    for column in part.columns:
+        if column not in full.columns:
+            return None
+        ours, theirs = full[column].values[start:end], part[column].values
+        try:
+            same = np.array_equal(ours, theirs, equal_nan=True)
+        except TypeError:  # non-numeric column
+            same = np.array_equal(ours, theirs)
+        if not same:
+            return None
+    return start, end
+
+
+class IndicatorCache:
+    """Read-only indicator arrays keyed by (indicator, source column, parameters, dataset id).
+
+    Arrays are filled lazily (or up front with `precompute`) and never written to again,
+    so they can be handed to strategies and to the vectorized engine without copying.
+    `share()` moves every array into one shared-memory block that worker processes map
+    with `attach()` instead of receiving their own copies.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+        self._shm = None
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def __contains__(self, key):
+        return key in self._arrays
+
+    def get(self, name, func, data, column, *params, dataset=None):
+        """Returns func(data[column], *params), computing and storing it on first use.
+
+        `dataset` names the data in the key; without it `dataset_id(data)` is computed,
+        which hashes the whole frame, so callers on a hot path pass it.
+        """
+        if dataset is None:
+            dataset = dataset_id(data)
+        key = (name, column, params, dataset)
+        values = self._arrays.get(key)
+        if values is None:
+            values = np.array(func(data[column], *params), dtype=float)
+            values.setflags(write=False)
+            self._arrays[key] = values
+        return values
+
+    def precompute(self, name, func, data, column, param_grid, dataset=None):
+        if dataset is None:
+            dataset = dataset_id(data)
+        for params in param_grid:
+            if not isinstance(params, tuple):
+                params = (params,)
+            self.get(name, func, data, column, *params, dataset=dataset)
+
+    def bind(self, name, func, data, column, dataset=None):
+        """Drop-in replacement for `func` inside generated strategies.
+
+        Calls whose source array is `data[column]`, or a leading prefix of it, are served
+        from the cache (a prefix gets a view of the cached array, which is only correct for
+        causal indicators such as moving averages); anything else is computed by `func`.
+        """
+        source = np.asarray(data[column], dtype=float)
+        if dataset is None:
+            dataset = dataset_id(data)
+
+        def cached(values, *params):
+            values_arr = np.asarray(values)
+            n = len(values_arr) if values_arr.ndim == 1 else -1
+            if 0 < n <= len(source) and np.array_equal(values_arr, source[:n]):
+                return self.get(name, func, data, column, *params, dataset=dataset)[:n]
+            return func(values, *params)
+
+        cached.__name__ = name
+        return cached
+
+    def share(self):
+        """Copies all arrays into one shared-memory block; returns the manifest for `attach`."""
+        self.close()
+        entries, offset = [], 0
+        for key, values in self._arrays.items():
+            entries.append((key, offset, values.shape))
+            offset += values.nbytes
+        self._shm = _shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for key, start, shape in entries:
+            view = np.ndarray(shape, dtype=float, buffer=self._shm.buf, offset=start)
+            view[...] = self._arrays[key]
+            view.setflags(write=False)
+            self._arrays[key] = view
+        return {"name": self._shm.name, "entries": entries}
+
+    def attach(self, manifest):
+        """Maps the arrays published by another process's `share()` into this cache (read-only)."""
+        if self._shm is not None and self._shm.name == manifest["name"]:
+            return self  # Forked worker: the mapping was inherited from the parent.
+        try:
+            # Python 3.13+: the creating process owns the block's lifetime.
+            self._shm = _shared_memory.SharedMemory(name=manifest["name"], track=False)
+        except TypeError:
+            self._shm = _shared_memory.SharedMemory(name=manifest["name"])
+        for key, start, shape in manifest["entries"]:
+            view = np.ndarray(shape, dtype=float, buffer=self._shm.buf, offset=start)
+            view.setflags(write=False)
+            self._arrays[key] = view
+        return self
+
+    def close(self, unlink=False):
+        """Detaches from the shared block (keeping private copies); `unlink` frees it system-wide."""
+        if self._shm is None:
+            return
+        for key, values in self._arrays.items():
+            if not values.flags.owndata:
+                private = values.copy()
+                private.setflags(write=False)
+                self._arrays[key] = private
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # Views handed out earlier are still alive; the mapping goes away with them.
+        if unlink:
+            self._shm.unlink()
+        self._shm = None
@@ -0,0 +1,173 @@
+"""Island-model evolution: N `EvolutionaryAlgorithm` populations in separate processes.
+
+Every `migration_interval` generations each island ranks its population, sends copies of
+its best `migrants` individuals to its neighbours and replaces its worst individuals with
+the ones it receives. Migration is synchronous, so an island waits for all of its
+neighbours before it breeds again; together with per-island seeds drawn from one master
+seed this makes a run reproducible regardless of process scheduling.
+
+Migrants travel as `LinearTree.to_bytes()` rule arrays plus their fitness, never as Node
+trees with the grammar attached; the receiver rebuilds the derivation tree from its own
+copy of the grammar and does not re-evaluate it.
+"""
+import multiprocessing as _mp
+import queue as _queue
+import random
+import time
+import traceback
+from EvolutionaryAlgorithm import EvolutionaryAlgorithm, Individual
+from LinearTree import LinearTree
+
+TOPOLOGIES = ("ring", "full")
+
+
+def island_seeds(seed, islands):
+    """Per-island RNG seeds derived from a master seed."""
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(islands)]
+
+
+def neighbours(island, islands, topology="ring"):
+    """Islands that `island` sends migrants to."""
+    if islands < 2:
+        return []
+    if topology == "ring":
+        return [(island + 1) % islands]
+    if topology == "full":
+        return [i for i in range(islands) if i != island]
+    raise ValueError(f"Unknown topology {topology!r}; expected one of {TOPOLOGIES}")
+
+
+def encode_migrant(individual):
+    return (LinearTree.from_derivation_tree(individual.genotype).to_bytes(), individual.fitness,
+            individual.fidelity)
+
+
+def decode_migrant(grammar, payload):
+    data, fitness, fidelity = payload
+    individual = Individual(LinearTree.from_bytes(grammar, data).to_derivation_tree())
+    individual.fitness = fitness
+    individual.fidelity = fidelity
+    return individual
+
+
+def _run_island(island, seed, config, inboxes, results):
+    """Process body: evolves one population, exchanging migrants through the inbox queues."""
+    try:
+        start = time.perf_counter()
+        random.seed(seed)
+        evaluator = config["evaluator_factory"]() if config["evaluator_factory"] else None
+        ea = EvolutionaryAlgorithm(config["grammar"], config["objective_function"],
+                                   config["population_size"], config["complexity_coefficient"],
+                                   evaluator=evaluator, verbose=False)
+        targets = neighbours(island, config["islands"], config["topology"])
+        sources = sum(island in neighbours(i, config["islands"], config["topology"])
+                      for i in range(config["islands"]))
+        count = min(config["migrants"], ea.pop_size - 1)
+        gens, interval = config["gens"], config["migration_interval"]
+        received = 0
+        early = []  # migrants a faster neighbour already sent for a later round
+
+        ea.initialize()
+        for g in range(gens):
+            ea.rank(g)
+            if (g + 1) % interval == 0 and g + 1 < gens and count and targets:
+                outgoing = [encode_migrant(ind) for ind in ea.population[:count]]
+                for target in targets:
+                    inboxes[target].put((g, island, outgoing))
+                arrivals = [m for m in early if m[0] == g]
+                early = [m for m in early if m[0] != g]
+                while len(arrivals) < sources:
+                    message = inboxes[island].get()
+                    (arrivals if message[0] == g else early).append(message)
+                # Order arrivals by sender so the outcome does not depend on timing.
+                arrivals.sort(key=lambda m: m[1])
+                immigrants = [decode_migrant(ea.grammar, p) for _, _, batch in arrivals for p in batch]
+                immigrants = immigrants[:ea.pop_size - 1]
+                received += len(immigrants)
+                ea.population[len(ea.population) - len(immigrants):] = immigrants
+                ea.population.sort(key=lambda x: (-x.fidelity, x.fitness))
+            if g + 1 < gens:
+                ea.breed()
+        ea.evaluator.close()
+
+        results.put((island, {
+            "seed": seed,
+            "best": encode_migrant(ea.population[0]),
+            "evaluations": ea.evaluations,
+            "immigrants": received,
+            "seconds": time.perf_counter() - start,
+        }))
+    except BaseException:
+        results.put((island, {"error": traceback.format_exc()}))
+
+
+class IslandModel:
+    """Runs `islands` independent populations with periodic migration between them.
+
+    `objective_function` (and `evaluator_factory`, a zero-argument callable building the
+    evaluator of each island) must be picklable under the "spawn" start method; with the
+    default "fork" on Linux any callable works.
+    """
+
+    def __init__(self, grammar, objective_function, islands=4, population_size=20,
+                 complexity_coefficient=0.1, migration_interval=5, migrants=2, topology="ring",
+                 seed=0, evaluator_factory=None, start_method=None):
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"Unknown topology {topology!r}; expected one of {TOPOLOGIES}")
+        if migration_interval < 1:
+            raise ValueError("migration_interval must be at least 1")
+        self.grammar = grammar
+        self.obj_func = objective_function
+        self.islands = islands
+        self.pop_size = population_size
+        self.penalty_coeff = complexity_coefficient
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.topology = topology
+        self.seed = seed
+        self.evaluator_factory = evaluator_factory
+        self.context = _mp.get_context(start_method)
+        self.results = []
+
+    def run(self, gens=10):
+        """Evolves all islands for `gens` generations and returns the best individual overall.
+
+        Per-island statistics (seed, best migrant payload, evaluations, immigrants received,
+        wall time) are left in `self.results`, indexed by island.
+        """
+        config = {
+            "grammar": self.grammar, "objective_function": self.obj_func, "islands": self.islands,
+            "population_size": self.pop_size, "complexity_coefficient": self.penalty_coeff,
+            "migration_interval": self.migration_interval, "migrants": self.migrants,
+            "topology": self.topology, "evaluator_factory": self.evaluator_factory, "gens": gens,
+        }
+        inboxes = [self.context.Queue() for _ in range(self.islands)]
+        results = self.context.Queue()
+        processes = [self.context.Process(target=_run_island, args=(i, seed, config, inboxes, results), daemon=True)
+                     for i, seed in enumerate(island_seeds(self.seed, self.islands))]
+        for p in processes:
+            p.start()
+
+        collected = {}
+        try:
+            while len(collected) < self.islands:
+                try:
+                    island, result = results.get(timeout=0.5)
+                except _queue.Empty:
+                    dead = [i for i, p in enumerate(processes) if p.exitcode not in (None, 0)]
+                    if dead:
+                        raise RuntimeError(f"Island {dead[0]} exited with code {processes[dead[0]].exitcode}")
+                    continue
+                if "error" in result:
+                    raise RuntimeError(f"Island {island} failed:\n{result['error']}")
+                collected[island] = result
+        finally:
+            for p in processes:
+                if len(collected) < self.islands:
+                    p.terminate()
+                p.join()
+
+        self.results = [collected[i] for i in range(self.islands)]
+        best = min(self.results, key=lambda r: (-r["best"][2], r["best"][1]))
+        return decode_migrant(self.grammar, best["best"])
@@ -0,0 +1,188 @@
+"""Exhaustive search over the language of a finite grammar.
+
+`trading_bnf` derives 9^4 SMA windows x 16 VAR pairs = 104976 programs. Random search
+re-samples programs it has already seen long before it has covered them; here every
+program is a derivation index in [0, Grammar.count_derivations()) and is visited exactly
+once. `order="sequential"` walks the indexes in order; `order="random"` walks a keyed
+pseudorandom permutation of them (a Feistel network with cycle walking, O(1) memory),
+which samples without replacement and, run to the end, is still exhaustive.
+
+Indexes are rendered straight to program text (no DerivationTree is built) and handed to
+the evaluator a batch at a time, so a `VectorizedEvaluator` or a pool evaluator sees large
+batches. Derivation indexes are never repeated; an ambiguous grammar can still render two
+of them to the same text, which is scored once per batch, and once per run with a fitness
+cache attached. A complete run yields the ground-truth optimum.
+"""
+import random
+from bisect import bisect_right
+from Evaluators import SerialEvaluator
+from Grammar import NonterminalSymbol, _calc_counts
+from LinearTree import _segments
+
+ORDERS = ("sequential", "random")
+
+
+class FeistelPermutation:
+    """Bijection on range(n) built from a 4-round Feistel network keyed by `seed`."""
+
+    def __init__(self, n, seed=0, rounds=4):
+        self.n = n
+        bits = max(2, (n - 1).bit_length())
+        bits += bits & 1
+        self._half = bits // 2
+        self._mask = (1 << self._half) - 1
+        rng = random.Random(seed)
+        self._keys = [rng.getrandbits(61) for _ in range(rounds)]
+
+    def _encrypt(self, x):
+        half, mask = self._half, self._mask
+        left, right = x >> half, x & mask
+        for key in self._keys:
+            # Integer tuple hashes do not depend on PYTHONHASHSEED.
+            left, right = right, left ^ (hash((key, right)) & mask)
+        return (left << half) | right
+
+    def __call__(self, i):
+        # The domain is at most 4n, so cycle walking takes a few steps on average.
+        x = self._encrypt(i)
+        while x >= self.n:
+            x = self._encrypt(x)
+        return x
+
+
+def _render_tables(grammar):
+    """Per nonterminal id: first index of each productive alternative and its rule id; per rule:
+    reversed rendered pieces (nonterminal ids in child slots) and child radices, last child first."""
+    def calc():
+        counts, rule_counts = grammar._lookup_or_calc("counting", None, _calc_counts, grammar)
+        table = grammar.rule_table()
+        starts, alternatives = [], []
+        for nt in table.nonterminals:
+            offsets, ids, total = [], [], 0
+            for rule in table.rules_of.get(nt, ()):
+                if rule_counts[rule]:
+                    offsets.append(total)
+                    ids.append(rule)
+                    total += rule_counts[rule]
+            starts.append(offsets)
+            alternatives.append(ids)
+        plans = []
+        for (lhs, rhs), pieces in zip(table.rules, _segments(grammar)):
+            kids = [table.nt_index[sym] for sym in rhs if isinstance(sym, NonterminalSymbol)]
+            slots = iter(kids)
+            plan = [p if p is not None else next(slots) for p in pieces]
+            plans.append((plan[::-1], [counts[k] for k in reversed(kids)]))
+        return starts, alternatives, plans
+    return grammar._lookup_or_calc("counting", "render", calc)
+
+
+class LanguageSearch:
+    def __init__(self, grammar, objective_function, evaluator=None, fitness_cache=None,
+                 batch_size=1024, root_symbol=None):
+        self.grammar = grammar
+        self.obj_func = objective_function
+        self.evaluator = evaluator or SerialEvaluator()
+        self.fitness_cache = fitness_cache
+        self.batch_size = batch_size
+        self.root_symbol = root_symbol or grammar.start_symbol
+        self.total = grammar.count_derivations(self.root_symbol)
+        if self.total == float("inf"):
+            raise ValueError(f"The language of <{self.root_symbol.text}> is infinite")
+        self.stats = {}
+
+    # --- Enumeration ---
+
+    def indices(self, order="sequential", seed=0, start=0, limit=None):
+        """Derivation indexes at positions start, start + 1, ... of the chosen order."""
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order {order!r}; expected one of {ORDERS}")
+        stop = self.total if limit is None else min(self.total, start + limit)
+        if order == "sequential":
+            return iter(range(start, stop))
+        permutation = FeistelPermutation(self.total, seed)
+        return map(permutation, range(start, stop))
+
+    def render(self, index):
+        """Program text of derivation `index`, without building its tree."""
+        starts, alternatives, plans = _render_tables(self.grammar)
+        out = []
+        stack = [(self.grammar.rule_table().nt_index[self.root_symbol], index)]
+        while stack:
+            item = stack.pop()
+            if item.__class__ is str:
+                out.append(item)
+                continue
+            nt, i = item
+            k = bisect_right(starts[nt], i) - 1
+            i -= starts[nt][k]
+            pieces, radices = plans[alternatives[nt][k]]
+            # Both run last child first: it is the least significant digit, and it is pushed first.
+            digits = []
+            for radix in radices:
+                i, digit = divmod(i, radix)
+                digits.append(digit)
+            digits = iter(digits)
+            for piece in pieces:  # child slots hold nonterminal ids
+                stack.append(piece if piece.__class__ is str else (piece, next(digits)))
+        return "".join(out)
+
+    def batches(self, order="sequential", seed=0, start=0, limit=None):
+        """Yields lists of (index, phenotype) of up to `batch_size` programs."""
+        batch = []
+        for index in self.indices(order, seed, start, limit):
+            batch.append((index, self.render(index)))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    # --- Search ---
+
+    def run(self, order="sequential", seed=0, start=0, limit=None, on_batch=None):
+        """Scores programs batch by batch and returns the best (lowest score) as a dict.
+
+        `limit` caps the number of programs visited (all by default); `start` skips that
+        many positions of the order, e.g. to resume. `on_batch(stats)` is called after every
+        batch. The result holds best_index, best_phenotype, best_score, visited, evaluated
+        (objective calls), total and complete (whether the whole language was covered).
+        Only full-fidelity scores can be best: an evaluator that prunes (e.g.
+        SuccessiveHalvingEvaluator) returns partial scores that are not comparable.
+        """
+        cache = self.fitness_cache
+        stats = self.stats = {"best_index": None, "best_phenotype": None, "best_score": None,
+                              "visited": 0, "evaluated": 0, "total": self.total, "complete": False}
+        for batch in self.batches(order, seed, start, limit):
+            scores, todo = {}, []
+            for _, phenotype in batch:
+                if phenotype in scores:
+                    continue
+                score = cache.get(phenotype) if cache is not None else None
+                scores[phenotype] = (score, 1.0)
+                if score is None:
+                    todo.append(phenotype)
+            if todo:
+                evaluate_fidelity = getattr(self.evaluator, "evaluate_fidelity", None)
+                if evaluate_fidelity is not None:
+                    results = evaluate_fidelity(self.obj_func, todo)
+                else:
+                    results = [(score, 1.0) for score in self.evaluator.evaluate(self.obj_func, todo)]
+                for phenotype, (score, fidelity) in zip(todo, results):
+                    scores[phenotype] = (score, fidelity)
+                    # Crashes, timeouts and pruned partial scores are not cached.
+                    if cache is not None and fidelity == 1.0:
+                        cache.put(phenotype, score)
+                stats["evaluated"] += len(todo)
+            for index, phenotype in batch:
+                score, fidelity = scores[phenotype]
+                if fidelity != 1.0:
+                    continue
+                if stats["best_score"] is None or score < stats["best_score"]:
+                    stats.update(best_index=index, best_phenotype=phenotype, best_score=score)
+            stats["visited"] += len(batch)
+            if on_batch is not None:
+                on_batch(stats)
+        if cache is not None:
+            cache.flush()
+        stats["complete"] = start == 0 and stats["visited"] == self.total
+        return stats
@@ -0,0 +1,180 @@
+"""Compact array-backed genotype: a preorder array of production-rule ids plus subtree sizes.
+
+Only nonterminal nodes are stored; their terminal children are implied by the rule. Entry
+`i` holds the rule that expanded the i-th nonterminal in preorder (or `-1 - nt_id` for a
+nonterminal that was never expanded), and `sizes[i]` the number of entries in its subtree,
+so the subtree rooted at `i` is the slice `[i, i + sizes[i])`. Both live in int32 NumPy
+buffers, which makes a subtree an O(1) view and a crossover three `np.concatenate` calls.
+"""
+import random as _random
+import numpy as np
+from Grammar import DerivationTree, NonterminalSymbol, _arities, _decode_subtree, _encode_subtree
+
+
+def _segments(grammar):
+    """Per rule: rendered pieces, with runs of terminals pre-joined and None marking a child slot."""
+    def calc():
+        table = grammar.rule_table()
+        result = []
+        for _, rhs in table.rules:
+            pieces, text = [], []
+            for sym in rhs:
+                if isinstance(sym, NonterminalSymbol):
+                    if text:
+                        pieces.append("".join(text))
+                        text = []
+                    pieces.append(None)
+                else:
+                    text.append(sym.text)
+            if text:
+                pieces.append("".join(text))
+            result.append(tuple(pieces))
+        return result
+    return grammar._lookup_or_calc("linear", "segments", calc)
+
+
+def _templates(grammar):
+    """Per rule: (arity, text) for rules without nonterminal children, else (arity, str.format
+    of the rendered pieces with a "{}" per child slot)."""
+    def calc():
+        result = []
+        for arity, pieces in zip(_arities(grammar), _segments(grammar)):
+            if not arity:
+                result.append((0, "".join(pieces)))
+            else:
+                text = "".join("{}" if p is None else p.replace("{", "{{").replace("}", "}}") for p in pieces)
+                result.append((arity, text.format))
+        return result
+    return grammar._lookup_or_calc("linear", "templates", calc)
+
+
+def _render(grammar, rules):
+    """Text of the tree encoded by the preorder rule ids `rules`, without building it.
+
+    Entries are visited last to first, so the texts of an entry's children are on top of
+    the stack (first child topmost) when the entry is reached.
+    """
+    templates = _templates(grammar)
+    nonterminals = grammar.rule_table().nonterminals
+    stack = []
+    push, pop = stack.append, stack.pop
+    for rule in reversed(rules):
+        if rule < 0:
+            push(nonterminals[-1 - rule].text)
+            continue
+        arity, template = templates[rule]
+        if not arity:
+            push(template)
+        elif arity == 1:
+            push(template(pop()))
+        else:
+            children = stack[-arity:]
+            del stack[-arity:]
+            push(template(*reversed(children)))
+    return stack[0]
+
+
+class LinearTree:
+    __slots__ = ("grammar", "rules", "sizes")
+
+    def __init__(self, grammar, rules, sizes):
+        self.grammar = grammar
+        self.rules = rules
+        self.sizes = sizes
+
+    def __len__(self):
+        return len(self.rules)
+
+    # --- Conversion ---
+
+    @classmethod
+    def from_derivation_tree(cls, tree):
+        rules, sizes = tree._code or _encode_subtree(tree.grammar.rule_table(), tree.root_node)
+        return cls(tree.grammar, np.array(rules, dtype=np.int32), np.array(sizes, dtype=np.int32))
+
+    @classmethod
+    def from_rules(cls, grammar, rules):
+        """Rebuilds a tree from its preorder rule ids alone; subtree sizes follow from rule arities."""
+        arity = _arities(grammar)
+        rules = np.asarray(rules, dtype=np.int32)
+        sizes = np.ones(len(rules), dtype=np.int32)
+        stack = []  # [entry, children still to come]
+        for i, rule in enumerate(rules.tolist()):
+            stack.append([i, arity[rule] if rule >= 0 else 0])
+            while stack and stack[-1][1] == 0:
+                j = stack.pop()[0]
+                sizes[j] = i - j + 1
+                if stack: stack[-1][1] -= 1
+            if not stack and i != len(rules) - 1:
+                raise ValueError("Rule sequence continues past the end of the tree")
+        if stack or not len(rules):
+            raise ValueError("Rule sequence ends before the tree is complete")
+        return cls(grammar, rules, sizes)
+
+    def to_bytes(self):
+        """Compact serialized form: the preorder rule ids as little-endian int32."""
+        return self.rules.astype("<i4").tobytes()
+
+    @classmethod
+    def from_bytes(cls, grammar, data):
+        return cls.from_rules(grammar, np.frombuffer(data, dtype="<i4"))
+
+    def to_derivation_tree(self):
+        return DerivationTree(self.grammar, root_node=_decode_subtree(self.grammar.rule_table(), self.rules.tolist()))
+
+    def _symbol(self, rule):
+        table = self.grammar.rule_table()
+        return table.nonterminals[-1 - rule] if rule < 0 else table.rules[rule][0]
+
+    # --- Queries ---
+
+    def string(self):
+        return _render(self.grammar, self.rules.tolist())
+
+    def symbol_ids(self):
+        """Nonterminal id of every entry."""
+        lhs = np.asarray(self.grammar.rule_table().rule_lhs, dtype=np.int32)
+        expanded = self.rules >= 0
+        return np.where(expanded, lhs[np.where(expanded, self.rules, 0)], -1 - self.rules)
+
+    def subtree(self, i):
+        """The subtree rooted at entry i, as views on this tree's buffers (O(1))."""
+        end = i + self.sizes[i]
+        return LinearTree(self.grammar, self.rules[i:end], self.sizes[i:end])
+
+    # --- Operators ---
+
+    def replace(self, i, donor):
+        """New tree with the subtree at entry i replaced by `donor`; this tree is unchanged."""
+        end = i + int(self.sizes[i])
+        rules = np.concatenate((self.rules[:i], donor.rules, self.rules[end:]))
+        sizes = np.concatenate((self.sizes[:i], donor.sizes, self.sizes[end:]))
+        delta = len(donor) - (end - i)
+        if delta:
+            # Ancestors are the earlier entries whose span still covers i.
+            ancestors = np.arange(i, dtype=np.int32) + self.sizes[:i] > i
+            sizes[:i][ancestors] += delta
+        return LinearTree(self.grammar, rules, sizes)
+
+    def crossover(self, other, rng=_random):
+        """Same operator as EvolutionaryAlgorithm.crossover: graft a same-symbol subtree of `other`."""
+        points = np.flatnonzero(self.rules >= 0)
+        ids, other_ids = self.symbol_ids(), other.symbol_ids()
+        other_points = other.rules >= 0
+        for i in rng.sample(points.tolist(), len(points)):
+            targets = np.flatnonzero(other_points & (other_ids == ids[i]))
+            if len(targets):
+                return self.replace(i, other.subtree(int(rng.choice(targets))))
+        return self.mutate(rng)
+
+    def mutate(self, rng=_random, max_size=100):
+        """Same operator as EvolutionaryAlgorithm.mutate: regrow the subtree below a random expanded
+        entry as a complete derivation that keeps the tree within `max_size` entries if it can."""
+        points = np.flatnonzero(self.rules >= 0)
+        if not len(points):
+            return self
+        i = int(rng.choice(points))
+        symbol = self._symbol(int(self.rules[i]))
+        budget = max(max_size - len(self) + int(self.sizes[i]), self.grammar.analysis().min_size[symbol])
+        fresh = self.grammar.generate_bounded(budget, root_symbol=symbol, rng=rng)
+        return self.replace(i, LinearTree.from_derivation_tree(fresh))
@@ -0,0 +1,128 @@
+"""Columnar on-disk OHLC store: one memory-mapped `.npy` matrix per symbol plus a JSON index.
+
+Layout under `root`:
+
+    index.json              {"columns": [...], "symbols": {symbol: {"rows", "start", "end", "tz"}}}
+    <symbol>.values.npy     float64 (rows, columns) in Fortran order, so every column is contiguous
+    <symbol>.index.npy      sorted datetime64[ns] bar timestamps (UTC for tz-aware data)
+
+`frame(symbol, start, end)` finds the date range with a binary search on the mapped index
+and wraps the slices in a DataFrame without copying. Pages are read from disk on first
+touch and live in the OS page cache, so a worker only holds the bars it is looking at,
+and `iter_frames` lets an objective walk many symbols with one symbol mapped at a time.
+"""
+import json
+import os
+import re as _re
+import numpy as np
+import pandas as pd
+
+COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+_SYMBOL_RE = _re.compile(r"[A-Za-z0-9][A-Za-z0-9._^=-]*")
+
+
+class OHLCStore:
+    def __init__(self, root, columns=COLUMNS):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, "index.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                self._index = json.load(f)
+        else:
+            self._index = {"columns": list(columns), "symbols": {}}
+        self.columns = tuple(self._index["columns"])
+
+    def __len__(self):
+        return len(self._index["symbols"])
+
+    def __contains__(self, symbol):
+        return symbol in self._index["symbols"]
+
+    def symbols(self):
+        return sorted(self._index["symbols"])
+
+    def info(self, symbol):
+        """{"rows", "start", "end", "tz"} of a stored symbol."""
+        try:
+            return dict(self._index["symbols"][symbol])
+        except KeyError:
+            raise KeyError(f"Symbol {symbol!r} is not in the store at {self.root}") from None
+
+    def _path(self, symbol, part):
+        return os.path.join(self.root, f"{symbol}.{part}.npy")
+
+    # --- Writing ---
+
+    def write(self, symbol, data):
+        """Stores (or replaces) the bars of `symbol` from a DataFrame with a DatetimeIndex."""
+        if not _SYMBOL_RE.fullmatch(symbol):
+            raise ValueError(f"Invalid symbol {symbol!r}")
+        missing = [c for c in self.columns if c not in data.columns]
+        if missing:
+            raise ValueError(f"Data for {symbol!r} lacks columns {missing}")
+        if not isinstance(data.index, pd.DatetimeIndex):
+            raise ValueError("OHLC data must have a DatetimeIndex")
+        data = data.sort_index()
+        tz = str(data.index.tz) if data.index.tz is not None else None
+        index = data.index.tz_convert("UTC").tz_localize(None) if tz else data.index
+
+        # Write next to the target and rename, so readers never map a half-written file.
+        tmp_values, tmp_index = self._path(symbol, "values.tmp"), self._path(symbol, "index.tmp")
+        values = np.lib.format.open_memmap(tmp_values, mode="w+", dtype=np.float64,
+                                           shape=(len(data), len(self.columns)), fortran_order=True)
+        for j, column in enumerate(self.columns):
+            values[:, j] = data[column].to_numpy(dtype=float)
+        values.flush()
+        del values
+        np.save(tmp_index, index.values.astype("datetime64[ns]"))
+        os.replace(tmp_values, self._path(symbol, "values"))
+        os.replace(tmp_index, self._path(symbol, "index"))
+
+        self._index["symbols"][symbol] = {
+            "rows": len(data),
+            "start": str(index[0]) if len(index) else None,
+            "end": str(index[-1]) if len(index) else None,
+            "tz": tz,
+        }
+        self._write_index()
+
+    def _write_index(self):
+        path = os.path.join(self.root, "index.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._index, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    # --- Reading ---
+
+    def arrays(self, symbol, start=None, end=None):
+        """(timestamps, values) views on the mapped files for bars in [start, end] (inclusive)."""
+        info = self.info(symbol)
+        index = np.load(self._path(symbol, "index"), mmap_mode="r")
+        values = np.load(self._path(symbol, "values"), mmap_mode="r")
+        lo = 0 if start is None else int(np.searchsorted(index, self._timestamp(start, info), "left"))
+        hi = len(index) if end is None else int(np.searchsorted(index, self._timestamp(end, info), "right"))
+        return index[lo:hi], values[lo:hi]
+
+    @staticmethod
+    def _timestamp(value, info):
+        ts = pd.Timestamp(value)
+        if ts.tz is not None:
+            ts = ts.tz_convert("UTC").tz_localize(None)
+        elif info["tz"]:
+            ts = ts.tz_localize(info["tz"]).tz_convert("UTC").tz_localize(None)
+        return np.datetime64(ts.to_datetime64(), "ns")
+
+    def frame(self, symbol, start=None, end=None):
+        """Zero-copy, read-only DataFrame of `symbol` between `start` and `end` (inclusive)."""
+        timestamps, values = self.arrays(symbol, start, end)
+        index = pd.DatetimeIndex(np.asarray(timestamps), copy=False)
+        tz = self.info(symbol)["tz"]
+        if tz:
+            index = index.tz_localize("UTC").tz_convert(tz)
+        return pd.DataFrame(np.asarray(values), index=index, columns=list(self.columns), copy=False)
+
+    def iter_frames(self, symbols=None, start=None, end=None):
+        """Yields (symbol, frame) one symbol at a time; each mapping is released once the frame is dropped."""
+        for symbol in (self.symbols() if symbols is None else symbols):
+            yield symbol, self.frame(symbol, start, end)
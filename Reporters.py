@@ -0,0 +1,101 @@
+"""Pluggable generation reporters for EvolutionaryAlgorithm.
+
+A reporter receives three hooks:
+
+- `on_generation_start(ea, generation)` before the population of `generation` is built,
+- `on_evaluate(ea, phenotypes, scores, seconds)` after every evaluator batch,
+- `on_generation_end(ea, record)` once the generation has been evaluated and ranked.
+
+`record` is a plain dict (JSON-serialisable): generation, best fitness and phenotype,
+evaluations, penalty counts, cache hits/misses, seconds per phase ("generate", "breed",
+"render", "evaluate", "rank"), the number of nodes allocated for the generation and,
+with a surrogate attached, its screening figures (see Surrogate.py).
+Reporters with `detailed = False` (such as `PrintReporter`) are not charged for the
+render timers and node counts; with no reporters attached nothing is recorded at all.
+"""
+import json
+
+# Raw scores counted separately in each record: trading_objective's "no edge" score and
+# the evaluators' failure penalty.
+PENALTY_SCORES = (1000.0, 2000.0)
+
+
+def new_record(generation):
+    return {
+        "generation": generation,
+        "best_fitness": None,
+        "best_phenotype": None,
+        "population": 0,
+        "evaluations": 0,
+        "penalties": {f"{score:g}": 0 for score in PENALTY_SCORES},
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "seconds": {"generate": 0.0, "breed": 0.0, "render": 0.0, "evaluate": 0.0, "rank": 0.0},
+        "nodes_allocated": None,
+        "surrogate": None,
+    }
+
+
+class Reporter:
+    """No-op base class; override the hooks you need."""
+    detailed = True
+
+    def on_generation_start(self, ea, generation):
+        pass
+
+    def on_evaluate(self, ea, phenotypes, scores, seconds):
+        pass
+
+    def on_generation_end(self, ea, record):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PrintReporter(Reporter):
+    """The one-line per-generation summary `run()` has always printed."""
+    detailed = False
+
+    def on_generation_end(self, ea, record):
+        cache_info = ""
+        if ea.fitness_cache is not None:
+            cache_info = f" | Cache: {record['cache_hits']} hits / {record['cache_misses']} misses"
+        surrogate = record.get("surrogate")
+        if surrogate and surrogate["screened"]:
+            rho = surrogate["rank_correlation"]
+            cache_info += (f" | Surrogate: {surrogate['backtests_saved']} backtests saved"
+                           f", rho {'n/a' if rho is None else f'{rho:.2f}'}")
+        print(f"Gen {record['generation']} | Best Score: {record['best_fitness']:.2f}{cache_info} | Phenotype: {record['best_phenotype'][:50]}...")
+
+
+class MemoryReporter(Reporter):
+    """Keeps every generation record in `records`."""
+
+    def __init__(self):
+        self.records = []
+
+    def on_generation_end(self, ea, record):
+        self.records.append(record)
+
+
+class JsonlReporter(Reporter):
+    """Appends one JSON line per generation to `path`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a")
+
+    def on_generation_end(self, ea, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
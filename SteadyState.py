@@ -0,0 +1,230 @@
+"""Asynchronous steady-state evolution: no generational barrier.
+
+`EvolutionaryAlgorithm.run` evaluates a whole generation and waits for its slowest
+backtest before it breeds again. `SteadyState` instead keeps `concurrency` evaluations in
+flight on an executor. Whenever one finishes, its individual joins the population, which
+then drops its worst member ((mu + 1) replacement), and tournament selection breeds the
+next offspring straight away, so a worker is only idle while the event loop hands it new
+work.
+
+Evaluations run on the evaluator's own pool (`ThreadPoolEvaluator` /
+`ProcessPoolEvaluator`, honouring its initializer and timeout) or, for evaluators without
+one, on a private thread pool that calls the objective directly; batch evaluators such as
+`VectorizedEvaluator` are bypassed. The fitness cache, evaluation counter and reporters
+of the wrapped EvolutionaryAlgorithm are used as in `run()`, with one reporter record per
+`population_size` finished evaluations. With more than one evaluation in flight the
+order of completions, and therefore the run, depends on timing.
+"""
+import asyncio
+import bisect
+import os
+import random
+import time
+from concurrent import futures as _futures
+from Evaluators import FAILED, _score_timed
+from Reporters import new_record
+
+STOP_REASONS = ("budget", "time", "target", "patience", "exhausted")
+
+
+class SteadyState:
+    def __init__(self, ea, concurrency=None, tournament_size=3, crossover_rate=0.7, executor=None):
+        if tournament_size < 1:
+            raise ValueError("tournament_size must be at least 1")
+        self.ea = ea
+        self.concurrency = concurrency or getattr(ea.evaluator, "workers", None) or os.cpu_count() or 1
+        self.tournament_size = tournament_size
+        self.crossover_rate = crossover_rate
+        self.executor = executor
+        self.stats = {}
+
+    # --- Selection and replacement ---
+
+    def _tournament(self):
+        population = self.ea.population
+        return min(random.sample(population, min(self.tournament_size, len(population))),
+                   key=lambda ind: ind.fitness)
+
+    def _offspring(self):
+        ea = self.ea
+        if self._generated < ea.pop_size or not ea.population:
+            if not self._fresh:
+                self._fresh = ea.new_trees(ea.pop_size)[::-1]
+            self._generated += 1
+            return ea._individual(self._fresh.pop())
+        if len(ea.population) > 1 and random.random() < self.crossover_rate:
+            return ea.crossover(self._tournament(), self._tournament())
+        return ea.mutate(self._tournament())
+
+    def _insert(self, individual):
+        population = self.ea.population
+        bisect.insort(population, individual, key=lambda ind: ind.fitness)
+        if len(population) > self.ea.pop_size:
+            population.pop()
+
+    # --- Evaluation ---
+
+    def _executor(self):
+        if self.executor is not None:
+            return self.executor
+        pool = getattr(self.ea.evaluator, "executor", None)
+        if pool is not None:
+            return pool
+        if self._own_executor is None:
+            self._own_executor = _futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        return self._own_executor
+
+    def _discard(self, executor):
+        # Only the evaluator's pool is replaced (which also stops a hung process worker);
+        # other evaluations lost with it are retried below.
+        evaluator = self.ea.evaluator
+        if getattr(evaluator, "_executor", None) is executor:
+            evaluator._discard_executor()
+
+    async def _evaluate(self, phenotype):
+        """(score, worker seconds, fidelity) of one phenotype; a worker lost to another task's crash is
+        retried once. A crash or timeout gets the penalty with fidelity FAILED, so it is not cached."""
+        ea = self.ea
+        penalty = ea.evaluator.penalty
+        timeout = getattr(ea.evaluator, "timeout", None)
+        for _ in range(2):
+            executor = self._executor()
+            try:
+                future = asyncio.wrap_future(executor.submit(_score_timed, ea.obj_func, phenotype, penalty))
+                score, seconds = await asyncio.wait_for(future, timeout)
+                return score, seconds, 1.0
+            except asyncio.TimeoutError:
+                self._discard(executor)
+                return penalty, timeout, FAILED
+            except Exception:  # BrokenExecutor
+                self._discard(executor)
+        return penalty, 0.0, FAILED
+
+    def _submit(self, individual):
+        """Starts evaluating `individual`; False if no new evaluation was needed (cache hit, or the
+        same program is already in flight and `individual` waits for its score)."""
+        ea = self.ea
+        phenotype = individual.phenotype
+        if phenotype in self._waiting:
+            self._waiting[phenotype].append(individual)
+            return False
+        score = ea.fitness_cache.get(phenotype) if ea.fitness_cache is not None else None
+        if score is not None:
+            self._score(individual, score)
+            return False
+        self._waiting[phenotype] = [individual]
+        self._tasks[asyncio.ensure_future(self._evaluate(phenotype))] = phenotype
+        self.stats["submitted"] += 1
+        ea.evaluations += 1
+        return True
+
+    def _score(self, individual, score, fidelity=1.0):
+        ea = self.ea
+        individual.fitness = score + individual.complexity * ea.penalty_coeff
+        individual.fidelity = fidelity
+        self._insert(individual)
+
+    def _finish(self, task):
+        ea = self.ea
+        phenotype = self._tasks.pop(task)
+        score, seconds, fidelity = task.result()
+        self.stats["completed"] += 1
+        self.stats["busy_seconds"] += seconds
+        if ea.fitness_cache is not None and fidelity == 1.0:
+            ea.fitness_cache.put(phenotype, score)
+        if ea.reporters:
+            ea._record_evaluation([phenotype], [score], seconds)
+        for individual in self._waiting.pop(phenotype):
+            self._score(individual, score, fidelity)
+
+    # --- Reporting ---
+
+    def _open_record(self):
+        ea = self.ea
+        if ea.reporters and ea._record is None:
+            ea._record = new_record(ea.generation + 1)
+            for reporter in ea.reporters:
+                reporter.on_generation_start(ea, ea.generation + 1)
+
+    def _close_record(self):
+        ea = self.ea
+        ea.generation += 1
+        if ea.fitness_cache is not None:
+            ea.fitness_cache.flush()
+            hits, misses = ea.fitness_cache.generation_stats()
+            if ea._record is not None:
+                ea._record["cache_hits"], ea._record["cache_misses"] = hits, misses
+        if ea._record is not None:
+            ea._record["generation"] = ea.generation
+        ea._end_generation()
+
+    # --- Main loop ---
+
+    async def run_async(self, max_evaluations=None, max_seconds=None, target_fitness=None, patience=None):
+        """Evolves until a stop condition holds and returns the best individual.
+
+        Stops once `max_evaluations` objective calls have been started (cache hits are
+        free), after `max_seconds`, when the best fitness reaches `target_fitness`, or after
+        `patience` finished evaluations without improving the best. Evaluations already in
+        flight are allowed to finish and are inserted. The reason is in `stats["stop"]`.
+        """
+        if max_evaluations is None and max_seconds is None and target_fitness is None and patience is None:
+            raise ValueError("At least one stop condition is required")
+        ea = self.ea
+        self.stats = {"stop": None, "concurrency": self.concurrency, "submitted": 0, "completed": 0,
+                      "busy_seconds": 0.0, "seconds": 0.0, "utilization": 0.0, "evals_per_s": 0.0}
+        self._tasks, self._waiting = {}, {}
+        self._own_executor = None
+        self._generated = 0
+        self._fresh = []
+        ea.population = []
+        best, since_best, known_in_a_row = None, 0, 0
+        start = time.perf_counter()
+        stop = None
+        try:
+            self._open_record()
+            while True:
+                while stop is None and len(self._tasks) < self.concurrency:
+                    if max_evaluations is not None and self.stats["submitted"] >= max_evaluations:
+                        stop = "budget"
+                    elif max_seconds is not None and time.perf_counter() - start >= max_seconds:
+                        stop = "time"
+                    elif known_in_a_row >= 1000 * ea.pop_size:
+                        stop = "exhausted"  # offspring keep hitting the cache: nothing new left to try
+                    elif self._submit(self._offspring()):
+                        known_in_a_row = 0
+                    else:
+                        known_in_a_row += 1
+                if not self._tasks:
+                    break
+                wait = None if max_seconds is None or stop else max(0.0, start + max_seconds - time.perf_counter())
+                done, _ = await asyncio.wait(self._tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    self._finish(task)
+                    since_best += 1
+                    if self.stats["completed"] % ea.pop_size == 0:
+                        self._close_record()
+                        self._open_record()
+                if ea.population and (best is None or ea.population[0].fitness < best):
+                    best, since_best = ea.population[0].fitness, 0
+                if stop is None and target_fitness is not None and best is not None and best <= target_fitness:
+                    stop = "target"
+                if stop is None and patience is not None and since_best >= patience:
+                    stop = "patience"
+            if ea._record is not None and ea._record["evaluations"]:
+                self._close_record()
+            ea._record = None
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            if self._own_executor is not None:
+                self._own_executor.shutdown(wait=False, cancel_futures=True)
+            seconds = time.perf_counter() - start
+            self.stats.update(stop=stop, seconds=seconds,
+                              utilization=self.stats["busy_seconds"] / (seconds * self.concurrency) if seconds else 0.0,
+                              evals_per_s=self.stats["completed"] / seconds if seconds else 0.0)
+        return ea.population[0]
+
+    def run(self, **stop_conditions):
+        """Synchronous wrapper around `run_async` (which can be awaited inside a running loop)."""
+        return asyncio.run(self.run_async(**stop_conditions))
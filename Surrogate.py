@@ -0,0 +1,191 @@
+"""Surrogate pre-screening of offspring before they reach the objective.
+
+Most offspring are no better than their parents, yet each one costs a backtest. With a
+`SurrogateModel` attached, `EvolutionaryAlgorithm.breed` produces `1 / keep` times as
+many offspring as it needs, and the model predicts their fitness. Only the most promising
+ones join the population (plus an `explore` share picked at random, which keeps the
+training data from drifting towards what the model already likes); the rest are
+discarded without being evaluated.
+
+Features come from the genotype's preorder rule ids (`DerivationTree.rule_code`): how
+often each production rule was chosen (terminal values such as numbers are rules of
+their own) and, hashed into `context_buckets` counters, which rule filled which child
+slot of which parent rule, so the same value in different places is told apart. The
+model is ridge regression kept as running sums X^T X and X^T y: every evaluated
+individual is added in O(features^2) and refitting is a single small solve, so it
+retrains each generation on everything seen so far.
+
+Per generation the reporter record gets `surrogate`: candidates screened, backtests
+saved (rejected programs the fitness cache did not already know), and the rank
+correlation and mean absolute error of the predictions on the individuals that were
+then evaluated. Cumulative figures are in `SurrogateModel.stats`. Checkpoints keep the
+model (`checkpoint_state()`), so a resumed run screens exactly as the uninterrupted one.
+"""
+import base64
+import math
+import random
+import numpy as np
+
+
+class SurrogateModel:
+    def __init__(self, grammar, keep=0.5, explore=0.1, ridge=1.0, min_samples=50,
+                 context_buckets=256, target_cap=1000.0):
+        if not 0 < keep <= 1:
+            raise ValueError("keep must be in (0, 1]")
+        self.grammar = grammar
+        self.keep = keep
+        self.explore = explore
+        self.ridge = ridge
+        self.min_samples = min_samples
+        self.context_buckets = context_buckets
+        # Failure penalties are clipped so a few crashes do not dominate the fit.
+        self.target_cap = target_cap
+        self.n_rules = len(grammar.rule_table().rules)
+        self.n_features = 1 + self.n_rules + context_buckets
+        self._xtx = np.eye(self.n_features) * ridge
+        self._xtx[0, 0] = 0.0  # the intercept is not shrunk
+        self._xty = np.zeros(self.n_features)
+        self._weights = None
+        self._predicted = {}  # phenotype -> prediction made when it was selected
+        self.stats = {"observed": 0, "screened": 0, "selected": 0, "backtests_saved": 0,
+                      "rank_correlation": None, "mae": None}
+        self._generation = self._empty_generation()
+
+    @staticmethod
+    def _empty_generation():
+        return {"screened": 0, "backtests_saved": 0, "evaluated": 0, "rank_correlation": None, "mae": None}
+
+    @property
+    def ready(self):
+        """True once `min_samples` evaluated individuals have been observed."""
+        return self._weights is not None and self.stats["observed"] >= self.min_samples
+
+    # --- Features ---
+
+    def features(self, trees):
+        """(len(trees), n_features) matrix: intercept, rule counts and hashed parent/slot/rule counts."""
+        n_rules, buckets = self.n_rules, self.context_buckets
+        X = np.zeros((len(trees), self.n_features))
+        X[:, 0] = 1.0
+        for row, tree in zip(X, trees):
+            rules, sizes = tree.rule_code()
+            expanded = [r for r in rules if r >= 0]
+            row[1:1 + n_rules] = np.bincount(expanded, minlength=n_rules)
+            if buckets:
+                contexts = []
+                stack = []  # [end entry, rule, next child slot]
+                for i, (rule, size) in enumerate(zip(rules, sizes)):
+                    while stack and stack[-1][0] <= i:
+                        stack.pop()
+                    if stack:
+                        parent = stack[-1]
+                        contexts.append(hash((parent[1], parent[2], rule)) % buckets)
+                        parent[2] += 1
+                    stack.append([i + size, rule, 0])
+                row[1 + n_rules:] = np.bincount(contexts, minlength=buckets)
+        return X
+
+    # --- Training ---
+
+    def observe(self, individuals):
+        """Adds freshly evaluated individuals (full fidelity only) to the model and refits it."""
+        done = [ind for ind in individuals if ind.fitness is not None and ind.fidelity == 1.0]
+        if not done:
+            return
+        actual = np.array([ind.fitness for ind in done])
+        predicted = [self._predicted.pop(ind.phenotype, None) for ind in done]
+        scored = [(p, a) for p, a in zip(predicted, actual.tolist()) if p is not None]
+        if scored:
+            p, a = np.array(scored).T
+            gen = self._generation
+            gen["evaluated"] += len(scored)
+            gen["mae"] = self.stats["mae"] = float(np.mean(np.abs(p - np.minimum(a, self.target_cap))))
+            gen["rank_correlation"] = self.stats["rank_correlation"] = _rank_correlation(p, a)
+        self._predicted.clear()
+
+        X = self.features([ind.genotype for ind in done])
+        y = np.minimum(actual, self.target_cap)
+        self._xtx += X.T @ X
+        self._xty += X.T @ y
+        self.stats["observed"] += len(done)
+        self._weights = np.linalg.lstsq(self._xtx, self._xty, rcond=None)[0]
+
+    def predict(self, trees):
+        """Predicted fitness of each tree (lower is better)."""
+        return self.features(trees) @ self._weights
+
+    # --- Screening ---
+
+    def candidates(self, needed):
+        """How many offspring to breed to fill `needed` places."""
+        return math.ceil(needed / self.keep)
+
+    def select(self, candidates, needed, fitness_cache=None):
+        """The `needed` individuals of `candidates` to evaluate: the best predicted, plus a random share."""
+        if len(candidates) <= needed:
+            return list(candidates)
+        predictions = self.predict([ind.genotype for ind in candidates])
+        order = np.argsort(predictions, kind="stable").tolist()
+        n_random = min(int(round(needed * self.explore)), needed)
+        chosen = order[:needed - n_random]
+        rest = order[needed - n_random:]
+        chosen += random.sample(rest, n_random)
+        selected = [candidates[i] for i in chosen]
+        for i in chosen:
+            self._predicted[candidates[i].phenotype] = float(predictions[i])
+
+        kept = {ind.phenotype for ind in selected}
+        saved = {candidates[i].phenotype for i in order if candidates[i].phenotype not in kept}
+        if fitness_cache is not None:
+            saved = {p for p in saved if p not in fitness_cache}
+        for counts in (self.stats, self._generation):
+            counts["screened"] += len(candidates)
+            counts["backtests_saved"] += len(saved)
+        self.stats["selected"] += len(selected)
+        return selected
+
+    def generation_stats(self):
+        """Figures since the previous call (one generation of `run()`), for the reporter record."""
+        stats, self._generation = self._generation, self._empty_generation()
+        stats["trained_on"] = self.stats["observed"]
+        return stats
+
+    # --- Checkpoints ---
+
+    def checkpoint_state(self):
+        """JSON-able state a checkpoint keeps for this model (see `restore_state`)."""
+        return {"xtx": _array_to_json(self._xtx), "xty": _array_to_json(self._xty),
+                "weights": None if self._weights is None else _array_to_json(self._weights),
+                "predicted": dict(self._predicted), "stats": dict(self.stats),
+                "generation": dict(self._generation)}
+
+    def restore_state(self, state):
+        xtx = _array_from_json(state["xtx"])
+        if xtx.size != self.n_features ** 2:
+            raise ValueError("Checkpoint was written for a surrogate with other features")
+        self._xtx = xtx.reshape(self.n_features, self.n_features)
+        self._xty = _array_from_json(state["xty"])
+        self._weights = None if state["weights"] is None else _array_from_json(state["weights"])
+        self._predicted = dict(state["predicted"])
+        self.stats = dict(state["stats"])
+        self._generation = dict(state["generation"])
+
+
+def _array_to_json(values):
+    """Base64 of the little-endian float64 bytes: exact, and far smaller than a list of floats."""
+    return base64.b64encode(np.ascontiguousarray(values, dtype="<f8").tobytes()).decode("ascii")
+
+
+def _array_from_json(text):
+    return np.frombuffer(base64.b64decode(text), dtype="<f8").astype(float)
+
+
+def _rank_correlation(predicted, actual):
+    """Spearman correlation of two score arrays, or None when it is undefined."""
+    if len(predicted) < 3:
+        return None
+    a = np.argsort(np.argsort(predicted)).astype(float)
+    b = np.argsort(np.argsort(actual)).astype(float)
+    if a.std() == 0 or b.std() == 0:
+        return None
+    return float(np.corrcoef(a, b)[0, 1])
@@ -0,0 +1,468 @@
+"""Benchmarks for the hot paths.
+
+`python benchmarks.py run --out results.json` times grammar construction, generation,
+rendering, parsing, the genetic operators and the trading objective across grammar sizes,
+tree sizes, population sizes and data lengths, and writes ops/sec and peak traced memory
+per case as JSON. `python benchmarks.py compare old.json new.json` lines up two such files
+(e.g. from two commits) and flags cases that got slower. `python benchmarks.py report`
+prints the one-off comparisons used while optimising the genotype and generator.
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+import numpy as np
+import pandas as pd
+from Grammar import Grammar, DerivationTree, NonterminalSymbol, _calc_lark_components
+from EvolutionaryAlgorithm import EvolutionaryAlgorithm, Individual
+from LinearTree import LinearTree
+from IslandModel import IslandModel
+from SteadyState import SteadyState
+from Evaluators import FAILURE_PENALTY, ThreadPoolEvaluator
+
+MATH_BNF = "<S> ::= <S>+<S> | <S>*<S> | x | y | (<S>)"
+
+
+def _timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def _traced(func):
+    """(result, bytes still allocated by func) measured with tracemalloc."""
+    tracemalloc.start()
+    try:
+        result = func()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current
+
+
+def bench_genotype(bnf, n=10_000, max_expansions=100, seed=0):
+    """Node-based DerivationTree vs LinearTree for a population of `n` individuals."""
+    random.seed(seed)
+    gram = Grammar(bnf)
+    ea = EvolutionaryAlgorithm(gram, lambda p: 0.0)
+
+    trees, node_bytes = _traced(lambda: [gram.generate_derivation_tree(max_expansions) for _ in range(n)])
+    linear, linear_bytes = _traced(lambda: [LinearTree.from_derivation_tree(t) for t in trees])
+
+    pairs = [(random.randrange(n), random.randrange(n)) for _ in range(n)]
+    individuals = [Individual(t) for t in trees]
+    rows = {
+        "memory_bytes": (node_bytes, linear_bytes),
+        "string_s": (_timed(lambda: [t.string() for t in trees])[0],
+                     _timed(lambda: [t.string() for t in linear])[0]),
+        "crossover_s": (_timed(lambda: [ea.crossover(individuals[a], individuals[b]) for a, b in pairs])[0],
+                        _timed(lambda: [linear[a].crossover(linear[b]) for a, b in pairs])[0]),
+    }
+    return rows
+
+
+def _legacy_generate(grammar, max_expansions=100, reduction_factor=0.9):
+    """The original generator (deep-copied weights, list.pop(0), linear scan), kept as a baseline."""
+    weights0 = {lhs: [1.0 for _ in rhs_list] for lhs, rhs_list in grammar.production_rules.items()}
+    dt = DerivationTree(grammar)
+    stack = [(dt.root_node, weights0)]
+    expansions = 0
+    while stack and expansions < max_expansions:
+        node, weights = stack.pop(0)
+        rules = grammar.production_rules.get(node.symbol, [])
+        if not rules: continue
+        rule_weights = weights[node.symbol]
+        r = random.uniform(0, sum(rule_weights))
+        upto, chosen = 0, 0
+        for i, w in enumerate(rule_weights):
+            if upto + w >= r:
+                chosen = i
+                break
+            upto += w
+        new_weights = copy.deepcopy(weights)
+        new_weights[node.symbol][chosen] *= reduction_factor
+        new_nodes = dt._expand(node, rules[chosen])
+        stack = [(n, new_weights) for n in new_nodes if isinstance(n.symbol, NonterminalSymbol)] + stack
+        expansions += 1
+    return dt
+
+
+def bench_generation(bnf, n=10_000, max_expansions=100, seed=0):
+    """Population initialisation: original generator vs generate_derivation_tree vs generate_many."""
+    gram = Grammar(bnf)
+    random.seed(seed)
+    legacy, _ = _timed(lambda: [_legacy_generate(gram, max_expansions) for _ in range(n)])
+    random.seed(seed)
+    single, _ = _timed(lambda: [gram.generate_derivation_tree(max_expansions) for _ in range(n)])
+    many, _ = _timed(lambda: gram.generate_many(n, seed=seed, max_expansions=max_expansions))
+    return {"legacy_s": legacy, "generate_derivation_tree_s": single, "generate_many_s": many,
+            "speedup": legacy / many}
+
+
+def bench_islands(objective, bnf, max_islands=None, gens=10, population_size=20, seed=0):
+    """Evaluations per second of IslandModel with 1..max_islands islands (one process each)."""
+    gram = Grammar(bnf)
+    rows = {}
+    for islands in range(1, (max_islands or os.cpu_count()) + 1):
+        model = IslandModel(gram, objective, islands=islands, population_size=population_size, seed=seed)
+        seconds, _ = _timed(lambda: model.run(gens))
+        evaluations = sum(r["evaluations"] for r in model.results)
+        rows[islands] = {"seconds": seconds, "evaluations": evaluations, "evals_per_s": evaluations / seconds}
+    return rows
+
+
+class _SleepObjective:
+    """Stand-in for backtests of uneven length: sleeps 2 ms, or 40 ms for one phenotype in ten
+    (fixed per phenotype), and logs the time spent. Sleeping releases the GIL, so a thread
+    pool behaves like a process pool of the same size."""
+
+    def __init__(self):
+        self.busy = 0.0
+
+    def __call__(self, phenotype):
+        start = time.perf_counter()
+        time.sleep(0.04 if zlib.crc32(phenotype.encode()) % 10 == 0 else 0.002)
+        self.busy += time.perf_counter() - start
+        return float(len(phenotype))
+
+
+def bench_steady_state(workers=4, population_size=40, gens=10, seed=0):
+    """Worker utilization of the generational loop vs SteadyState for the same number of evaluations."""
+    gram = Grammar(MATH_BNF)
+    rows = {}
+    random.seed(seed)
+    objective = _SleepObjective()
+    with ThreadPoolEvaluator(workers=workers) as evaluator:
+        ea = EvolutionaryAlgorithm(gram, objective, population_size, evaluator=evaluator, verbose=False)
+        seconds, _ = _timed(lambda: ea.run(gens))
+    evaluations = ea.evaluations
+    rows["generational"] = {"evaluations": evaluations, "seconds": seconds, "evals_per_s": evaluations / seconds,
+                            "utilization": objective.busy / (seconds * workers)}
+    random.seed(seed)
+    objective = _SleepObjective()
+    with ThreadPoolEvaluator(workers=workers) as evaluator:
+        steady = SteadyState(EvolutionaryAlgorithm(gram, objective, population_size, evaluator=evaluator,
+                                                   verbose=False), concurrency=workers)
+        steady.run(max_evaluations=evaluations)
+    stats = steady.stats
+    rows["steady_state"] = {"evaluations": stats["completed"], "seconds": stats["seconds"],
+                            "evals_per_s": stats["evals_per_s"], "utilization": stats["utilization"]}
+    return rows
+
+
+def _report(title, rows):
+    print(f"\n{title}")
+    print(f"{'metric':<16}{'Node tree':>14}{'LinearTree':>14}{'ratio':>8}")
+    for name, (node, linear) in rows.items():
+        print(f"{name:<16}{node:>14.4g}{linear:>14.4g}{node / linear:>8.2f}")
+
+
+def synthetic_bnf(nonterminals, alternatives=3):
+    """A recursive grammar with `nonterminals` rules of `alternatives` alternatives each."""
+    lines = []
+    for i in range(nonterminals):
+        a, b = (i + 1) % nonterminals, (i * 7 + 3) % nonterminals
+        alts = [f'<N{a}> "+" <N{b}>', f'"t{i}"', f'"(" <N{a}> ")"']
+        alts += [f'"u{i}_{j}" <N{(a + j) % nonterminals}>' for j in range(3, alternatives)]
+        lines.append(f"<N{i}> ::= " + " | ".join(alts[:max(alternatives, 2)]))
+    return "\n".join(lines)
+
+
+def synthetic_ohlc(n, seed=0):
+    """Daily OHLCV bars following a geometric random walk, shaped like backtesting.test.GOOG."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n))
+    spread = np.abs(rng.normal(0, 0.01, n)) * close
+    return pd.DataFrame({
+        "Open": open_, "High": np.maximum(open_, close) + spread, "Low": np.minimum(open_, close) - spread,
+        "Close": close, "Volume": rng.integers(10_000, 1_000_000, n),
+    }, index=pd.bdate_range("2000-01-03", periods=n))
+
+
+def measure(func, ops=1, setup=None, min_time=0.2, max_repeat=1000, min_repeat=5):
+    """ops/sec of `func` (which performs `ops` operations per call) and its peak traced memory.
+
+    Like `timeit`, the garbage collector is paused while timing. The rate comes from the
+    median call, which is far less sensitive to scheduler and GC noise than the mean.
+    With `setup`, each call receives a fresh `setup()` result built outside the timed region.
+    """
+    args = lambda: (setup(),) if setup else ()
+    func(*args())  # warm-up: fills per-grammar caches, parsers and indicator tables
+    times = []
+    gc_was_enabled = gc.isenabled()
+    try:
+        while len(times) < max_repeat and (sum(times) < min_time or len(times) < min_repeat):
+            call_args = args()
+            gc.disable()
+            start = time.perf_counter()
+            func(*call_args)
+            times.append(time.perf_counter() - start)
+            if gc_was_enabled:
+                gc.enable()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    call_args = args()
+    tracemalloc.start()
+    try:
+        func(*call_args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"ops_per_s": ops / statistics.median(times), "best_ops_per_s": ops / min(times),
+            "peak_bytes": peak, "repeats": len(times)}
+
+
+def _seeded(func, seed=0):
+    """Reseeds the global RNG before every call so each repetition does the same work."""
+    def run():
+        random.seed(seed)
+        return func()
+    return run
+
+
+def _grammars(quick):
+    from trading import trading_bnf
+    sizes = (10, 100) if quick else (10, 100, 1000)
+    return [("trading", trading_bnf), ("math", MATH_BNF)] + [(f"synthetic{k}", synthetic_bnf(k)) for k in sizes]
+
+
+def suite_grammar(quick=False):
+    """Grammar.from_bnf_text, generate_derivation_tree, generate_bounded and DerivationTree.string."""
+    results = []
+    for name, bnf in _grammars(quick):
+        results.append(({"case": "from_bnf_text", "grammar": name}, measure(lambda: Grammar(bnf))))
+        gram = Grammar(bnf)
+        for max_expansions in ((10, 100) if quick else (10, 100, 1000)):
+            n = 100
+            results.append(({"case": "generate_derivation_tree", "grammar": name, "max_expansions": max_expansions},
+                            measure(_seeded(lambda: [gram.generate_derivation_tree(max_expansions) for _ in range(n)]), n)))
+            if gram.analysis().min_size[gram.start_symbol] <= max_expansions:
+                results.append(({"case": "generate_bounded", "grammar": name, "max_size": max_expansions},
+                                measure(_seeded(lambda: [gram.generate_bounded(max_expansions, method="ptc2")
+                                                         for _ in range(n)]), n)))
+            linear = [LinearTree.from_derivation_tree(t) for t in gram.generate_many(n, seed=0, max_expansions=max_expansions)]
+            # string() caches rendered subtrees, so every call gets freshly built trees.
+            results.append(({"case": "string", "grammar": name, "max_expansions": max_expansions},
+                            measure(lambda trees: [t.string() for t in trees], n,
+                                    setup=lambda: [t.to_derivation_tree() for t in linear])))
+    return results
+
+
+# Largest grammar (in production rules) each parser is benchmarked on; bigger ones get a
+# "skipped" row. One Earley pass over the 50 texts of synthetic100 (300 rules) takes about
+# two minutes, and building the LALR tables of synthetic1000 (3000 rules) over seven.
+# "auto" may fall back to Earley, so it shares its limit.
+PARSE_MAX_RULES = {"earley": 100, "lalr": 1000, "auto": 100}
+
+
+def suite_parse(quick=False):
+    """parse_many with the Earley, LALR and automatically chosen Lark parsers, plus building
+    each parser from scratch and loading the LALR tables from the on-disk cache, over every
+    grammar within `PARSE_MAX_RULES`."""
+    results = []
+    for name, bnf in _grammars(quick):
+        gram = Grammar(bnf)
+        n_rules = len(gram.rule_table().rules)
+        skipped = lambda parser: {"skipped": f"{n_rules} rules > {PARSE_MAX_RULES[parser]}"}
+        fits = lambda parser: n_rules <= PARSE_MAX_RULES[parser]
+        for max_expansions in ((10, 100) if quick else (10, 100, 1000)):
+            texts = [t.string() for t in gram.generate_many(50, seed=0, max_expansions=max_expansions)]
+            for parser in ("earley", "lalr", "auto"):
+                params = {"case": "parse_many", "grammar": name, "max_expansions": max_expansions, "parser": parser}
+                if not fits(parser):
+                    results.append((params, skipped(parser)))
+                    continue
+                errors = []
+
+                def parse_all():
+                    errors[:] = [error for _, error in gram.parse_many(texts, parser) if error]
+
+                try:
+                    row = measure(parse_all, len(texts))
+                except Exception as e:  # e.g. a grammar Lark's LALR cannot handle
+                    row = {"error": f"{type(e).__name__}: {e}"}
+                row["parse_errors"] = len(errors)
+                results.append((params, row))
+        for parser in ("earley", "lalr"):
+            params = {"case": "lark_build", "grammar": name, "parser": parser}
+            if parser == "lalr" and not fits(parser):  # building an Earley parser is cheap
+                results.append((params, skipped(parser)))
+                continue
+            try:
+                results.append((params, measure(lambda: _calc_lark_components(gram, parser, None), max_repeat=20)))
+            except Exception as e:
+                results.append((params, {"error": f"{type(e).__name__}: {e}"}))
+        if not fits("lalr"):
+            results.append(({"case": "lark_load_cached", "grammar": name, "parser": "lalr"}, skipped("lalr")))
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "parser.lark")
+            _calc_lark_components(gram, "lalr", path)
+            results.append(({"case": "lark_load_cached", "grammar": name, "parser": "lalr"},
+                            measure(lambda: _calc_lark_components(gram, "lalr", path), max_repeat=20)))
+    return results
+
+
+def suite_operators(quick=False):
+    """EvolutionaryAlgorithm.crossover / mutate over populations of several sizes."""
+    results = []
+    for name, bnf in _grammars(quick):
+        gram = Grammar(bnf)
+        ea = EvolutionaryAlgorithm(gram, None, verbose=False)
+        for size in ((100, 1000) if quick else (100, 1000, 10_000)):
+            population = [Individual(t) for t in gram.generate_many(size, seed=0)]
+            rng = random.Random(1)
+            pairs = [(population[rng.randrange(size)], population[rng.randrange(size)]) for _ in range(size)]
+            results.append(({"case": "crossover", "grammar": name, "population": size},
+                            measure(_seeded(lambda: [ea.crossover(a, b) for a, b in pairs]), size)))
+            results.append(({"case": "mutate", "grammar": name, "population": size},
+                            measure(_seeded(lambda: [ea.mutate(a) for a, _ in pairs]), size)))
+    return results
+
+
+def suite_objective(quick=False):
+    """trading_objective (one exec'd backtest per call) and VectorizedEvaluator on OHLC data of several lengths."""
+    from functools import partial
+    from backtesting.test import GOOG
+    from trading import trading_bnf, trading_objective
+    from vector_backtest import VectorizedEvaluator
+    datasets = [("GOOG", GOOG)] + [(f"synthetic{n}", synthetic_ohlc(n)) for n in ((500, 2000) if quick else (500, 2000, 8000))]
+    phenotypes = [t.string() for t in Grammar(trading_bnf).generate_many(5 if quick else 10, seed=0)]
+    batch = [t.string() for t in Grammar(trading_bnf).generate_many(500, seed=1)]
+    results = []
+    for name, data in datasets:
+        objective = partial(trading_objective, data=data)
+        # A broken setup (e.g. data the strategies cannot read) makes every call return the
+        # penalty from its except branch, which is fast and would be reported as a speedup.
+        penalties = sum(objective(p) == FAILURE_PENALTY for p in phenotypes)
+        if penalties == len(phenotypes):
+            raise RuntimeError(f"trading_objective returned the failure penalty for every phenotype on {name}")
+        row = measure(lambda: [objective(p) for p in phenotypes], len(phenotypes), max_repeat=5, min_repeat=3)
+        row["penalties"] = penalties
+        results.append(({"case": "trading_objective", "data": name, "bars": len(data)}, row))
+        evaluator = VectorizedEvaluator(data)
+        results.append(({"case": "vectorized_objective", "data": name, "bars": len(data)},
+                        measure(lambda: evaluator.evaluate(trading_objective, batch), len(batch), max_repeat=20)))
+    return results
+
+
+SUITES = {"grammar": suite_grammar, "parse": suite_parse, "operators": suite_operators, "objective": suite_objective}
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(quick=False, only=None):
+    """Runs the selected suites and returns a JSON-serialisable report."""
+    import warnings
+    cases = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # backtesting warns about trades left open
+        for name, suite in SUITES.items():
+            if only and name not in only:
+                continue
+            for params, row in suite(quick):
+                cases.append({"params": params, **row})
+    return {
+        "meta": {"commit": _commit(), "python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "quick": quick},
+        "cases": cases,
+    }
+
+
+def _case_key(case):
+    return json.dumps(case["params"], sort_keys=True)
+
+
+def compare(old, new, threshold=0.25):
+    """[(params, old ops/s, new ops/s, speed ratio, peak memory ratio, regressed)] for cases present in both reports."""
+    before = {_case_key(c): c for c in old["cases"] if "ops_per_s" in c}
+    rows = []
+    for case in new["cases"]:
+        prev = before.get(_case_key(case))
+        if prev is None or "ops_per_s" not in case:
+            continue
+        speed = case["ops_per_s"] / prev["ops_per_s"]
+        memory = case["peak_bytes"] / prev["peak_bytes"] if prev["peak_bytes"] else float("nan")
+        rows.append((case["params"], prev["ops_per_s"], case["ops_per_s"], speed, memory, speed < 1 - threshold))
+    return rows
+
+
+def _print_cases(report):
+    for case in report["cases"]:
+        label = " ".join(f"{k}={v}" for k, v in case["params"].items())
+        if "ops_per_s" in case:
+            failed = f"  ({case['parse_errors']} inputs rejected)" if case.get("parse_errors") else ""
+            print(f"{label:<70}{case['ops_per_s']:>14.1f} ops/s{case['peak_bytes'] / 1e6:>10.2f} MB{failed}")
+        else:
+            print(f"{label:<70}  {case.get('error') or case.get('skipped', '')}")
+
+
+def _print_comparison(rows):
+    print(f"{'case':<70}{'old ops/s':>12}{'new ops/s':>12}{'speed':>8}{'memory':>8}")
+    for params, old, new, speed, memory, regressed in rows:
+        label = " ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{label:<70}{old:>12.1f}{new:>12.1f}{speed:>8.2f}{memory:>8.2f}{'  SLOWER' if regressed else ''}")
+
+
+def _legacy_reports():
+    from trading import trading_bnf, trading_objective
+    for title, bnf in (("trading_bnf", trading_bnf), ("math grammar", MATH_BNF)):
+        print(f"\nGeneration, {title}, 10k trees:", bench_generation(bnf))
+    _report("trading_bnf, 10k individuals", bench_genotype(trading_bnf))
+    _report("math grammar, 10k individuals", bench_genotype(MATH_BNF))
+    print("\nGenerational vs steady-state, 4 workers, uneven evaluation times:")
+    for mode, row in bench_steady_state().items():
+        print(f"  {mode:<13} {row['evaluations']} evaluations in {row['seconds']:.2f}s"
+              f" = {row['evals_per_s']:.1f}/s, worker utilization {row['utilization']:.0%}")
+    print(f"\nIsland model, trading_objective, 1..{os.cpu_count()} islands:")
+    for islands, row in bench_islands(trading_objective, trading_bnf).items():
+        print(f"  {islands} islands: {row['evaluations']} evaluations in {row['seconds']:.2f}s"
+              f" = {row['evals_per_s']:.1f}/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the suite and write a JSON report")
+    run.add_argument("--out", help="JSON file to write (default: print only)")
+    run.add_argument("--quick", action="store_true", help="smaller sizes, for a fast smoke run")
+    run.add_argument("--only", nargs="+", choices=sorted(SUITES), help="suites to run (default: all)")
+    cmp = commands.add_parser("compare", help="compare two JSON reports")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.25, help="relative slowdown reported as a regression")
+    commands.add_parser("report", help="print the Node/LinearTree, generator, steady-state and island comparisons")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run_suite(args.quick, args.only)
+        _print_cases(report)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(report, f, indent=1)
+    elif args.command == "compare":
+        with open(args.old) as f_old, open(args.new) as f_new:
+            rows = compare(json.load(f_old), json.load(f_new), args.threshold)
+        _print_comparison(rows)
+        sys.exit(1 if any(r[-1] for r in rows) else 0)
+    else:
+        _legacy_reports()
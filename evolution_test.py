@@ -0,0 +1,444 @@
+import io
+import os
+import json
+import time
+import random
+import tempfile
+import threading
+import unittest
+import contextlib
+from Grammar import Grammar, DerivationTree, Node, TerminalSymbol
+from EvolutionaryAlgorithm import EvolutionaryAlgorithm, Individual
+from FitnessCache import FitnessCache, fingerprint
+from Evaluators import SerialEvaluator, ThreadPoolEvaluator, ProcessPoolEvaluator, FAILURE_PENALTY, FAILED
+from Reporters import MemoryReporter, JsonlReporter, PrintReporter
+from IslandModel import IslandModel, neighbours, encode_migrant, decode_migrant
+from Checkpoint import read_checkpoint, save_checkpoint
+from SteadyState import SteadyState
+from Surrogate import SurrogateModel
+
+
+def length_objective(phenotype):
+    return float(len(phenotype))
+
+
+def fragile_objective(phenotype):
+    if phenotype == "crash":
+        os._exit(1)
+    if phenotype == "hang":
+        time.sleep(30)
+    if phenotype == "raise":
+        raise RuntimeError(phenotype)
+    return float(len(phenotype))
+
+
+class TestFitnessCache(unittest.TestCase):
+
+    def setUp(self):
+        self.gram = Grammar("<S> ::= <S>+<S> | <S>*<S> | x | y")
+
+    def test_lru_is_bounded(self):
+        cache = FitnessCache(maxsize=2)
+        for p in ("a", "b", "c"):
+            cache.put(p, 1.0)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), 1.0)
+        self.assertEqual(cache.generation_stats(), (1, 1))
+        self.assertEqual(cache.generation_stats(), (0, 0))
+
+    def test_disk_store_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite")
+            key = fingerprint(length_objective, "data-v1")
+            cache = FitnessCache(fingerprint=key, path=path)
+            cache.put("x+y", 3.0)
+            cache.close()
+
+            reopened = FitnessCache(fingerprint=key, path=path)
+            self.assertEqual(reopened.get("x+y"), 3.0)
+            reopened.close()
+
+            other = FitnessCache(fingerprint=fingerprint(length_objective, "data-v2"), path=path)
+            self.assertIsNone(other.get("x+y"))
+            other.close()
+
+    def test_nan_scores_are_not_stored(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite")
+            cache = FitnessCache(path=path)
+            cache.put("x", float("nan"))
+            cache.put("y", float("inf"))
+            cache.flush()
+            self.assertIsNone(cache.get("x"))
+            cache.close()
+            reopened = FitnessCache(path=path)
+            self.assertIsNone(reopened.get("x"))
+            self.assertEqual(reopened.get("y"), float("inf"))
+            reopened.close()
+
+    def test_evaluate_skips_cached_phenotypes(self):
+        calls = []
+        def objective(phenotype):
+            calls.append(phenotype)
+            return 1.0
+        ea = EvolutionaryAlgorithm(self.gram, objective, fitness_cache=FitnessCache())
+        tree = self.gram.generate_derivation_tree()
+        first, second = Individual(tree), Individual(tree)
+        ea._evaluate(first)
+        ea._evaluate(second)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first.fitness, second.fitness)
+
+
+class TestGeneticOperators(unittest.TestCase):
+
+    def setUp(self):
+        self.gram = Grammar("<S> ::= <S>+<S> | <S>*<S> | x | y | (<S>)")
+        self.ea = EvolutionaryAlgorithm(self.gram, length_objective)
+
+    def test_offspring_share_subtrees_without_touching_parents(self):
+        p1 = Individual(self.gram.generate_derivation_tree())
+        p2 = Individual(self.gram.generate_derivation_tree())
+        before = (p1.genotype.to_parenthesis(), p2.genotype.to_parenthesis())
+        for _ in range(20):
+            child = self.ea.crossover(p1, p2)
+            mutant = self.ea.mutate(p1)
+            self.assertEqual(child.phenotype, child.genotype.string())
+            self.assertEqual(mutant.phenotype, mutant.genotype.string())
+        self.assertEqual((p1.genotype.to_parenthesis(), p2.genotype.to_parenthesis()), before)
+
+        parent_nodes = {id(n) for n in self.ea._get_all_nodes(p1.genotype.root_node)}
+        parent_nodes |= {id(n) for n in self.ea._get_all_nodes(p2.genotype.root_node)}
+        child_nodes = self.ea._get_all_nodes(child.genotype.root_node)
+        shared = sum(id(n) in parent_nodes for n in child_nodes)
+        self.assertGreater(shared, 0)
+        self.assertIsInstance(child.genotype.root_node.children, tuple)
+
+    def test_node_index_stays_correct_without_rebuild(self):
+        def rebuilt(tree):
+            fresh = DerivationTree(tree.grammar, root_node=tree.root_node).node_index()
+            return {sym: sorted(paths) for sym, paths in fresh.items()}
+
+        population = [Individual(t) for t in self.gram.generate_many(10, seed=1)]
+        for _ in range(200):
+            p1, p2 = random.sample(population, 2)
+            child = self.ea.crossover(p1, p2) if random.random() < 0.7 else self.ea.mutate(p1)
+            self.assertIsNotNone(child.genotype._index)
+            incremental = {sym: sorted(paths) for sym, paths in child.genotype._index.items()}
+            self.assertEqual(incremental, rebuilt(child.genotype))
+            population[random.randrange(len(population))] = child
+
+    def test_phenotype_rebuilt_from_cached_fragments(self):
+        def leaves(node):
+            stack, out = [node], []
+            while stack:
+                curr = stack.pop()
+                if curr.children: stack.extend(reversed(curr.children))
+                else: out.append(curr.symbol.text)
+            return "".join(out)
+
+        population = [Individual(t) for t in self.gram.generate_many(10, seed=2)]
+        for _ in range(100):
+            p1, p2 = random.sample(population, 2)
+            child = self.ea.crossover(p1, p2)
+            self.assertEqual(child.phenotype, leaves(child.genotype.root_node))
+            self.assertEqual(child.complexity, len(child.phenotype))
+            population[random.randrange(len(population))] = child
+
+        # Subtrees shared with the parents keep their rendered fragment.
+        root = child.genotype.root_node
+        self.assertTrue(all(c._text is not None for c in root.children if c.children))
+
+    def test_replace_subtree_copies_only_the_path(self):
+        tree = DerivationTree(self.gram)
+        left, _, right = tree._expand(tree.root_node, self.gram.production_rules[tree.root_node.symbol][0])
+        tree._expand(left, [TerminalSymbol("x")])
+        tree._expand(right, [TerminalSymbol("y")])
+        replaced = tree.replace_subtree((2,), [Node(TerminalSymbol("z"))])
+        self.assertEqual(tree.string(), "x+y")
+        self.assertEqual(replaced.string(), "x+z")
+        self.assertIs(replaced.root_node.children[0], tree.root_node.children[0])
+        self.assertIsNot(replaced.root_node, tree.root_node)
+
+class TestEvaluators(unittest.TestCase):
+
+    def test_results_keep_input_order_for_any_worker_count(self):
+        phenotypes = ["x" * n for n in range(1, 12)]
+        expected = SerialEvaluator().evaluate(length_objective, phenotypes)
+        for workers, chunksize in ((1, 1), (2, 3), (4, 5)):
+            with ThreadPoolEvaluator(workers=workers, chunksize=chunksize) as ev:
+                self.assertEqual(ev.evaluate(length_objective, phenotypes), expected)
+        with ProcessPoolEvaluator(workers=2, chunksize=4) as ev:
+            self.assertEqual(ev.evaluate(length_objective, phenotypes), expected)
+
+    def test_crash_and_timeout_get_the_penalty(self):
+        phenotypes = ["ab", "crash", "abc", "hang", "raise", "abcd"]
+        for chunksize in (1, 2):
+            with self.subTest(chunksize=chunksize), \
+                    ProcessPoolEvaluator(workers=2, chunksize=chunksize, timeout=1.0) as ev:
+                scores = ev.evaluate(fragile_objective, phenotypes)
+                # Healthy phenotypes in flight alongside a crash or hang keep their own scores.
+                self.assertEqual(scores, [2.0, FAILURE_PENALTY, 3.0, FAILURE_PENALTY, FAILURE_PENALTY, 4.0])
+                # The pool is rebuilt after a failure.
+                self.assertEqual(ev.evaluate(fragile_objective, ["abcde"]), [5.0])
+
+    def test_crashes_are_not_cached(self):
+        gram = Grammar("<S> ::= crash | raise | ab")
+        cache = FitnessCache()
+        with ProcessPoolEvaluator(workers=2, timeout=1.0) as ev:
+            self.assertEqual(ev.evaluate_fidelity(fragile_objective, ["crash", "ab"]),
+                             [(FAILURE_PENALTY, FAILED), (2.0, 1.0)])
+            ea = EvolutionaryAlgorithm(gram, fragile_objective, evaluator=ev, fitness_cache=cache)
+            individuals = [Individual(gram.parse_string(p)) for p in ("crash", "raise", "ab")]
+            ea._evaluate_population(individuals)
+        self.assertEqual([ind.fidelity for ind in individuals], [FAILED, 1.0, 1.0])
+        # The objective's own failure is a score like any other; a lost worker is not.
+        self.assertIsNone(cache.get("crash"))
+        self.assertEqual(cache.get("raise"), FAILURE_PENALTY)
+        self.assertEqual(cache.get("ab"), 2.0)
+
+
+class TestReporters(unittest.TestCase):
+
+    def setUp(self):
+        self.gram = Grammar("<S> ::= <S>+<S> | <S>*<S> | x | y | (<S>)")
+
+    def test_records_counters_and_phases(self):
+        objective = lambda p: 2000.0 if "*" in p else 1000.0 if "+" in p else float(len(p))
+        memory = MemoryReporter()
+        random.seed(4)
+        EvolutionaryAlgorithm(self.gram, objective, population_size=12, reporters=[memory],
+                              fitness_cache=FitnessCache()).run(gens=3)
+        self.assertEqual([r["generation"] for r in memory.records], [0, 1, 2])
+        first = memory.records[0]
+        self.assertTrue(0 < first["evaluations"] <= 12)
+        for record in memory.records:
+            self.assertEqual(record["evaluations"], record["cache_misses"])
+            self.assertLessEqual(sum(record["penalties"].values()), record["evaluations"])
+            self.assertGreater(record["nodes_allocated"], 0)
+            self.assertTrue(all(t >= 0 for t in record["seconds"].values()))
+        self.assertGreater(first["seconds"]["generate"], 0)
+        self.assertGreater(memory.records[1]["seconds"]["breed"], 0)
+
+    def test_jsonl_sink_and_print_reporter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.jsonl")
+            out = io.StringIO()
+            random.seed(4)
+            with JsonlReporter(path) as sink, contextlib.redirect_stdout(out):
+                ea = EvolutionaryAlgorithm(self.gram, length_objective, population_size=8,
+                                           reporters=[PrintReporter(), sink])
+                best = ea.run(gens=2)
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 2)
+        self.assertEqual([r["generation"] for r in records], [0, 1])
+        self.assertEqual(records[1]["best_fitness"], best.fitness)
+        self.assertTrue(out.getvalue().startswith("Gen 0 | Best Score: "))
+        self.assertIn(f"Gen 1 | Best Score: {best.fitness:.2f} | Phenotype: ", out.getvalue())
+
+
+class TestIslandModel(unittest.TestCase):
+
+    def setUp(self):
+        self.gram = Grammar("<S> ::= <S>+<S> | <S>*<S> | x | y | (<S>)")
+
+    def test_migrants_round_trip_as_bytes(self):
+        random.seed(2)
+        ind = Individual(self.gram.generate_derivation_tree())
+        ind.fitness = 4.5
+        payload = encode_migrant(ind)
+        self.assertIsInstance(payload[0], bytes)
+        copy = decode_migrant(self.gram, payload)
+        self.assertEqual((copy.phenotype, copy.fitness), (ind.phenotype, ind.fitness))
+
+    def test_topologies(self):
+        self.assertEqual(neighbours(3, 4, "ring"), [0])
+        self.assertEqual(neighbours(1, 3, "full"), [0, 2])
+        self.assertEqual(neighbours(0, 1, "full"), [])
+
+    def test_reproducible_from_master_seed(self):
+        runs = []
+        for _ in range(2):
+            model = IslandModel(self.gram, length_objective, islands=3, population_size=10,
+                                migration_interval=2, migrants=2, topology="full", seed=11)
+            best = model.run(gens=5)
+            runs.append((best.phenotype, best.fitness, [r["evaluations"] for r in model.results]))
+            self.assertEqual([r["immigrants"] for r in model.results], [8, 8, 8])
+        self.assertEqual(runs[0], runs[1])
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.gram = Grammar("<S> ::= <S>+<S> | <S>*<S> | x | y | (<S>)")
+
+    def _run(self, gens, surrogate=False, **kwargs):
+        model = SurrogateModel(self.gram, min_samples=20) if surrogate else None
+        ea = EvolutionaryAlgorithm(self.gram, length_objective, population_size=12, verbose=False,
+                                   surrogate=model)
+        best = ea.run(gens, **kwargs)
+        return ea, best
+
+    def test_resume_matches_uninterrupted_run(self):
+        for surrogate in (False, True):
+            with self.subTest(surrogate=surrogate), tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "run.ckpt")
+                random.seed(5)
+                full, best = self._run(6, surrogate)
+                state = random.getstate()
+                random.seed(5)
+                self._run(3, surrogate, checkpoint=path)
+                random.seed(99)  # the checkpoint, not the caller, decides the RNG state
+                resumed, resumed_best = self._run(6, surrogate, resume_from=path)
+                self.assertEqual(resumed.generation, 5)
+                self.assertEqual(random.getstate(), state)
+                self.assertEqual(resumed.evaluations, full.evaluations)
+                self.assertEqual([(i.phenotype, i.fitness) for i in resumed.population],
+                                 [(i.phenotype, i.fitness) for i in full.population])
+                self.assertEqual((resumed_best.phenotype, resumed_best.fitness), (best.phenotype, best.fitness))
+                if surrogate:
+                    self.assertGreater(full.surrogate.stats["screened"], 0)
+                    self.assertEqual(resumed.surrogate.checkpoint_state(), full.surrogate.checkpoint_state())
+
+    def test_rejects_other_grammar(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.ckpt")
+            random.seed(1)
+            self._run(1, checkpoint=path)
+            self.assertEqual(len(read_checkpoint(path, self.gram)[1]), 12)
+            with self.assertRaises(ValueError):
+                read_checkpoint(path, Grammar("<S> ::= <S>+<S> | x | y"))
+
+    def test_reads_lazy_trees(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.ckpt")
+            random.seed(2)
+            ea, _ = self._run(2)
+            save_checkpoint(path, ea)
+            _, loaded = read_checkpoint(path, self.gram)
+            self.assertTrue(all(ind.genotype._root is None for ind in loaded))
+            self.assertEqual([(i.phenotype, i.fitness, i.fidelity) for i in loaded],
+                             [(i.phenotype, i.fitness, i.fidelity) for i in ea.population])
+            for ind, original in zip(loaded, ea.population):
+                self.assertEqual(ind.genotype.to_parenthesis(), original.genotype.to_parenthesis())
+                self.assertEqual(ind.genotype.node_index(), original.genotype.node_index())
+
+            with open(path, "r+b") as f:  # the last rule id of the last tree becomes a binary rule
+                f.seek(-4, os.SEEK_END)
+                f.write((0).to_bytes(4, "little"))
+            with self.assertRaises(ValueError):
+                read_checkpoint(path, self.gram)
+
+    def test_spliced_encoding_matches_fresh_encoding(self):
+        random.seed(8)
+        ea = EvolutionaryAlgorithm(self.gram, length_objective, population_size=10, verbose=False)
+        ea.initialize()
+        for ind in ea.population:
+            ind.genotype.rule_code()
+        for _ in range(200):
+            a, b = random.sample(ea.population, 2)
+            child = ea.crossover(a, b) if random.random() < 0.5 else ea.mutate(a)
+            ea.population[random.randrange(10)] = child
+            fresh = DerivationTree(self.gram, root_node=child.genotype.root_node)
+            self.assertEqual(child.genotype.rule_code(), fresh.rule_code())
+            self.assertEqual(child.genotype.node_index(), fresh.node_index())
+
+
+class TestSteadyState(unittest.TestCase):
+    def setUp(self):
+        self.gram = Grammar("<S> ::= <S>+<S> | <S>*<S> | x | y | (<S>)")
+        random.seed(4)
+
+    def test_budget_and_replacement(self):
+        reporter = MemoryReporter()
+        ea = EvolutionaryAlgorithm(self.gram, fragile_objective, population_size=10, verbose=False,
+                                   reporters=[reporter])
+        steady = SteadyState(ea, concurrency=3)
+        best = steady.run(max_evaluations=60)
+        self.assertEqual((steady.stats["stop"], steady.stats["completed"], ea.evaluations), ("budget", 60, 60))
+        self.assertEqual(len(ea.population), 10)
+        self.assertEqual([i.fitness for i in ea.population], sorted(i.fitness for i in ea.population))
+        self.assertIs(best, ea.population[0])
+        self.assertEqual(sum(r["evaluations"] for r in reporter.records), 60)
+
+    def test_keeps_evaluations_in_flight(self):
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def objective(phenotype):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.002)
+            with lock:
+                running[0] -= 1
+            if phenotype.startswith("x"):
+                raise RuntimeError(phenotype)
+            return float(len(phenotype))
+
+        ea = EvolutionaryAlgorithm(self.gram, objective, population_size=8, verbose=False)
+        with ThreadPoolEvaluator(workers=4) as evaluator:
+            ea.evaluator = evaluator
+            SteadyState(ea).run(max_evaluations=40)
+        self.assertEqual(peak[0], 4)
+        failed = [i for i in ea.population if i.phenotype.startswith("x")]
+        self.assertTrue(all(i.fitness >= FAILURE_PENALTY for i in failed))
+
+    def test_stop_conditions(self):
+        ea = EvolutionaryAlgorithm(self.gram, length_objective, population_size=10, verbose=False)
+        steady = SteadyState(ea, concurrency=2)
+        best = steady.run(target_fitness=5.0, max_evaluations=5000)
+        self.assertEqual(steady.stats["stop"], "target")
+        self.assertLessEqual(best.fitness, 5.0)
+        steady.run(patience=15, max_evaluations=5000)
+        self.assertEqual(steady.stats["stop"], "patience")
+        with self.assertRaises(ValueError):
+            steady.run()
+
+
+class TestSurrogate(unittest.TestCase):
+
+    def setUp(self):
+        self.gram = Grammar("<S> ::= <S>+<S> | <S>*<S> | x | y | (<S>)")
+
+    def test_learns_a_rule_based_score(self):
+        # Each "*" costs 3 and each "x" 1: exactly linear in the rule counts.
+        objective = lambda p: 3.0 * p.count("*") + p.count("x")
+        trees = self.gram.generate_many(200, seed=1, max_expansions=20)
+        individuals = [Individual(t) for t in trees]
+        for ind in individuals:
+            ind.fitness, ind.fidelity = objective(ind.phenotype), 1.0
+        model = SurrogateModel(self.gram, min_samples=100, ridge=1e-6)
+        model.observe(individuals[:100])
+        self.assertTrue(model.ready)
+        predicted = model.predict(trees[100:])
+        actual = [ind.fitness for ind in individuals[100:]]
+        self.assertLess(max(abs(p - a) for p, a in zip(predicted, actual)), 1e-3)
+
+        candidates = [Individual(t) for t in self.gram.generate_many(40, seed=2, max_expansions=20)]
+        chosen = model.select(candidates, 10)
+        self.assertEqual(len(chosen), 10)
+        best = sorted(objective(c.phenotype) for c in candidates)[:9]
+        self.assertEqual(sorted(objective(c.phenotype) for c in chosen)[:9], best)  # 9 best + 1 explored
+        self.assertGreater(model.stats["backtests_saved"], 0)
+
+    def test_screening_saves_evaluations(self):
+        objective = lambda p: 3.0 * p.count("*") + p.count("x") + 0.5 * len(p)
+        runs = {}
+        for surrogate in (None, SurrogateModel(self.gram, keep=0.25, min_samples=20)):
+            random.seed(3)
+            memory = MemoryReporter()
+            ea = EvolutionaryAlgorithm(self.gram, objective, population_size=20, complexity_coefficient=0.0,
+                                       reporters=[memory], surrogate=surrogate, max_tree_size=20)
+            ea.run(gens=8)
+            runs[surrogate is None] = (ea.evaluations, memory.records)
+        self.assertLess(runs[False][0], runs[True][0])
+        screened = [r["surrogate"] for r in runs[False][1] if r["surrogate"]["screened"]]
+        self.assertTrue(screened)
+        self.assertTrue(all(r["backtests_saved"] >= 0 and r["trained_on"] >= 20 for r in screened))
+        self.assertTrue(all(r["surrogate"] is None for r in runs[True][1]))
+        json.dumps(runs[False][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+import Grammar as grammar_module
+from Grammar import Grammar, NonterminalSymbol, GENERATION_METHODS
+from EvolutionaryAlgorithm import EvolutionaryAlgorithm
+from FitnessCache import FitnessCache
+from LanguageSearch import LanguageSearch, FeistelPermutation
+from LinearTree import LinearTree
+from trading import trading_bnf
+from benchmarks import _legacy_generate, synthetic_bnf, synthetic_ohlc, measure, compare
+
+MATH_BNF = "<S> ::= <S>+<S> | <S>*<S> | x | y | (<S>)"
+
+
+class TestLinearTree(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(7)
+        self.grammars = [Grammar(trading_bnf), Grammar(MATH_BNF)]
+
+    def test_lossless_round_trip(self):
+        for gram in self.grammars:
+            for max_expansions in (3, 20, 100):
+                tree = gram.generate_derivation_tree(max_expansions=max_expansions)
+                linear = LinearTree.from_derivation_tree(tree)
+                self.assertEqual(linear.string(), tree.string())
+                self.assertEqual(linear.to_derivation_tree().to_parenthesis(), tree.to_parenthesis())
+
+    def test_operators_keep_sizes_consistent(self):
+        for gram in self.grammars:
+            a = LinearTree.from_derivation_tree(gram.generate_derivation_tree())
+            b = LinearTree.from_derivation_tree(gram.generate_derivation_tree())
+            for child in (a.crossover(b), a.mutate()):
+                rebuilt = LinearTree.from_derivation_tree(child.to_derivation_tree())
+                self.assertEqual(rebuilt.rules.tolist(), child.rules.tolist())
+                self.assertEqual(rebuilt.sizes.tolist(), child.sizes.tolist())
+            i = min(1, len(a) - 1)
+            sub = a.subtree(i)
+            self.assertEqual(len(sub), a.sizes[i])
+            self.assertIs(sub.rules.base, a.rules)
+
+class TestGeneration(unittest.TestCase):
+
+    def test_same_trees_as_the_original_generator(self):
+        for bnf in (trading_bnf, MATH_BNF):
+            gram = Grammar(bnf)
+            for seed in range(20):
+                random.seed(seed)
+                expected = _legacy_generate(gram, max_expansions=30).to_parenthesis()
+                random.seed(seed)
+                self.assertEqual(gram.generate_derivation_tree(max_expansions=30).to_parenthesis(), expected)
+
+    def test_generate_many_is_reproducible(self):
+        gram = Grammar(MATH_BNF)
+        first = [t.string() for t in gram.generate_many(50, seed=3)]
+        second = [t.string() for t in gram.generate_many(50, seed=3)]
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, [t.string() for t in gram.generate_many(50, seed=4)])
+
+class TestBoundedGeneration(unittest.TestCase):
+
+    def test_analysis(self):
+        gram = Grammar("<S> ::= <A> | <B> b\n<A> ::= <A> a | <U>\n<B> ::= c | (<B>)\n<C> ::= c")
+        analysis = gram.analysis()
+        S, A, B, C = (NonterminalSymbol(t) for t in "SABC")
+        self.assertEqual((analysis.min_size[S], analysis.min_depth[S]), (2, 2))
+        self.assertEqual(analysis.min_size[A], float("inf"))
+        self.assertEqual(analysis.productive, {S, B, C})
+        self.assertEqual(analysis.unproductive_rules, [0, 2, 3])
+        self.assertEqual(analysis.reachable, {S, B})
+        self.assertEqual(analysis.recursive, {B})
+        self.assertEqual(analysis.recursive_rules, {5})
+        self.assertIs(gram.analysis(), analysis)
+        self.assertEqual(Grammar(trading_bnf).analysis().min_size[NonterminalSymbol("PROGRAM")], 21)
+
+    def test_trees_are_complete_and_within_bounds(self):
+        gram = Grammar(MATH_BNF)
+        rng = random.Random(5)
+        for method in GENERATION_METHODS:
+            for max_size, max_depth in ((1, None), (12, None), (None, 4), (9, 3)):
+                if method == "ptc2" and max_size is None:
+                    continue
+                for _ in range(100):
+                    tree = gram.generate_bounded(max_size, max_depth, method, rng=rng)
+                    self.assertLessEqual(tree.size(), max_size or tree.size())
+                    self.assertLessEqual(tree.depth(), max_depth or tree.depth())
+                    self.assertTrue(all(r >= 0 for r in tree.rule_code()[0]))
+                    # The code recorded during generation is the one a walk of the tree gives.
+                    self.assertEqual(tree.rule_code(), grammar_module._encode_subtree(gram.rule_table(), tree.root_node))
+        full = [gram.generate_bounded(max_depth=4, method="full", rng=rng).depth() for _ in range(20)]
+        self.assertEqual(set(full), {4})
+        ramped = gram.generate_ramped(40, max_depth=5, min_depth=2, seed=1)
+        # Blocks of four depths alternate grow and full; full trees reach their depth bound.
+        self.assertEqual([t.depth() for t in ramped[4:8]], [2, 3, 4, 5])
+        self.assertLessEqual(max(t.depth() for t in ramped), 5)
+        with self.assertRaises(ValueError):
+            Grammar(trading_bnf).generate_bounded(max_size=20)
+        with self.assertRaises(ValueError):
+            gram.generate_bounded()
+
+    def test_mutation_keeps_trees_complete_and_bounded(self):
+        gram = Grammar(MATH_BNF)
+        random.seed(2)
+        ea = EvolutionaryAlgorithm(gram, len, verbose=False, max_tree_size=15, max_tree_depth=6)
+        ea.initialize()
+        for individual in ea.population:
+            for _ in range(20):
+                individual = ea.mutate(individual)
+                tree = individual.genotype
+                self.assertLessEqual(tree.size(), 15)
+                self.assertLessEqual(tree.depth(), 6)
+                self.assertTrue(all(r >= 0 for r in tree.rule_code()[0]))
+
+class TestLanguage(unittest.TestCase):
+
+    FINITE_BNF = "<S> ::= <A><A> | b\n<A> ::= x | y | <U> | (<B>)\n<B> ::= 1 | 2 | 3"
+
+    def test_counting_and_infinite_languages(self):
+        trading = Grammar(trading_bnf)
+        self.assertEqual(trading.count_derivations(), 9 ** 4 * 16)
+        self.assertEqual(trading.count_derivations(NonterminalSymbol("L12")), 16)
+        self.assertEqual(Grammar(self.FINITE_BNF).count_derivations(), 26)
+        self.assertFalse(Grammar(MATH_BNF).is_finite())
+        # Recursion below the root makes the language infinite too.
+        self.assertFalse(Grammar("<S> ::= a <T>\n<T> ::= b | <T> b").is_finite())
+        with self.assertRaises(ValueError):
+            Grammar(MATH_BNF).unrank(0)
+
+    def test_rank_unrank_is_a_bijection(self):
+        gram = Grammar(self.FINITE_BNF)
+        strings = [gram.unrank(i).string() for i in range(26)]
+        self.assertEqual(len(set(strings)), 26)
+        self.assertEqual([gram.rank(gram.unrank(i)) for i in range(26)], list(range(26)))
+        with self.assertRaises(IndexError):
+            gram.unrank(26)
+        trading = Grammar(trading_bnf)
+        search = LanguageSearch(trading, len)
+        for tree in trading.generate_many(20, seed=1):
+            index = trading.rank(tree)
+            self.assertEqual(trading.unrank(index).to_parenthesis(), tree.to_parenthesis())
+            self.assertEqual(search.render(index), tree.string())
+
+    def test_search_visits_every_program_once(self):
+        gram = Grammar(self.FINITE_BNF)
+        objective = lambda p: -p.count("3") + 0.1 * len(p)
+        seen = []
+        search = LanguageSearch(gram, lambda p: seen.append(p) or objective(p), batch_size=4)
+        result = search.run(order="random", seed=5)
+        self.assertTrue(result["complete"])
+        self.assertEqual(sorted(seen), sorted(gram.unrank(i).string() for i in range(26)))
+        self.assertEqual(result["best_score"], min(map(objective, seen)))
+        self.assertEqual(gram.unrank(result["best_index"]).string(), result["best_phenotype"])
+        self.assertEqual(sorted(map(FeistelPermutation(1000, seed=2), range(1000))), list(range(1000)))
+
+        # Resuming from a position covers the rest; an attached cache skips known programs.
+        cache = FitnessCache()
+        first = search.run(order="random", seed=5, limit=10)
+        self.assertFalse(first["complete"])
+        search.fitness_cache = cache
+        rest = search.run(order="random", seed=5, start=10)
+        again = search.run(order="random", seed=5, start=10)
+        self.assertEqual(first["visited"] + rest["visited"], 26)
+        self.assertEqual(again["evaluated"], 0)
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_synthetic_inputs(self):
+        gram = Grammar(synthetic_bnf(20))
+        self.assertEqual(len(gram.production_rules), 20)
+        self.assertTrue(all(t.string() for t in gram.generate_many(5, seed=0)))
+        data = synthetic_ohlc(300)
+        self.assertEqual(len(data), 300)
+        self.assertTrue((data.High >= data[["Open", "Close"]].max(axis=1)).all())
+
+    def test_reports_compare_by_case(self):
+        row = measure(lambda: sum(range(1000)), ops=1000, min_time=0.01)
+        self.assertGreater(row["ops_per_s"], 0)
+        self.assertGreaterEqual(row["repeats"], 5)
+        old = {"cases": [{"params": {"case": "a", "n": 1}, "ops_per_s": 100.0, "peak_bytes": 10}]}
+        new = {"cases": [{"params": {"n": 1, "case": "a"}, "ops_per_s": 50.0, "peak_bytes": 20},
+                         {"params": {"case": "b"}, "ops_per_s": 1.0, "peak_bytes": 1}]}
+        [(params, _, _, speed, memory, regressed)] = compare(old, new)
+        self.assertEqual((speed, memory, regressed), (0.5, 2.0, True))
+
+class TestParsing(unittest.TestCase):
+
+    def setUp(self):
+        # LALR tables go to a private temporary cache, never the user's.
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(grammar_module, "LARK_CACHE_DIR", tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache_dir = tmp.name
+
+    def test_trading_strategies_round_trip_with_lalr(self):
+        gram = Grammar(trading_bnf)
+        trees = gram.generate_many(20, seed=3)
+        parsed = list(gram.parse_many((t.string() for t in trees), parser="auto"))
+        self.assertEqual([p.to_parenthesis() for p, _ in parsed], [t.to_parenthesis() for t in trees])
+        self.assertEqual(grammar_module._lark_components(gram, "auto")[0].options.parser, "lalr")
+
+    def test_errors_are_reported_per_item(self):
+        gram = Grammar(MATH_BNF)
+        results = list(gram.parse_many(["x+y", "x+", "(y)*x"]))
+        self.assertEqual([r[1] is None for r in results], [True, False, True])
+        self.assertIsInstance(results[1][1], ValueError)
+        self.assertEqual(results[2][0].string(), "(y)*x")
+        with self.assertRaises(ValueError):
+            gram.parse_many(["x"], parser="cyk")
+
+    def test_ambiguous_grammar_falls_back_to_earley(self):
+        gram = Grammar(MATH_BNF)
+        self.assertEqual(grammar_module._lark_components(gram, "auto")[0].options.parser, "earley")
+        self.assertEqual(gram.parse_string("x+y*x", "auto").string(), "x+y*x")
+
+    def test_auto_retries_what_the_contextual_lexer_rejects(self):
+        gram = Grammar("""
+        <S> ::= <A> <B>
+        <A> ::= "a" | "ab"
+        <B> ::= "b" | "c"
+        """)
+        self.assertEqual(grammar_module._lark_components(gram, "auto")[0].options.parser, "lalr")
+        self.assertEqual(gram.parse_string("ab").to_parenthesis(), gram.parse_string("ab", "auto").to_parenthesis())
+        self.assertEqual([error is None for _, error in gram.parse_many(["ab", "abc", "ax"], "auto")],
+                         [True, True, False])
+        with self.assertRaises(ValueError):
+            gram.parse_string("ab", "lalr")
+
+    def test_deep_trees_and_disk_cache(self):
+        text = "(" * 3000 + "x" + ")" * 3000
+        for parser in ("earley", "auto", "auto"):  # the second "auto" grammar loads the cached tables
+            self.assertEqual(Grammar("<S> ::= (<S>) | x").parse_string(text, parser).string(), text)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_disk_cache_must_be_private(self):
+        gram = Grammar("<S> ::= (<S>) | x")
+        tmp = self.cache_dir
+        path = grammar_module._lark_cache_path(gram, "lalr")
+        self.assertIsNotNone(path)
+        os.chmod(tmp, 0o777)  # anyone could plant a pickle here
+        self.assertIsNone(grammar_module._lark_cache_path(gram, "lalr"))
+        os.chmod(tmp, 0o700)
+        with open(path, "w"):
+            pass
+        os.chmod(path, 0o666)
+        self.assertIsNone(grammar_module._lark_cache_path(gram, "lalr"))
+
+    def test_auto_falls_back_to_earley_without_lark_internals(self):
+        with mock.patch.object(grammar_module, "_check_lalr1", side_effect=ImportError("lark.common")):
+            gram = Grammar("<S> ::= (<S>) | x")
+            self.assertEqual(grammar_module._lark_components(gram, "auto")[0].options.parser, "earley")
+            self.assertEqual(gram.parse_string("((x))", "auto").string(), "((x))")
+
+if __name__ == '__main__':
+    unittest.main()
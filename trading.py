@@ -1,16 +1,11 @@
-import re as _re
-import copy as _copy
-import random as _random
-import lark as _lark
-import pandas as pd
 import numpy as np
-from backtesting import Backtest, Strategy
-from backtesting.lib import crossover
-from backtesting.test import SMA, GOOG
 # Risk-Adjusted Returns
 # Importing your custom logic from your files
 from Grammar import Grammar
 from EvolutionaryAlgorithm import EvolutionaryAlgorithm, Individual
+from FitnessCache import FitnessCache, fingerprint
+from IndicatorCache import IndicatorCache, dataset_id, slice_bounds, slice_id
+from Evaluators import ProcessPoolEvaluator, SuccessiveHalvingEvaluator
 
 # --- 1. THE TRADING BNF ---
 trading_bnf = r"""
@@ -33,24 +28,82 @@ trading_bnf = r"""
 <NUMBER> ::= "10" | "20" | "30" | "40" | "50" | "60" | "70" | "80" | "90"
 """
 
+# Every <NUMBER> window, so SMA(Close, n) is computed once per dataset instead of per backtest.
+SMA_WINDOWS = (10, 20, 30, 40, 50, 60, 70, 80, 90)
+INDICATORS = IndicatorCache()
+
+# backtesting imports pandas and bokeh (about a second), so it is loaded on the first
+# backtest rather than with this module; `trading.GOOG` and friends still work as before.
+_BACKTESTING_NAMES = ("Backtest", "Strategy", "crossover", "SMA", "GOOG", "GOOG_ID", "_cached_sma")
+
+def _load_backtesting():
+    global Backtest, Strategy, crossover, SMA, GOOG, GOOG_ID, _cached_sma
+    if "_cached_sma" in globals():
+        return
+    from backtesting import Backtest, Strategy
+    from backtesting.lib import crossover
+    from backtesting.test import SMA, GOOG
+    GOOG_ID = dataset_id(GOOG)
+    _cached_sma = INDICATORS.bind('SMA', SMA, GOOG, 'Close', dataset=GOOG_ID)
+
+def warm_up():
+    """Loads backtesting and GOOG now instead of on the first backtest (see EvaluationWorker.warm_up)."""
+    _load_backtesting()
+
+def __getattr__(name):
+    if name in _BACKTESTING_NAMES:
+        _load_backtesting()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def attach_indicators(manifest):
+    """Process-pool initializer: map the parent's shared indicator arrays instead of recomputing them."""
+    INDICATORS.attach(manifest)
+
 # --- 2. OBJECTIVE FUNCTION ---
-def trading_objective(phenotype_string):
+def _compile_strategy(phenotype_string, sma=None):
+    _load_backtesting()
     namespace = {
         'Strategy': Strategy, 
-        'SMA': SMA, 
+        'SMA': sma or _cached_sma, 
         'crossover': crossover,
         'np': np
     }
     
     code = phenotype_string.replace('\\n', '\n')
+    exec(code, namespace)
+    return namespace['EvoStrat']
+
+# SMA bindings for slices of GOOG that do not start at its first bar (walk-forward folds).
+_SLICE_SMA = {}
+
+def _sma_for(data):
+    """The SMA strategies backtested on `data` use: GOOG and its prefixes share the full-history
+    arrays, other slices of GOOG get their own INDICATORS entries, computed once per slice."""
+    if data is GOOG:
+        return _cached_sma
+    bounds = slice_bounds(GOOG, data)
+    if bounds is None or bounds[0] == 0:
+        return _cached_sma  # prefixes are served as views; anything else falls through to SMA
+    sma = _SLICE_SMA.get(bounds)
+    if sma is None:
+        sma = _SLICE_SMA[bounds] = INDICATORS.bind('SMA', SMA, data, 'Close', dataset=slice_id(GOOG_ID, *bounds))
+    return sma
+
+def _sortino(strat, data):
+    _load_backtesting()
+    bt = Backtest(data, strat, cash=10000, commission=.002, exclusive_orders=True)
+    stats = bt.run()
+    return stats['Sortino Ratio']
+
+def trading_objective(phenotype_string, data=None):
+    """-Sortino of the strategy on `data` (default: the full GOOG history), or a penalty."""
+    _load_backtesting()  # before anything below reads GOOG, also when `data` is given
+    if data is None:
+        data = GOOG
     
     try:
-        exec(code, namespace)
-        strat = namespace['EvoStrat']
-        bt = Backtest(GOOG, strat, cash=10000, commission=.002, exclusive_orders=True)
-        stats = bt.run()
-        
-        val = stats['Sortino Ratio']
+        val = _sortino(_compile_strategy(phenotype_string, _sma_for(data)), data)
         if np.isnan(val) or val <= 0:
             return 1000.0 
         
@@ -59,19 +112,58 @@ def trading_objective(phenotype_string):
     except Exception:
         return 2000.0
 
+def multi_asset_objective(phenotype_string, store, symbols=None, start=None, end=None):
+    """-(mean Sortino) across `symbols` of an OHLCStore (default: all), or the same penalties as trading_objective.
+
+    Symbols are backtested one at a time on zero-copy views of the store, so memory stays
+    bounded by a single symbol's bars. A symbol without a finite Sortino counts as 0.
+    """
+    try:
+        strat = _compile_strategy(phenotype_string)
+        total, count = 0.0, 0
+        for _, data in store.iter_frames(symbols, start, end):
+            val = _sortino(strat, data)
+            total += 0.0 if np.isnan(val) else val
+            count += 1
+            del data
+        mean = total / count if count else np.nan
+        if np.isnan(mean) or mean <= 0:
+            return 1000.0
+        
+        return -1.0 * mean
+    
+    except Exception:
+        return 2000.0
+
 # --- 3. EXECUTION BLOCK ---
 if __name__ == "__main__":
+    from vector_backtest import VectorizedEvaluator
+    _load_backtesting()
     gram = Grammar(trading_bnf)
+    INDICATORS.precompute('SMA', SMA, GOOG, 'Close', SMA_WINDOWS, dataset=GOOG_ID)
+    shared_indicators = INDICATORS.share()
+    cache = FitnessCache(
+        fingerprint=fingerprint(trading_objective, GOOG_ID),
+        path="fitness_cache.sqlite"
+    )
     
     ea = EvolutionaryAlgorithm(
         grammar=gram, 
         objective_function=trading_objective, 
         population_size=15, 
-        complexity_coefficient=0.01
+        complexity_coefficient=0.01,
+        fitness_cache=cache,
+        evaluator=SuccessiveHalvingEvaluator(GOOG, evaluator=VectorizedEvaluator(
+            GOOG, indicators=INDICATORS, dataset=GOOG_ID,
+            fallback=ProcessPoolEvaluator(timeout=60, initializer=attach_indicators, initargs=(shared_indicators,))
+        ))
     )
     
     print("--- STARTING TRADING STRATEGY EVOLUTION ---")
     best_ind = ea.run(gens=10)
+    cache.close()
+    ea.evaluator.close()
+    INDICATORS.close(unlink=True)
     
     # 1. Display Best Strategy Code
     print("\n" + "="*30)
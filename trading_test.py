@@ -1,8 +1,24 @@
+import os
+import sys
+import pickle
+import random
+import subprocess
+import tempfile
 import unittest
+from functools import partial
 import numpy as np
 from Grammar import Grammar
 from EvolutionaryAlgorithm import EvolutionaryAlgorithm, Individual
-from trading import trading_objective 
+from trading import trading_objective, multi_asset_objective, trading_bnf, INDICATORS, GOOG_ID, _compile_strategy, _sortino
+from OHLCStore import OHLCStore
+from benchmarks import synthetic_ohlc
+from IndicatorCache import IndicatorCache, slice_id, slice_bounds
+from backtesting.test import SMA, GOOG
+from vector_backtest import VectorizedEvaluator, params_from_tree, params_from_phenotype
+from Evaluators import SuccessiveHalvingEvaluator, WalkForwardEvaluator, walk_forward_folds
+from FitnessCache import fingerprint
+from EvaluationWorker import ObjectiveRef, check_budgets
+from LanguageSearch import LanguageSearch
 
 class TestTradingEvolution(unittest.TestCase):
 
@@ -77,5 +93,225 @@ class TestTradingEvolution(unittest.TestCase):
         # Ensure the champion is at the front
         self.assertTrue(pop[0].fitness <= pop[1].fitness <= pop[2].fitness)
 
+class TestVectorizedBacktest(unittest.TestCase):
+
+    def test_matches_backtesting_sortino(self):
+        gram = Grammar(trading_bnf)
+        trees = [gram.generate_derivation_tree() for _ in range(12)]
+        phenotypes = [t.string() for t in trees]
+        for tree, phenotype in zip(trees, phenotypes):
+            self.assertEqual(params_from_tree(tree), params_from_phenotype(phenotype))
+
+        fast = VectorizedEvaluator().evaluate(trading_objective, phenotypes)
+        for phenotype, score in zip(phenotypes, fast):
+            self.assertTrue(np.isclose(score, trading_objective(phenotype), rtol=1e-9, atol=0))
+
+    def test_uninterpretable_programs_fall_back(self):
+        phenotype = (
+            "class EvoStrat(Strategy):\n    n1 = 10\n"
+            "    def init(self): self.sma = self.I(SMA, self.data.Close, self.n1)\n"
+            "    def next(self):\n        if self.data.Close > self.sma: self.buy()"
+        )
+        self.assertIsNone(params_from_phenotype(phenotype))
+        scores = VectorizedEvaluator().evaluate(trading_objective, [phenotype])
+        self.assertEqual(scores, [trading_objective(phenotype)])
+
+class TestSuccessiveHalving(unittest.TestCase):
+
+    def setUp(self):
+        self.phenotypes = list(dict.fromkeys(t.string() for t in Grammar(trading_bnf).generate_many(16, seed=5)))
+
+    def test_prefix_scores_match_backtesting(self):
+        evaluator = SuccessiveHalvingEvaluator(GOOG, schedule=(0.25, 1.0), keep=0.25)
+        evaluator.evaluator = VectorizedEvaluator(GOOG)
+        results = evaluator.evaluate_fidelity(trading_objective, self.phenotypes[:6])
+        prefix = evaluator.prefixes[0]
+        for phenotype, (score, fidelity) in zip(self.phenotypes, results):
+            full = fidelity == 1.0
+            expected = trading_objective(phenotype) if full else trading_objective(phenotype, data=prefix)
+            self.assertTrue(np.isclose(score, expected, rtol=1e-9, atol=0))
+        self.assertEqual(sum(f == 1.0 for _, f in results), 2)
+
+    def test_survivors_outrank_rejected_individuals(self):
+        evaluator = SuccessiveHalvingEvaluator(GOOG, evaluator=VectorizedEvaluator(GOOG))
+        ea = EvolutionaryAlgorithm(Grammar(trading_bnf), trading_objective, population_size=len(self.phenotypes),
+                                   evaluator=evaluator, verbose=False)
+        ea.population = [Individual(t) for t in Grammar(trading_bnf).generate_many(16, seed=5)]
+        ea.rank(0)
+        fidelities = [ind.fidelity for ind in ea.population]
+        self.assertEqual(fidelities, sorted(fidelities, reverse=True))
+        self.assertLess(evaluator.bars, len(GOOG) * len(self.phenotypes))
+        full = VectorizedEvaluator(GOOG).evaluate(trading_objective, self.phenotypes)
+        self.assertEqual(ea.population[0].phenotype, self.phenotypes[int(np.argmin(full))])
+
+    def test_language_search_reports_a_full_fidelity_best(self):
+        evaluator = SuccessiveHalvingEvaluator(GOOG, evaluator=VectorizedEvaluator(GOOG))
+        search = LanguageSearch(Grammar(trading_bnf), trading_objective, evaluator=evaluator, batch_size=256)
+        result = search.run(order="random", seed=1, limit=1024)
+        self.assertLess(evaluator.bars, len(GOOG) * 1024)
+        self.assertTrue(np.isclose(result["best_score"], trading_objective(result["best_phenotype"]),
+                                   rtol=1e-9, atol=0))
+
+class TestWalkForward(unittest.TestCase):
+
+    def setUp(self):
+        self.phenotypes = list(dict.fromkeys(t.string() for t in Grammar(trading_bnf).generate_many(40, seed=8)))
+
+    def test_folds_match_backtesting_and_share_indicators(self):
+        self.assertEqual(walk_forward_folds(10, 3), [(0, 3), (3, 7), (7, 10)])
+        self.assertEqual(walk_forward_folds(10, 3, anchored=True), [(0, 3), (0, 7), (0, 10)])
+        evaluator = WalkForwardEvaluator(GOOG, folds=3, prune=False,
+                                         evaluator=VectorizedEvaluator(GOOG, indicators=INDICATORS, dataset=GOOG_ID))
+        scores = evaluator.evaluate(trading_objective, self.phenotypes[:3])
+        for phenotype, score in zip(self.phenotypes, scores):
+            folds = [trading_objective(phenotype, data=fold) for fold in evaluator.folds]
+            self.assertTrue(np.isclose(score, np.mean(folds), rtol=1e-9, atol=0))
+        # Both paths read the per-fold SMA arrays built once in INDICATORS.
+        start, end = evaluator.bounds[1]
+        self.assertTrue(any(k[3] == slice_id(GOOG_ID, start, end) for k in INDICATORS._arrays))
+
+    def test_pruned_individuals_rank_after_full_ones(self):
+        evaluator = WalkForwardEvaluator(GOOG, folds=4, aggregate="worst", evaluator=VectorizedEvaluator(GOOG))
+        evaluator.evaluate(trading_objective, self.phenotypes[:5])  # sets the elite
+        ea = EvolutionaryAlgorithm(Grammar(trading_bnf), trading_objective, population_size=len(self.phenotypes),
+                                   evaluator=evaluator, verbose=False)
+        ea.population = [Individual(t) for t in Grammar(trading_bnf).generate_many(40, seed=8)]
+        ea.rank(0)
+        fidelities = [ind.fidelity for ind in ea.population]
+        self.assertEqual(fidelities, sorted(fidelities, reverse=True))
+        self.assertLess(fidelities[-1], 1.0)
+        self.assertGreater(evaluator.folds_skipped, 0)
+        # "worst" pruning is exact: the champion is the true minimax program.
+        full = WalkForwardEvaluator(GOOG, folds=4, aggregate="worst", prune=False, evaluator=VectorizedEvaluator(GOOG))
+        exact = full.evaluate(trading_objective, self.phenotypes)
+        self.assertEqual(ea.population[0].phenotype, self.phenotypes[int(np.argmin(exact))])
+        self.assertFalse(WalkForwardEvaluator(GOOG, aggregate="mean").prune)  # a heuristic bound: opt-in
+
+    def test_resume_restores_the_pruning_state(self):
+        def run(gens, **kwargs):
+            evaluator = WalkForwardEvaluator(GOOG, folds=3, aggregate="worst", evaluator=VectorizedEvaluator(GOOG))
+            ea = EvolutionaryAlgorithm(Grammar(trading_bnf), trading_objective, population_size=20,
+                                       evaluator=evaluator, verbose=False)
+            ea.run(gens, **kwargs)
+            return ea, evaluator
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.ckpt")
+            random.seed(4)
+            full, full_evaluator = run(5)
+            random.seed(4)
+            run(3, checkpoint=path)
+            resumed, resumed_evaluator = run(5, resume_from=path)
+        self.assertGreater(full_evaluator.folds_skipped, 0)
+        self.assertEqual([(i.phenotype, i.fitness, i.fidelity) for i in resumed.population],
+                         [(i.phenotype, i.fitness, i.fidelity) for i in full.population])
+        self.assertEqual(resumed_evaluator.checkpoint_state(), full_evaluator.checkpoint_state())
+
+class TestIndicatorCache(unittest.TestCase):
+
+    def test_objective_reads_shared_read_only_arrays(self):
+        trading_objective(Grammar(trading_bnf).generate_derivation_tree().string())
+        key = next(k for k in INDICATORS._arrays if k[0] == 'SMA' and k[3] == GOOG_ID)
+        self.assertFalse(INDICATORS._arrays[key].flags.writeable)
+
+        cache = IndicatorCache()
+        cache.precompute('SMA', SMA, GOOG, 'Close', (10, 20), dataset='goog')
+        manifest = cache.share()
+        try:
+            worker_view = IndicatorCache().attach(manifest)
+            self.assertEqual(len(worker_view), 2)
+            expected = SMA(GOOG.Close, 20).to_numpy()
+            np.testing.assert_array_equal(worker_view.get('SMA', None, GOOG, 'Close', 20, dataset='goog'), expected)
+            worker_view.close()
+        finally:
+            cache.close(unlink=True)
+
+    def test_unnamed_datasets_do_not_share_arrays(self):
+        cache = IndicatorCache()
+        other = GOOG.copy()
+        other['Close'] *= 2
+        np.testing.assert_array_equal(cache.get('SMA', SMA, GOOG, 'Close', 10), SMA(GOOG.Close, 10))
+        np.testing.assert_array_equal(cache.get('SMA', SMA, other, 'Close', 10), SMA(other.Close, 10))
+        np.testing.assert_array_equal(cache.bind('SMA', SMA, other, 'Close')(other.Close, 20), SMA(other.Close, 20))
+        self.assertEqual(len(cache), 3)
+
+    def test_other_data_on_the_same_calendar_is_not_a_slice(self):
+        other = GOOG.copy()
+        other[['Open', 'High', 'Low', 'Close']] *= 1.01
+        self.assertEqual(slice_bounds(GOOG, GOOG.iloc[100:900]), (100, 900))
+        self.assertIsNone(slice_bounds(GOOG, other.iloc[100:900]))
+        self.assertIsNone(slice_bounds(GOOG, other))
+
+        phenotype = Grammar(trading_bnf).generate_derivation_tree().string()
+        with self.assertRaises(ValueError):
+            VectorizedEvaluator(GOOG).evaluate(partial(trading_objective, data=other), [phenotype])
+        trading_objective(phenotype, data=other.iloc[100:900])
+        self.assertFalse(any(k[3] == slice_id(GOOG_ID, 100, 900) for k in INDICATORS._arrays))
+
+class TestOHLCStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = OHLCStore(self.tmp.name)
+        self.store.write("GOOG", GOOG)
+        self.store.write("SYN", synthetic_ohlc(1500, seed=3))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_zero_copy_date_range_views(self):
+        reopened = OHLCStore(self.tmp.name)
+        self.assertEqual(reopened.symbols(), ["GOOG", "SYN"])
+        frame = reopened.frame("GOOG", "2008-01-01", "2010-12-31")
+        expected = GOOG.loc["2008-01-01":"2010-12-31"]
+        np.testing.assert_array_equal(frame.index.values, expected.index.values)
+        np.testing.assert_array_equal(frame[["Open", "Close"]].to_numpy(), expected[["Open", "Close"]].to_numpy(dtype=float))
+        base = frame["Close"].to_numpy()
+        while base.base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        self.assertIsInstance(base, np.memmap)
+        self.assertFalse(frame["Close"].to_numpy().flags.writeable)
+
+    def test_multi_asset_objective_streams_symbols(self):
+        phenotype = next(p for p in (t.string() for t in Grammar(trading_bnf).generate_many(50, seed=2))
+                         if trading_objective(p) < 0)
+        window = ("2004-01-01", "2010-12-31")
+        strat = _compile_strategy(phenotype)
+        expected = np.mean([np.nan_to_num(_sortino(strat, self.store.frame(s, *window))) for s in self.store.symbols()])
+        self.assertTrue(np.isclose(multi_asset_objective(phenotype, self.store, start=window[0], end=window[1]),
+                                   -expected if expected > 0 else 1000.0))
+        self.assertEqual(multi_asset_objective(phenotype, self.store, symbols=["NOPE"]), 2000.0)
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_budgets(self):
+        for module, seconds, budget, heavy in check_budgets():
+            self.assertEqual(heavy, [], f"importing {module} loads {heavy}")
+            self.assertLessEqual(seconds, budget, f"importing {module} took {seconds * 1000:.0f} ms")
+
+    def test_objective_ref_stands_in_for_the_function(self):
+        ref = pickle.loads(pickle.dumps(ObjectiveRef("trading:trading_objective")))
+        self.assertEqual(fingerprint(ref, GOOG_ID), fingerprint(trading_objective, GOOG_ID))
+        phenotype = Grammar(trading_bnf).generate_derivation_tree().string()
+        self.assertEqual(ref(phenotype), trading_objective(phenotype))
+        with self.assertRaises(ValueError):
+            ObjectiveRef("trading_objective")("")
+
+    def test_objective_with_data_in_a_fresh_process(self):
+        # Nothing but the objective is imported, so backtesting is first loaded by the call itself.
+        # The data comes from backtesting.test directly: reading trading.GOOG would load it first.
+        code = ("import trading\n"
+                "from backtesting.test import GOOG\n"
+                "from Grammar import Grammar\n"
+                "p = Grammar(trading.trading_bnf).generate_many(1, seed=0)[0].string()\n"
+                "print(trading.trading_objective(p, data=GOOG.iloc[500:1500]),"
+                " trading.trading_objective(p, data=GOOG))")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        phenotype = Grammar(trading_bnf).generate_many(1, seed=0)[0].string()
+        expected = [trading_objective(phenotype, data=GOOG.iloc[500:1500]), trading_objective(phenotype, data=GOOG)]
+        self.assertNotIn(2000.0, expected)
+        self.assertEqual([float(x) for x in out.stdout.split()], expected)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
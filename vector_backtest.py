@@ -0,0 +1,290 @@
+"""Vectorized NumPy backtest for the SMA-crossover strategies that `trading_bnf` can express.
+
+Every program of the trading grammar is fully described by four SMA windows (n1..n4) and
+the pair of SMAs passed to `crossover(...)` in `next()`. Instead of exec'ing the source and
+stepping `Backtest` bar by bar, this module reads those six parameters and replays the
+`backtesting.py` broker rules (market orders filled at the next open, exclusive orders,
+whole units sized from the available cash, relative commission on entry and exit, open
+trades left open at the end) with array operations over the whole price series and over
+many individuals at once.
+
+The equity curve is reproduced operation for operation, so the Sortino ratio matches
+`Backtest(...).run()['Sortino Ratio']` to within a relative tolerance of 1e-9 (the only
+differences come from the summation order of the daily log-returns). Programs that do not
+fit the template are handed back to the regular `trading_objective` path.
+"""
+import re as _re
+import sys as _sys
+import numpy as np
+import pandas as pd
+from Grammar import NonterminalSymbol
+from Evaluators import SerialEvaluator
+from IndicatorCache import IndicatorCache, dataset_id, slice_bounds, slice_id
+
+# Same default order size as Strategy.buy() in backtesting.py.
+_FULL_EQUITY = 1 - _sys.float_info.epsilon
+
+# Scores returned by trading_objective for losing / unscorable strategies.
+NO_EDGE_PENALTY = 1000.0
+
+_TEMPLATE_LINES = (
+    "class EvoStrat(Strategy):",
+    "    n1 = {0}",
+    "    n2 = {1}",
+    "    n3 = {2}",
+    "    n4 = {3}",
+    "    def init(self):",
+    "        close = self.data.Close",
+    "        self.sma1 = self.I(SMA, close, self.n1)",
+    "        self.sma2 = self.I(SMA, close, self.n2)",
+    "        self.sma3 = self.I(SMA, close, self.n3)",
+    "        self.sma4 = self.I(SMA, close, self.n4)",
+    "    def next(self):",
+    "        if crossover(self.sma{4}, self.sma{5}):",
+    "            self.buy()",
+)
+_TEMPLATE = "\\n".join(_TEMPLATE_LINES)
+
+_PHENOTYPE_RE = _re.compile(
+    r"(?:\\n|\n)".join(
+        _re.escape(line).replace(r"\{0\}", r"(\d+)").replace(r"\{1\}", r"(\d+)")
+        .replace(r"\{2\}", r"(\d+)").replace(r"\{3\}", r"(\d+)")
+        .replace(r"\{4\}", r"([1-4])").replace(r"\{5\}", r"([1-4])")
+        for line in _TEMPLATE_LINES
+    )
+)
+
+
+def render_phenotype(params):
+    """Phenotype string the trading grammar derives for `params` = (n1, n2, n3, n4, a, b)."""
+    n1, n2, n3, n4, a, b = params
+    return _TEMPLATE.format(n1, n2, n3, n4, a + 1, b + 1)
+
+
+def params_from_phenotype(phenotype):
+    """(n1, n2, n3, n4, a, b) with 0-based SMA indices a, b, or None if the program is not an SMA crossover."""
+    m = _PHENOTYPE_RE.fullmatch(phenotype)
+    if m is None:
+        return None
+    g = m.groups()
+    windows = tuple(int(x) for x in g[:4])
+    if min(windows) < 1:
+        return None
+    return windows + (int(g[4]) - 1, int(g[5]) - 1)
+
+
+def params_from_tree(tree):
+    """Reads the strategy parameters straight off a trading-grammar DerivationTree.
+
+    Returns None for incomplete trees or trees of any other shape.
+    """
+    numbers, variables = [], []
+    stack = [tree.root_node]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node.symbol, NonterminalSymbol):
+            continue
+        if not node.children:
+            return None
+        if node.symbol.text in ("NUMBER", "VAR"):
+            if len(node.children) != 1:
+                return None
+            (numbers if node.symbol.text == "NUMBER" else variables).append(node.children[0].symbol.text)
+        stack.extend(reversed(node.children))
+    if len(numbers) != 4 or len(variables) != 2:
+        return None
+    try:
+        params = tuple(int(n) for n in numbers) + tuple(int(v[-1]) - 1 for v in variables)
+    except ValueError:
+        return None
+    # The symbol names alone do not pin the template down, so confirm the rendering.
+    return params if render_phenotype(params) == tree.string() else None
+
+
+def sma(values, n):
+    """Same computation as backtesting.test.SMA, so both share "SMA" entries of an IndicatorCache."""
+    return pd.Series(values).rolling(n).mean()
+
+
+def sma_table(close, windows):
+    """{n: SMA(close, n)} computed exactly like backtesting.test.SMA."""
+    return {n: sma(close, n).to_numpy() for n in windows}
+
+
+def _annual_trading_days(index):
+    """Mirrors backtesting's annualisation; None for weekly/monthly/yearly bars (not handled here)."""
+    if not isinstance(index, pd.DatetimeIndex):
+        return np.nan
+    period = pd.Series(index[-100:]).diff().dropna().median()
+    if period.days in (7, 31, 365):
+        return None
+    have_weekends = index.dayofweek.to_series().between(5, 6).mean() > 2 / 7 * .6
+    return 365 if have_weekends else 252
+
+
+def _last_bar_of_each_day(index):
+    if not isinstance(index, pd.DatetimeIndex):
+        return np.arange(len(index))
+    days = index.normalize().asi8
+    return np.flatnonzero(np.r_[days[1:] != days[:-1], True])
+
+
+def simulate_equity(open_, close, signals, cash=10000, commission=.002):
+    """Equity curves for a batch of long-only strategies.
+
+    `signals` is a (K, N) boolean array, True where `next()` calls `self.buy()` on that bar.
+    Each signal is filled at the next bar's open; an open trade is first closed there
+    (exclusive orders), then the whole available cash buys a new position.
+    """
+    K, N = signals.shape
+    fills = np.zeros((K, N), dtype=bool)
+    fills[:, 1:] = signals[:, :-1]
+    segment = np.cumsum(fills, axis=1)
+    n_segments = int(segment[:, -1].max(initial=0)) + 1
+
+    seg_cash = np.full((K, n_segments), float(cash))
+    seg_size = np.zeros((K, n_segments))
+    seg_entry = np.zeros((K, n_segments))
+
+    rows, cols = np.nonzero(fills)
+    rank = segment[rows, cols]
+    cash_k = np.full(K, float(cash))
+    size_k = np.zeros(K)
+    entry_k = np.zeros(K)
+    for r in range(1, n_segments):
+        sel = rank == r
+        k, price = rows[sel], open_[cols[sel]]
+        held, entry = size_k[k], entry_k[k]
+        # Close the open trade at this open: cash += pl - commission.
+        c = np.where(held != 0, cash_k[k] + (held * (price - entry) - held * price * commission), cash_k[k])
+        # Size the new order the way _Broker._process_orders does for relative sizes.
+        price_plus_commission = price + (_FULL_EQUITY * price * commission) / _FULL_EQUITY
+        size = np.floor_divide(np.maximum(c, 0) * 1.0 * _FULL_EQUITY, price_plus_commission)
+        size[size * price_plus_commission > np.maximum(c, 0)] = 0
+        c = c - size * price * commission
+        cash_k[k], size_k[k], entry_k[k] = c, size, np.where(size != 0, price, 0.0)
+        seg_cash[k, r], seg_size[k, r], seg_entry[k, r] = cash_k[k], size_k[k], entry_k[k]
+
+    cash_t = np.take_along_axis(seg_cash, segment, axis=1)
+    size_t = np.take_along_axis(seg_size, segment, axis=1)
+    entry_t = np.take_along_axis(seg_entry, segment, axis=1)
+    return cash_t + (close * size_t - size_t * entry_t)
+
+
+def sortino_ratio(equity, index):
+    """Row-wise Sortino ratio of equity curves, as computed by backtesting's compute_stats."""
+    days = _annual_trading_days(index)
+    if days is None:
+        raise ValueError("vectorized Sortino only supports intraday or daily bars")
+    day_equity = equity[:, _last_bar_of_each_day(index)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = day_equity[:, 1:] / day_equity[:, :-1] - 1
+        n = returns.shape[1]
+        growth = np.nan_to_num(returns, nan=0.0) + 1
+        gmean = np.exp(np.log(growth).sum(axis=1) / (n or np.nan)) - 1
+        gmean[(growth <= 0).any(axis=1)] = 0
+        annualized = (1 + gmean) ** days - 1
+        downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2, axis=1)) * np.sqrt(days)
+        return annualized / downside
+
+
+def objective_scores(params_list, data, cash=10000, commission=.002, sma=None, batch_size=256):
+    """trading_objective scores (-Sortino, or the 1000.0 penalty) for many parameter tuples at once."""
+    open_ = data["Open"].to_numpy(dtype=float)
+    close = data["Close"].to_numpy(dtype=float)
+    N = len(close)
+    if sma is None:
+        sma = sma_table(close, {n for p in params_list for n in p[:4]})
+
+    scores = np.empty(len(params_list))
+    for lo in range(0, len(params_list), batch_size):
+        batch = np.asarray(params_list[lo:lo + batch_size], dtype=np.int64)
+        windows = batch[:, :4]
+        rows = np.arange(len(batch))
+        fast = np.stack([sma[n] for n in windows[rows, batch[:, 4]]])
+        slow = np.stack([sma[n] for n in windows[rows, batch[:, 5]]])
+
+        # Indicator warm-up: next() first runs on bar 1 + max(first non-NaN bar of every SMA).
+        warmup = np.where(windows <= N, windows - 1, 0).max(axis=1)
+        start = 1 + warmup
+        with np.errstate(invalid="ignore"):
+            cross = np.zeros_like(fast, dtype=bool)
+            cross[:, 1:] = (fast[:, :-1] < slow[:, :-1]) & (fast[:, 1:] > slow[:, 1:])
+        cross &= np.arange(N) >= start[:, None]
+
+        equity = simulate_equity(open_, close, cross, cash, commission)
+        sortino = sortino_ratio(equity, data.index)
+        with np.errstate(invalid="ignore"):
+            bad = np.isnan(sortino) | (sortino <= 0)
+        scores[lo:lo + len(batch)] = np.where(bad, NO_EDGE_PENALTY, -sortino)
+    return scores
+
+
+class VectorizedEvaluator(SerialEvaluator):
+    """Evaluator that scores SMA-crossover phenotypes in one vectorized batch.
+
+    Meant to stand in for `trading_objective` (with the same cash and commission); any
+    phenotype it cannot interpret is passed to `fallback` with the real objective. SMA
+    series come from `indicators`, shared with the exec'd strategies when they use the
+    same cache and dataset id.
+    """
+
+    def __init__(self, data=None, cash=10000, commission=.002, fallback=None, batch_size=256,
+                 penalty=2000.0, indicators=None, dataset=None):
+        super().__init__(penalty)
+        if data is None:
+            from backtesting.test import GOOG as data
+        self.data = data
+        self.cash = cash
+        self.commission = commission
+        self.batch_size = batch_size
+        self.fallback = fallback or SerialEvaluator(penalty)
+        self.indicators = indicators if indicators is not None else IndicatorCache()
+        self.dataset = dataset if dataset is not None else dataset_id(data)
+
+    def _bound_data(self, objective):
+        """(bars to simulate, SMA lookup): `self.data`, or the slice of it `objective` is bound to.
+
+        SuccessiveHalvingEvaluator passes `functools.partial(objective, data=prefix)` and
+        WalkForwardEvaluator binds each fold the same way. Rolling means are causal, so a
+        prefix's SMA is a view of the full SMA; any other slice gets its own cache entries,
+        computed on the slice alone as a backtest of it would, and reused for every batch.
+        """
+        data = getattr(objective, "keywords", {}).get("data")
+        if data is None or data is self.data:
+            data, bounds = self.data, (0, len(self.data))
+        else:
+            bounds = slice_bounds(self.data, data)
+            if bounds is None:
+                raise ValueError("VectorizedEvaluator can only score contiguous slices of its own data")
+        start, end = bounds
+        if start == 0:
+            return data, lambda n: self.indicators.get("SMA", sma, self.data, "Close", n, dataset=self.dataset)[:end]
+        dataset = slice_id(self.dataset, start, end)
+        return data, lambda n: self.indicators.get("SMA", sma, data, "Close", n, dataset=dataset)
+
+    def evaluate(self, objective, phenotypes):
+        return [score for score, _ in self.evaluate_fidelity(objective, phenotypes)]
+
+    def evaluate_fidelity(self, objective, phenotypes):
+        """[(score, fidelity)] in input order; the fallback's crashes and timeouts keep its fidelity."""
+        phenotypes = list(phenotypes)
+        params = [params_from_phenotype(p) for p in phenotypes]
+        fast = [i for i, p in enumerate(params) if p is not None]
+        slow = [i for i, p in enumerate(params) if p is None]
+
+        results = [None] * len(phenotypes)
+        if fast:
+            data, lookup = self._bound_data(objective)
+            table = {n: lookup(n) for n in {n for i in fast for n in params[i][:4]}}
+            fast_scores = objective_scores([params[i] for i in fast], data, self.cash,
+                                           self.commission, table, self.batch_size)
+            for i, score in zip(fast, fast_scores):
+                results[i] = (float(score), 1.0)
+        if slow:
+            for i, result in zip(slow, self.fallback.evaluate_fidelity(objective, [phenotypes[i] for i in slow])):
+                results[i] = result
+        return results
+
+    def close(self):
+        self.fallback.close()